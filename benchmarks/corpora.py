@@ -0,0 +1,215 @@
+# *********************************************************************************************
+# Copyright (C) 2017 Joel Becker,  Jillian Anderson, Steve McColl and Dr. John McLevey
+#
+# This file is part of the tidyextractors package developed for Dr John McLevey's Networks Lab
+# at the University of Waterloo. For more information, see
+# http://tidyextractors.readthedocs.io/en/latest/
+#
+# tidyextractors is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# tidyextractors is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with tidyextractors.
+# If not, see <http://www.gnu.org/licenses/>.
+# *********************************************************************************************
+
+import os
+import zlib
+import random
+import datetime
+import subprocess
+from email.utils import formatdate
+
+# Synthetic corpora for benchmarking. Every generator takes a seed, so the same
+#   parameters always produce the same corpus and results can be compared between versions.
+
+words = ['network', 'data', 'tidy', 'frame', 'commit', 'merge', 'review', 'patch', 'release',
+         'thread', 'reply', 'list', 'change', 'test', 'fix', 'update', 'docs', 'build', 'query',
+         'graph', 'author', 'message', 'archive', 'module', 'version', 'index', 'cache', 'lab']
+
+# Start of the synthetic timeline (2017-01-01 UTC), in seconds since the epoch.
+start_time = 1483228800
+
+
+def utc_datetime(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+
+
+def sentence(rng, length):
+    return ' '.join(rng.choice(words) for _ in range(length))
+
+
+def people(count, domain):
+    """
+    Makes a list of synthetic (name, email) pairs.
+    :param count: Number of people.
+    :param domain: Email domain.
+    :return: A list of tuples.
+    """
+    return [('Person {}'.format(i), 'person{}@{}'.format(i, domain)) for i in range(count)]
+
+
+def fast_import_data(data):
+    encoded = data.encode('utf-8')
+    return 'data {}\n'.format(len(encoded)).encode('utf-8') + encoded + b'\n'
+
+
+def generate_git_repo(path, commits=1000, authors=20, files=200, files_per_commit=3, seed=0):
+    """
+    Creates a git repository with a linear history of synthetic commits, using git fast-import.
+    :param path: Directory to create the repository in. Must not exist yet.
+    :param commits: Number of commits.
+    :param authors: Number of distinct authors.
+    :param files: Number of distinct file paths.
+    :param files_per_commit: Maximum number of files changed by each commit.
+    :param seed: Random seed.
+    :return: path
+    """
+    rng = random.Random(seed)
+    authors = people(authors, 'example.com')
+    paths = ['src/module{}/file{}.py'.format(i % 10, i) for i in range(files)]
+    contents = {}
+
+    stream = []
+    for i in range(commits):
+        name, email = rng.choice(authors)
+        timestamp = start_time + i * 3600
+        stream.append('commit refs/heads/master\nmark :{}\n'.format(i + 1).encode('utf-8'))
+        stream.append('author {} <{}> {} +0000\n'.format(name, email, timestamp).encode('utf-8'))
+        stream.append('committer {} <{}> {} +0000\n'.format(name, email, timestamp).encode('utf-8'))
+        stream.append(fast_import_data(sentence(rng, 6)))
+        if i > 0:
+            stream.append('from :{}\n'.format(i).encode('utf-8'))
+        for file_path in rng.sample(paths, rng.randint(1, files_per_commit)):
+            lines = contents.setdefault(file_path, [])
+            lines.append(sentence(rng, 8))
+            if len(lines) > 3 and rng.random() < 0.3:
+                del lines[rng.randrange(len(lines))]
+            stream.append('M 100644 inline {}\n'.format(file_path).encode('utf-8'))
+            stream.append(fast_import_data('\n'.join(lines) + '\n'))
+        stream.append(b'\n')
+
+    os.makedirs(path)
+    subprocess.check_call(['git', 'init', '-q', path])
+    subprocess.run(['git', 'fast-import', '--quiet'], cwd=path, input=b''.join(stream), check=True)
+    subprocess.check_call(['git', 'symbolic-ref', 'HEAD', 'refs/heads/master'], cwd=path)
+    return path
+
+
+def generate_mbox(path, messages=10000, addresses=200, body_lines=20, reply_rate=0.5, seed=0):
+    """
+    Writes an mbox file of synthetic mailing list messages.
+    :param path: File path. The name must end in "mbox" for MboxExtractor to find it.
+    :param messages: Number of messages.
+    :param addresses: Number of distinct email addresses.
+    :param body_lines: Number of lines in each message body.
+    :param reply_rate: Fraction of messages that reply to an earlier message.
+    :param seed: Random seed.
+    :return: path
+    """
+    rng = random.Random(seed)
+    senders = people(addresses, 'example.org')
+
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        for i in range(messages):
+            name, email = rng.choice(senders)
+            timestamp = start_time + i * 600
+            to = rng.sample(senders, rng.randint(1, 3))
+            cc = rng.sample(senders, rng.randint(0, 2))
+            f.write('From {} {}\n'.format(
+                email, utc_datetime(timestamp).strftime('%a %b %d %H:%M:%S %Y')))
+            f.write('From: {} <{}>\n'.format(name, email))
+            f.write('To: {}\n'.format(', '.join('{} <{}>'.format(n, e) for n, e in to)))
+            if cc:
+                f.write('Cc: {}\n'.format(', '.join('{} <{}>'.format(n, e) for n, e in cc)))
+            f.write('Date: {}\n'.format(formatdate(timestamp)))
+            f.write('Subject: {}\n'.format(sentence(rng, 5)))
+            f.write('Message-ID: <{}@example.org>\n'.format(i))
+            if i > 0 and rng.random() < reply_rate:
+                f.write('In-Reply-To: <{}@example.org>\n'.format(rng.randrange(i)))
+            f.write('\n')
+            for _ in range(body_lines):
+                f.write(sentence(rng, 10))
+                f.write('\n')
+            f.write('\n')
+    return path
+
+
+class FakeTwitterObject(object):
+    """
+    A plain object with the given attributes, standing in for tweepy's models.
+    """
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+class FakeTwitterAPI(object):
+    """
+    A stand-in for ``tweepy.API`` which serves synthetic users and timelines from memory,
+    so TwitterExtractor can be benchmarked without network access or credentials.
+    Pass it to TwitterExtractor with the ``api`` keyword argument.
+
+    :param int tweets_per_user: Number of tweets in each user's timeline.
+    :param float retweet_rate: Fraction of tweets that are retweets.
+    :param int seed: Random seed.
+    """
+
+    def __init__(self, tweets_per_user=500, retweet_rate=0.2, seed=0):
+        self.tweets_per_user = tweets_per_user
+        self.retweet_rate = retweet_rate
+        self.seed = seed
+        self._timelines = {}
+
+    def _user_number(self, screen_name):
+        return zlib.crc32(screen_name.encode('utf-8')) % 10 ** 6
+
+    def get_user(self, screen_name=None, **kwargs):
+        number = self._user_number(screen_name)
+        return FakeTwitterObject(
+            id=number,
+            id_str=str(number),
+            screen_name=screen_name,
+            name=screen_name.title(),
+            description=sentence(random.Random(number), 8),
+            created_at=datetime.datetime(2010, 1, 1),
+            lang='en',
+            location='Waterloo, ON',
+            protected=False,
+            verified=False,
+            time_zone=None,
+            utc_offset=None,
+            followers_count=number % 1000,
+            friends_count=number % 500,
+            favourites_count=number % 300,
+            listed_count=number % 50,
+            statuses_count=self.tweets_per_user)
+
+    def _timeline(self, screen_name):
+        if screen_name not in self._timelines:
+            rng = random.Random('{}-{}'.format(self.seed, screen_name))
+            base_id = self._user_number(screen_name) * 10 ** 7
+            tweets = []
+            for i in range(self.tweets_per_user, 0, -1):
+                text = sentence(rng, 12)
+                if rng.random() < self.retweet_rate:
+                    text = 'RT @user{} : {}'.format(rng.randrange(100), text)
+                tweets.append(FakeTwitterObject(
+                    id=base_id + i,
+                    id_str=str(base_id + i),
+                    created_at=utc_datetime(start_time + i * 60),
+                    text=text))
+            self._timelines[screen_name] = tweets
+        return self._timelines[screen_name]
+
+    def user_timeline(self, screen_name=None, count=20, max_id=None, **kwargs):
+        tweets = self._timeline(screen_name)
+        start = 0
+        if max_id is not None and len(tweets) > 0:
+            # Ids are consecutive and in descending order.
+            start = max(0, tweets[0].id - max_id)
+        return tweets[start:start + count]
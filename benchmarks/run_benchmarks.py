@@ -0,0 +1,226 @@
+# *********************************************************************************************
+# Copyright (C) 2017 Joel Becker,  Jillian Anderson, Steve McColl and Dr. John McLevey
+#
+# This file is part of the tidyextractors package developed for Dr John McLevey's Networks Lab
+# at the University of Waterloo. For more information, see
+# http://tidyextractors.readthedocs.io/en/latest/
+#
+# tidyextractors is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# tidyextractors is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with tidyextractors.
+# If not, see <http://www.gnu.org/licenses/>.
+# *********************************************************************************************
+
+"""
+Times the extractors on synthetic corpora and reports rows/sec and peak memory as JSON.
+
+Usage:
+
+    python benchmarks/run_benchmarks.py --scale small --output results.json
+    python benchmarks/run_benchmarks.py --scale small --compare results.json
+
+Each benchmark is run ``--repeat`` times and the fastest run is reported. Peak memory is
+measured in a separate run with tracemalloc (which slows code down), unless ``--no-memory``
+is given. With ``--compare``, the results are also compared to an earlier results file.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+
+# Keep progress bars out of the timings and the output.
+os.environ.setdefault('TQDM_DISABLE', '1')
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+import numpy as np
+import pandas as pd
+import tidyextractors as tx
+from corpora import generate_git_repo, generate_mbox, FakeTwitterAPI
+
+# Corpus sizes for each scale.
+scales = {
+    'small': {'commits': 500, 'messages': 2000, 'users': 5, 'tweets_per_user': 400},
+    'medium': {'commits': 5000, 'messages': 20000, 'users': 20, 'tweets_per_user': 1000},
+    'large': {'commits': 50000, 'messages': 200000, 'users': 50, 'tweets_per_user': 3200},
+}
+
+
+def time_import(module):
+    """
+    Imports a module in a fresh interpreter. Timings include interpreter startup,
+    which is what short-lived worker processes pay.
+    :param module: Module name, or None to time interpreter startup alone.
+    :return: 1 (one import)
+    """
+    code = 'pass' if module is None else 'import {}'.format(module)
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(here))
+    subprocess.check_call([sys.executable, '-c', code], env=env)
+    return 1
+
+
+def make_benchmarks(workdir, sizes):
+    """
+    Generates the corpora and defines the benchmarks.
+    :param workdir: Directory for generated corpora.
+    :param sizes: A dictionary of corpus sizes (see ``scales``).
+    :return: A list of (name, function) tuples. Each function returns the number of rows it produced.
+    """
+    git_path = generate_git_repo(os.path.join(workdir, 'git'), commits=sizes['commits'])
+    mbox_dir = os.path.join(workdir, 'mbox')
+    os.makedirs(mbox_dir)
+    generate_mbox(os.path.join(mbox_dir, 'list.mbox'), messages=sizes['messages'])
+    api = FakeTwitterAPI(tweets_per_user=sizes['tweets_per_user'])
+    users = ['user{}'.format(i) for i in range(sizes['users'])]
+
+    # Extractors reused by the reshaping benchmarks. Created lazily so that
+    #   a failing extractor only fails the benchmarks that need it.
+    cache = {}
+
+    def git_extractor():
+        if 'git' not in cache:
+            cache['git'] = tx.tidygit.GitExtractor(git_path)
+        return cache['git']
+
+    def mbox_extractor():
+        if 'mbox' not in cache:
+            cache['mbox'] = tx.tidymbox.MboxExtractor(mbox_dir)
+        return cache['mbox']
+
+    def twitter_extract():
+        extractor = tx.tidytwitter.TwitterExtractor(users, api=api)
+        return int(sum(len(tweets) for tweets in extractor.raw()['tweets']))
+
+    return [
+        ('python_startup', lambda: time_import(None)),
+        ('import_package', lambda: time_import('tidyextractors')),
+        ('import_tidymbox', lambda: time_import('tidyextractors.tidymbox')),
+        ('import_tidygit', lambda: time_import('tidyextractors.tidygit')),
+        ('import_tidytwitter', lambda: time_import('tidyextractors.tidytwitter')),
+        ('git_extract', lambda: len(tx.tidygit.GitExtractor(git_path))),
+        ('git_changes', lambda: len(git_extractor().changes())),
+        ('mbox_extract', lambda: len(tx.tidymbox.MboxExtractor(mbox_dir))),
+        ('twitter_extract', twitter_extract),
+        ('expand_on', lambda: len(mbox_extractor().expand_on('From', 'To', rename1='From', rename2='Recipient'))),
+        ('drop_collections', lambda: len(git_extractor()._drop_collections(git_extractor().raw()))),
+    ]
+
+
+def run_benchmark(name, func, repeat, memory):
+    """
+    Times a benchmark function.
+    :param name: Benchmark name.
+    :param func: A function returning the number of rows it produced.
+    :param repeat: Number of timed runs.
+    :param memory: If True, peak memory is measured in an extra run.
+    :return: A result dictionary.
+    """
+    result = {'name': name}
+    try:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = func()
+            times.append(time.perf_counter() - start)
+        seconds = min(times)
+        result.update({'rows': rows,
+                       'seconds': seconds,
+                       'rows_per_sec': rows / seconds if seconds > 0 else None})
+        if memory:
+            tracemalloc.start()
+            try:
+                func()
+                result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+    except Exception as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    return result
+
+
+def metadata(sizes):
+    try:
+        revision = subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=here,
+                                           stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {'revision': revision,
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'sizes': sizes}
+
+
+def compare(results, baseline):
+    """
+    Prints rows/sec and peak memory relative to an earlier results file.
+    :param results: A results dictionary.
+    :param baseline: A results dictionary from an earlier run.
+    :return: None
+    """
+    before = {r['name']: r for r in baseline['results']}
+    print('{:<20} {:>14} {:>14} {:>9} {:>9}'.format('benchmark', 'rows/sec', 'baseline', 'speed', 'memory'))
+    for r in results['results']:
+        b = before.get(r['name'], {})
+        if r.get('rows_per_sec') is None or b.get('rows_per_sec') is None:
+            print('{:<20} {:>14}'.format(r['name'], r.get('error', 'n/a')[:40]))
+            continue
+        memory = ''
+        if r.get('peak_memory_bytes') and b.get('peak_memory_bytes'):
+            memory = '{:.2f}x'.format(r['peak_memory_bytes'] / b['peak_memory_bytes'])
+        print('{:<20} {:>14.1f} {:>14.1f} {:>8.2f}x {:>9}'.format(
+            r['name'], r['rows_per_sec'], b['rows_per_sec'], r['rows_per_sec'] / b['rows_per_sec'], memory))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark tidyextractors on synthetic corpora.')
+    parser.add_argument('--scale', choices=sorted(scales), default='small')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per benchmark.')
+    parser.add_argument('--only', nargs='+', help='Names of benchmarks to run.')
+    parser.add_argument('--no-memory', action='store_true', help='Skip peak memory measurement.')
+    parser.add_argument('--output', help='Write results to this JSON file instead of standard output.')
+    parser.add_argument('--compare', help='An earlier results file to compare against.')
+    args = parser.parse_args(argv)
+
+    sizes = scales[args.scale]
+    workdir = tempfile.mkdtemp(prefix='tidyextractors-bench-')
+    try:
+        benchmarks = make_benchmarks(workdir, sizes)
+        results = {'meta': metadata(sizes), 'results': []}
+        for name, func in benchmarks:
+            if args.only and name not in args.only:
+                continue
+            results['results'].append(run_benchmark(name, func, args.repeat, not args.no_memory))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    elif not args.compare:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
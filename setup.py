@@ -86,7 +86,9 @@ setup(
 
         # Indicate who your project is intended for
         'License :: OSI Approved :: GNU General Public License v3 (GPLv3)',
-        'Programming Language :: Python :: 3.4',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
         'Intended Audience :: Science/Research',
         'Topic :: Scientific/Engineering :: Information Analysis',
         'Topic :: Scientific/Engineering :: Mathematics',
@@ -102,6 +104,9 @@ setup(
     # simple. Or you can use find_packages().
     packages=find_packages(),
 
+    # Lazy module attributes (PEP 562) need Python 3.7 or later.
+    python_requires='>=3.7',
+
     # Alternatively, if you want to distribute just a my_module.py, uncomment
     # this:
     #   py_modules=["my_module"],
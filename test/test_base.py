@@ -17,7 +17,12 @@
 # If not, see <http://www.gnu.org/licenses/>.
 # *********************************************************************************************
 
+import os
+import sys
+import shutil
+import tempfile
 import unittest
+import subprocess
 import pandas as pd
 import tidyextractors as tx
 
@@ -33,6 +38,48 @@ class TestBaseExtractor(unittest.TestCase):
     def test_raw(self):
         self.assertEqual(isinstance(self.basex.raw(), pd.DataFrame), True)
 
+    def test_metrics(self):
+        records = []
+        temp_dir = tempfile.mkdtemp()
+        try:
+            prom_path = os.path.join(temp_dir, 'extract.prom')
+            metrics = tx.Metrics([tx.Callback(records.append), tx.PrometheusTextFile(prom_path, labels={'job': 'test'})])
+            basex = tx.BaseExtractor('', metrics=metrics)
+            basex._data = pd.DataFrame({'a': [1, 2, 3], 'b': [['x', 'y'], ['z'], []]})
+            expanded = basex.expand_on('a', 'b')
+            self.assertEqual(len(expanded), 3)
+            self.assertEqual([r['stage'] for r in records], ['expand_on'])
+            self.assertEqual(records[0]['items'], 3)
+            self.assertEqual(metrics.totals()['expand_on']['items'], 3)
+            with open(prom_path) as f:
+                prom = f.read()
+            self.assertIn('tidyextractors_stage_items{job="test",stage="expand_on"} 3', prom)
+            self.assertIn('# TYPE tidyextractors_stage_seconds gauge', prom)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_positional_arguments(self):
+        # Arguments after auto_extract go to _extract, as they did before metrics and backend were added
+        class ArgsExtractor(tx.BaseExtractor):
+            def _extract(self, source, *args, **kwargs):
+                self._data = pd.DataFrame()
+                self.extract_args = args
+        check = ArgsExtractor('', True, 'arrow', False)
+        self.assertEqual(check.extract_args, ('arrow', False))
+        self.assertEqual(isinstance(check.metrics, tx.Metrics), True)
+        self.assertEqual(check.backend, 'pandas')
+
+
+    def test_lazy_import(self):
+        # Importing the package, or one extractor, must not load the others' dependencies.
+        check = 'import sys, {}; print(" ".join(m for m in {} if m in sys.modules))'
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(tx.__file__))))
+        for module, unwanted in [('tidyextractors', ['git', 'tweepy', 'nltk', 'pandas', 'numpy', 'tqdm']),
+                                 ('tidyextractors.tidymbox', ['git', 'tweepy', 'nltk']),
+                                 ('tidyextractors.tidygit', ['tweepy', 'nltk'])]:
+            loaded = subprocess.check_output([sys.executable, '-c', check.format(module, unwanted)], env=env)
+            self.assertEqual(loaded.decode('utf-8').strip(), '', module)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -18,6 +18,10 @@
 # *********************************************************************************************
 
 import os
+import shutil
+import contextlib
+import importlib.util
+import tempfile
 import unittest
 import subprocess as sub
 import pandas as pd
@@ -25,18 +29,44 @@ import tidyextractors as tx
 import tidyextractors.tidygit as tg
 
 
+@contextlib.contextmanager
+def git_repo():
+    """
+    Makes the test repository readable for the duration of a with block, by giving its
+    git directory its usual name.
+    :return: The repository path.
+    """
+    os.rename(os.path.join('.', 'git_data', 'git/'), os.path.join('.', 'git_data', '.git/'))
+    try:
+        yield os.path.join('.', 'git_data')
+    finally:
+        os.rename(os.path.join('.', 'git_data', '.git/'), os.path.join('.', 'git_data', 'git/'))
+
+
 class TestGitExtractor(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Extractors shared by several tests are built once
+        cls.cache_dir = tempfile.mkdtemp()
+        with git_repo() as path:
+            cls.gx = tg.GitExtractor(path)
+            cls.gx_all_refs = tg.GitExtractor(path, all_refs=True)
+            cls.gx_detailed = tg.GitExtractor(path, detailed_changes=True, cache_dir=cls.cache_dir)
+            cls.gx_encoded = tg.GitExtractor(path, encode=True, activity_window=86400)
+        cls.changes_df = pd.read_csv(os.path.join('.', 'git_data', 'git_changes_test.csv'))
+        cls.commits_df = pd.read_csv(os.path.join('.', 'git_data', 'git_commits_test.csv'))
+        cls.raw_df = pd.read_csv(os.path.join('.', 'git_data', 'git_raw_test.csv'))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.cache_dir, ignore_errors=True)
+
     def setUp(self):
-        os.rename(os.path.join('.', 'git_data', 'git/'), os.path.join('.', 'git_data', '.git/'))
-        try:
-            self.gx = tg.GitExtractor(os.path.join('.', 'git_data'))
-            self.changes_df = pd.read_csv(os.path.join('.', 'git_data', 'git_changes_test.csv'))
-            self.commits_df = pd.read_csv(os.path.join('.', 'git_data', 'git_commits_test.csv'))
-            self.raw_df = pd.read_csv(os.path.join('.', 'git_data', 'git_raw_test.csv'))
-            os.rename(os.path.join('.', 'git_data', '.git/'), os.path.join('.', 'git_data', 'git/'))
-        except:
-            os.rename(os.path.join('.', 'git_data', '.git/'), os.path.join('.', 'git_data', 'git/'))
-            raise
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
 
     def test_construction(self):
         self.assertEqual(isinstance(self.gx, tx.BaseExtractor), True)
@@ -45,21 +75,217 @@ class TestGitExtractor(unittest.TestCase):
     def test_raw(self):
         check_df = self.gx.raw(drop_collections=False)
         expect_df = self.raw_df
-        self.assertEqual(set(check_df.columns), set(expect_df.columns))
+        # Parent shas are recorded in every extraction
+        self.assertEqual(set(check_df.columns), set(expect_df.columns).union({'parents'}))
         self.assertEqual(set(check_df['hexsha']), set(expect_df['hexsha']))
 
     def test_commits(self):
         check_df = self.gx.commits(drop_collections=False)
         expect_df = self.commits_df
-        self.assertEqual(set(check_df.columns), set(expect_df.columns))
+        self.assertEqual(set(check_df.columns), set(expect_df.columns).union({'parents'}))
         self.assertEqual(set(check_df['hexsha']), set(expect_df['hexsha']))
 
     def test_changes(self):
         check_df = self.gx.changes()
         expect_df = self.changes_df
-        self.assertEqual(set(check_df.columns), set(expect_df.columns))
+        self.assertEqual(set(check_df.columns), set(expect_df.columns).union({'parents'}))
         self.assertEqual(set(check_df['hexsha']), set(expect_df['hexsha']))
 
+    def test_changes_batched(self):
+        with git_repo() as path:
+            check_df = tg.GitExtractor(path, workers=2, batch_size=5).changes()
+        expect_df = self.gx.changes()
+        self.assertEqual(set(check_df.columns), set(expect_df.columns))
+        self.assertEqual(len(check_df), len(expect_df))
+        self.assertEqual(list(check_df['changes/lines']), list(expect_df['changes/lines']))
+
+    def test_detailed_changes(self):
+        check_df = self.gx_detailed.changes()
+        detail_cols = {'changes/old_path', 'changes/new_path', 'changes/change_type',
+                       'changes/old_blob', 'changes/new_blob'}
+        self.assertEqual(set(check_df.columns), set(self.changes_df.columns).union(detail_cols, {'parents'}))
+        self.assertEqual(set(check_df['changes/change_type']).issubset(set('ACDMRT')), True)
+        added = check_df[check_df['changes/change_type'] == 'A']
+        self.assertEqual(added['changes/old_path'].isnull().all(), True)
+
+    def test_diff_cache(self):
+        cached = [f for dirpath, dirnames, files in os.walk(self.cache_dir) for f in files]
+        self.assertEqual(len(cached), len(self.gx_detailed))
+
+    def test_all_refs(self):
+        check_df = self.gx_all_refs.commits(drop_collections=False)
+        self.assertEqual(set(check_df.columns), set(self.commits_df.columns).union({'parents', 'refs'}))
+        self.assertEqual(set(check_df['hexsha']), set(self.commits_df['hexsha']))
+        self.assertEqual(self.gx_all_refs.ref_names, ['master'])
+        self.assertEqual(len(self.gx_all_refs.commits(ref='master')), len(check_df))
+        roots = check_df[check_df['parents'].map(len) == 0]
+        self.assertEqual(len(roots), 1)
+
+    @unittest.skipIf(importlib.util.find_spec('scipy') is None, 'SciPy is not installed')
+    def test_author_file_graph(self):
+        matrix, authors, files = self.gx.author_file_graph()
+        self.assertEqual(matrix.shape, (len(authors), len(files)))
+        self.assertEqual(matrix.sum(), len(self.gx.changes()))
+        matrix, authors, files = self.gx.author_file_graph(weight='lines')
+        self.assertEqual(matrix.sum(), self.gx.changes()['changes/lines'].sum())
+
+    @unittest.skipIf(importlib.util.find_spec('scipy') is None, 'SciPy is not installed')
+    def test_commit_graph(self):
+        matrix, shas = self.gx_all_refs.commit_graph()
+        self.assertEqual(matrix.shape, (len(shas), len(shas)))
+        self.assertEqual(matrix.sum(), self.gx_all_refs.raw()['parents'].map(len).sum())
+
+        # Parents are also recorded when only HEAD is walked
+        head_matrix, head_shas = self.gx.commit_graph()
+        self.assertEqual(head_shas, list(self.gx.commits()['hexsha']))
+        self.assertEqual(head_matrix.sum(), self.gx.raw()['parents'].map(len).sum())
+        self.assertEqual(head_matrix.sum(), len(head_shas) - 1)
+
+
+    def test_metrics(self):
+        records = []
+        with git_repo() as path:
+            tg.GitExtractor(path, metrics=tx.Metrics([tx.Callback(records.append)]))
+        stages = {r['stage']: r for r in records}
+        self.assertEqual(stages['git_walk']['items'], len(self.commits_df))
+        self.assertEqual(stages['git_numstat']['items'], len(self.commits_df))
+        self.assertGreater(stages['git_numstat']['calls'], 0)
+        self.assertGreater(stages['git_numstat']['bytes'], 0)
+
+
+    @unittest.skipIf(importlib.util.find_spec('pyarrow') is None, 'pyarrow is not installed')
+    def test_arrow_backend(self):
+        import pyarrow as pa
+        with git_repo() as path:
+            gx_arrow = tg.GitExtractor(path, backend='arrow')
+        raw = gx_arrow.raw()
+        self.assertTrue(isinstance(raw, pa.Table))
+        self.assertTrue(pa.types.is_list(raw.schema.field('changes').type))
+        check = gx_arrow.changes()
+        expect = self.gx.changes()
+        self.assertEqual(set(check.column_names), set(expect.columns))
+        self.assertEqual(sorted(zip(check.column('hexsha').to_pylist(), check.column('file').to_pylist(),
+                                    check.column('changes/lines').to_pylist())),
+                         sorted(zip(expect['hexsha'], expect['file'], expect['changes/lines'])))
+        self.assertEqual(set(gx_arrow.commits().column_names), set(self.gx.commits().columns))
+
+
+    def test_changes_chunked(self):
+        expect_df = self.gx.changes()
+        blocks = list(self.gx.changes(chunk_size=10))
+        self.assertEqual(len(blocks), (len(self.gx) + 9) // 10)
+        check_df = pd.concat(blocks, ignore_index=True)
+        self.assertEqual(set(check_df.columns), set(expect_df.columns))
+        self.assertEqual(list(check_df['file']), list(expect_df['file']))
+        self.assertEqual(list(check_df['changes/lines']), list(expect_df['changes/lines']))
+
+    @unittest.skipIf(importlib.util.find_spec('pyarrow') is None, 'pyarrow is not installed')
+    def test_write_parquet(self):
+        import pyarrow.parquet as pq
+        paths = tx.write_parquet(self.gx.changes(chunk_size=25), os.path.join(self.temp_dir, 'changes'))
+        self.assertEqual(len(paths), (len(self.gx) + 24) // 25)
+        table = pq.read_table(os.path.join(self.temp_dir, 'changes'))
+        self.assertEqual(table.num_rows, len(self.gx.changes()))
+        with git_repo() as path:
+            gx_arrow = tg.GitExtractor(path, backend='arrow')
+        arrow_rows = sum(t.num_rows for t in gx_arrow.changes(chunk_size=25))
+        self.assertEqual(arrow_rows, table.num_rows)
+
+        # Blocks whose columns are all None are written with the types of the other blocks
+        blocks = list(self.gx_detailed.changes(chunk_size=1))[::-1]
+        paths = tx.write_parquet(blocks, os.path.join(self.temp_dir, 'detailed'))
+        self.assertEqual(len(set(str(pq.read_schema(p)) for p in paths)), 1)
+        table = pq.read_table(os.path.join(self.temp_dir, 'detailed'))
+        self.assertEqual(table.num_rows, sum(len(b) for b in blocks))
+        self.assertEqual(sorted(table.column('changes/old_path').drop_null().to_pylist()),
+                         sorted(pd.concat(blocks)['changes/old_path'].dropna()))
+
+
+    def test_path_index(self):
+        changes_df = self.gx.changes()
+        path = changes_df['file'].value_counts().index[0]
+        expect_shas = set(changes_df[changes_df['file'] == path]['hexsha'])
+        self.assertEqual(set(self.gx.file_history(path)['hexsha']), expect_shas)
+
+        # Co-changes count shared commits
+        co_df = self.gx.co_changes(path)
+        other = co_df['file'].iloc[0]
+        other_shas = set(changes_df[changes_df['file'] == other]['hexsha'])
+        self.assertEqual(co_df['commits'].iloc[0], len(expect_shas & other_shas))
+        self.assertNotIn(path, set(co_df['file']))
+
+        owners_df = self.gx.file_owners(path)
+        self.assertEqual(owners_df['commits'].sum(), len(expect_shas))
+
+        # Round trip through a file
+        index_path = os.path.join(self.temp_dir, 'paths.npz')
+        self.gx.path_index().save(index_path)
+        loaded = tg.PathIndex.load(index_path)
+        self.assertEqual(loaded.paths, self.gx.path_index().paths)
+        self.assertEqual(set(loaded.shas[r] for r in loaded.commits_of(path)), expect_shas)
+        self.assertEqual(len(self.gx.file_history('no/such/file')), 0)
+
+    def test_encoded(self):
+        coded_df = self.gx_encoded.changes()
+        self.assertEqual(str(coded_df['file'].dtype).startswith('int'), True)
+        check_df = self.gx_encoded.changes(decode=True)
+        expect_df = self.gx.changes()
+        self.assertEqual(list(check_df['file']), list(expect_df['file']))
+        self.assertEqual(list(check_df['author_email']), list(expect_df['author_email']))
+        self.assertEqual(set(self.gx_encoded.labels('author_name')), set(expect_df['author_name']))
+        self.assertEqual(list(self.gx_encoded.commits(decode=True)['author_name']),
+                         list(self.gx.commits()['author_name']))
+        path = expect_df['file'].iloc[0]
+        self.assertEqual(list(self.gx_encoded.file_history(path)['hexsha']), list(self.gx.file_history(path)['hexsha']))
+        self.assertRaises(ValueError, self.gx.labels, 'file')
+
+    def test_shas_and_times(self):
+        commits_df = self.gx.commits()
+        self.assertEqual(self.gx.sha_length, 7)
+        full = self.gx.full_shas(commits_df['hexsha'])
+        self.assertEqual([s[:7] for s in full], list(commits_df['hexsha']))
+        self.assertEqual(all(len(s) == 40 for s in full), True)
+        self.assertEqual(list(self.gx.sha_index().rows(full)), list(range(len(full))))
+        self.assertEqual(self.gx.full_shas(['0000000']), [None])
+
+        self.assertEqual(isinstance(commits_df['authored_datetime'].dtype, pd.DatetimeTZDtype), True)
+        expect = pd.to_datetime(self.commits_df['authored_datetime'], utc=True)
+        self.assertEqual(set(commits_df['authored_datetime']), set(expect))
+        cutoff = commits_df['authored_date'].median()
+        self.assertEqual(len(self.gx.commits(since=cutoff)) + len(self.gx.commits(until=cutoff)), len(commits_df))
+
+    def test_identity(self):
+        commits_df = self.gx.commits()
+        email = commits_df['author_email'].iloc[0]
+        mailmap = os.path.join(self.temp_dir, '.mailmap')
+        with open(mailmap, 'w') as f:
+            f.write('Joel Becker <joel@example.com> <{}>\n'.format(email))
+        resolver = tx.IdentityResolver(mailmap=mailmap)
+        resolver.add_extractor(self.gx_encoded)
+        check_df = self.gx_encoded.identify(self.gx_encoded.commits(), resolver)
+        expect_df = self.gx.identify(commits_df, resolver)
+        self.assertEqual(list(check_df['person_id']), list(expect_df['person_id']))
+        self.assertEqual(resolver.person_id(email='Joel@Example.com'), expect_df['person_id'].iloc[0])
+
+    def test_activity(self):
+        commits_df = self.gx.commits()
+        check_df = self.gx.activity()
+        self.assertEqual(set(check_df.columns), {'author_email', 'window', 'commits', 'lines', 'insertions',
+                                                 'deletions', 'files'})
+        self.assertEqual(check_df['commits'].sum(), len(commits_df))
+        self.assertEqual(check_df['lines'].sum(), commits_df['total_lines'].sum())
+        self.assertEqual(set(check_df['window'].dt.dayofweek), {0})
+
+        # Aggregated during extraction, or from integer-coded authors
+        expect_df = self.gx.activity(window=86400, by='author_name')
+        self.assertEqual(self.gx_encoded.activity(window=86400).equals(self.gx.activity(window=86400)), True)
+        self.assertEqual(self.gx_encoded.activity(window=86400, by='author_name').equals(expect_df), True)
+
+        # Aggregated without extraction
+        with git_repo() as path:
+            streamed_df = tg.GitExtractor.activity_from(path, window=86400, by='author_name', workers=2, batch_size=3)
+        self.assertEqual(streamed_df.equals(expect_df), True)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -18,7 +18,13 @@
 # *********************************************************************************************
 
 import os
+import gzip
+import lzma
+import shutil
+import mailbox
+import tempfile
 import unittest
+import importlib.util
 import pandas as pd
 import tidyextractors as tx
 import tidyextractors.tidymbox as tm
@@ -54,6 +60,282 @@ class TestMboxExtractor(unittest.TestCase):
         self.assertEqual(set(check_df.columns),set(expect_df.columns))
         self.assertEqual(set(check_df['MessageID']),set(expect_df['MessageID']))
 
+    def test_send_edges(self):
+        check_df = self.gx.send_edges()
+        self.assertEqual(set(check_df.columns), {'From', 'Recipient', 'SendType', 'Weight'})
+        self.assertEqual(check_df['Weight'].sum(), len(self.gx.sends()))
+        decoded_df = self.gx.send_edges(decode=True)
+        self.assertEqual(set(decoded_df['From']).issubset(set(self.gx.addresses())), True)
+
+    def test_send_edges_bucketed(self):
+        bucketed = tm.MboxExtractor(os.path.join('.', 'mbox_data'), send_graph=True, time_bucket=7*24*3600)
+        check_df = bucketed.send_edges()
+        self.assertEqual('Bucket' in check_df.columns, True)
+        self.assertEqual(check_df['Weight'].sum(), len(self.gx.sends()))
+
+    @unittest.skipIf(importlib.util.find_spec('scipy') is None, 'SciPy is not installed')
+    def test_send_matrix(self):
+        matrix, addresses = self.gx.send_matrix()
+        self.assertEqual(matrix.shape, (len(addresses), len(addresses)))
+        self.assertEqual(matrix.sum(), len(self.gx.sends()))
+        to_matrix, addresses = self.gx.send_matrix(send_type='To')
+        self.assertEqual(to_matrix.sum(), (self.gx.sends()['SendType'] == 'To').sum())
+
+    def test_threads(self):
+        threaded = tm.MboxExtractor(os.path.join('.', 'mbox_data'), threads=True)
+        check_df = threaded.emails(drop_collections=False)
+        thread_cols = {'Message-ID', 'In-Reply-To', 'References', 'ThreadID', 'ParentID', 'ThreadDepth'}
+        self.assertEqual(set(check_df.columns), set(self.emails_df.columns).union(thread_cols))
+        roots = check_df[check_df['ParentID'].isnull()]
+        self.assertEqual(set(roots['ThreadDepth']), {0})
+        replies = check_df[check_df['ParentID'].notnull()]
+        self.assertEqual((replies['ThreadDepth'] > 0).all(), True)
+        self.assertEqual(set(check_df['ThreadID']).issubset(set(roots['MessageID'])), True)
+
+    def test_incremental(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            cache_dir = os.path.join(temp_dir, 'cache')
+            mbox_file = os.path.join(temp_dir, 'archive.mbox')
+            shutil.copyfile(os.path.join('.', 'mbox_data', 'mail_1.mbox'), mbox_file)
+            first = tm.MboxExtractor(mbox_file, cache_dir=cache_dir)
+
+            # Append messages, then extract again
+            with open(mbox_file, 'ab') as f, open(os.path.join('.', 'mbox_data', 'mail_2.mbox'), 'rb') as g:
+                f.write(g.read())
+            second = tm.MboxExtractor(mbox_file, cache_dir=cache_dir)
+            full = tm.MboxExtractor(mbox_file)
+            self.assertEqual(len(second), len(full))
+            self.assertEqual(list(second.emails()['Subject']), list(full.emails()['Subject']))
+            self.assertEqual(list(second.emails()['MessageID']), list(full.emails()['MessageID']))
+
+            # A rewritten file is parsed again from the start
+            shutil.copyfile(os.path.join('.', 'mbox_data', 'mail_3.mbox'), mbox_file)
+            third = tm.MboxExtractor(mbox_file, cache_dir=cache_dir)
+            self.assertEqual(len(third), len(tm.MboxExtractor(mbox_file)))
+
+            # A message cut off mid-headers is parsed again once the rest is appended
+            messages = [b'From a@example.com Mon Jan  2 10:00:00 2017\nFrom: a@example.com\nTo: b@example.com\n'
+                        b'Subject: one\nDate: Mon, 2 Jan 2017 10:00:00 +0000\n\nFirst body\n\n',
+                        b'From b@example.com Tue Jan  3 10:00:00 2017\nFrom: b@example.com\nTo: a@example.com\n'
+                        b'Date: Tue, 3 Jan 2017 10:00:00 +0000\nSubject: two\n\nSecond body\n\n']
+            with open(mbox_file, 'wb') as f:
+                f.write(messages[0] + messages[1][:60])
+            partial = tm.MboxExtractor(mbox_file, cache_dir=cache_dir)
+            self.assertEqual(len(partial), 2)
+            with open(mbox_file, 'ab') as f:
+                f.write(messages[1][60:])
+            resumed = tm.MboxExtractor(mbox_file, cache_dir=cache_dir).emails()
+            full = tm.MboxExtractor(mbox_file).emails()
+            self.assertEqual(list(resumed['Subject']), ['one', 'two'])
+            self.assertEqual(list(resumed['Body']), list(full['Body']))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_compressed(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            for name, opener in [('mail_1.mbox.gz', gzip.open), ('mail_2.mbox.xz', lzma.open)]:
+                with open(os.path.join('.', 'mbox_data', name[:-len(name.split('.')[-1])-1]), 'rb') as f, \
+                        opener(os.path.join(temp_dir, name), 'wb') as g:
+                    g.write(f.read())
+            check = tm.MboxExtractor(temp_dir)
+            plain = tm.MboxExtractor(os.path.join('.', 'mbox_data', 'mail_1.mbox'))
+            self.assertEqual(len(check), 2 * len(plain))
+            self.assertEqual(set(check.emails(drop_collections=False).columns), set(self.emails_df.columns))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_maildir_and_eml(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            maildir = mailbox.Maildir(os.path.join(temp_dir, 'maildir'), create=True)
+            messages = list(mailbox.mbox(os.path.join('.', 'mbox_data', 'mail_1.mbox')))
+            for message in messages:
+                maildir.add(message)
+            with open(os.path.join(temp_dir, 'single.eml'), 'wb') as f:
+                f.write(messages[0].as_bytes())
+            check = tm.MboxExtractor(temp_dir, workers=2)
+            plain = tm.MboxExtractor(os.path.join('.', 'mbox_data', 'mail_1.mbox'))
+            self.assertEqual(len(check), len(messages) + 1)
+            self.assertEqual(set(check.emails(drop_collections=False).columns), set(self.emails_df.columns))
+            self.assertEqual(set(check.emails()['Subject']), set(plain.emails()['Subject']))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_headers_only(self):
+        check = tm.MboxExtractor(os.path.join('.', 'mbox_data'), headers_only=True)
+        check_df = check.emails(drop_collections=False)
+        full_df = self.gx.emails(drop_collections=False)
+        self.assertEqual(set(check_df.columns), set(self.emails_df.columns).difference({'Body'}))
+        self.assertEqual(list(check_df['Subject']), list(full_df['Subject']))
+        self.assertEqual(list(check_df['From']), list(full_df['From']))
+        self.assertEqual(list(check_df['To']), list(full_df['To']))
+
+
+    @unittest.skipIf(importlib.util.find_spec('pyarrow') is None, 'pyarrow is not installed')
+    def test_arrow_backend(self):
+        import pyarrow as pa
+        check = tm.MboxExtractor(os.path.join('.', 'mbox_data'), backend='arrow')
+        raw = check.raw()
+        self.assertTrue(isinstance(raw, pa.Table))
+        self.assertTrue(pa.types.is_list(raw.schema.field('To').type))
+        check_sends = check.sends()
+        expect_sends = self.gx.sends()
+        self.assertEqual(set(check_sends.column_names), set(expect_sends.columns))
+        self.assertEqual(sorted(zip(check_sends.column('From').to_pylist(), check_sends.column('Recipient').to_pylist(),
+                                    check_sends.column('SendType').to_pylist())),
+                         sorted(zip(expect_sends['From'], expect_sends['Recipient'], expect_sends['SendType'])))
+        self.assertEqual(set(check.emails().column_names), set(self.gx.emails().columns))
+        with self.assertRaises(ValueError):
+            tm.MboxExtractor(os.path.join('.', 'mbox_data'), backend='feather')
+
+
+    def test_sends_chunked(self):
+        expect_df = self.gx.sends()
+        check_df = pd.concat(list(self.gx.sends(chunk_size=4)), ignore_index=True)
+        self.assertEqual(set(check_df.columns), set(expect_df.columns))
+        self.assertEqual(sorted(zip(check_df['From'], check_df['Recipient'], check_df['SendType'])),
+                         sorted(zip(expect_df['From'], expect_df['Recipient'], expect_df['SendType'])))
+
+    def test_identity(self):
+        resolver = tx.IdentityResolver()
+        resolver.add_extractor(self.gx)
+        emails_df = self.gx.identify(self.gx.emails(drop_collections=False), resolver)
+        self.assertEqual(len(emails_df), len(self.gx))
+        senders = emails_df.groupby('From')['person_id'].nunique()
+        self.assertEqual((senders == 1).all(), True)
+        self.assertEqual(list(emails_df['to_person_ids'].map(len)), list(emails_df['To'].map(len)))
+
+        sends_df = self.gx.identify(self.gx.sends(), resolver)
+        sender = sends_df['From'].iloc[0]
+        self.assertEqual(sends_df['person_id'].iloc[0], resolver.person_id(email=sender.upper()))
+        self.assertEqual(sends_df['recipient_person_id'].iloc[0],
+                         resolver.person_id(email=sends_df['Recipient'].iloc[0]))
+
+        # Handles link identities without a shared address
+        resolver.add(email=sender, handle='@ada')
+        self.assertEqual(resolver.person_id(handle='ADA'), resolver.person_id(email=sender))
+        self.assertEqual(resolver.person_id(email='nobody@example.com'), -1)
+
+        # Different people with the same name stay apart, unless names are matched within an email domain
+        for match_names in [False, True]:
+            resolver = tx.IdentityResolver(match_names=match_names)
+            resolver.add(name='John Smith', email='john@example.com')
+            resolver.add(name='John Smith', email='jsmith@example.org', handle='@jsmith')
+            resolver.add(name='Smith, John', email='j.smith@example.org')
+            self.assertNotEqual(resolver.person_id(email='john@example.com'), resolver.person_id(handle='jsmith'))
+            self.assertEqual(resolver.person_id(email='j.smith@example.org') == resolver.person_id(handle='jsmith'),
+                             match_names)
+
+    def test_activity(self):
+        check_df = self.gx.activity()
+        self.assertEqual(list(check_df.columns), ['From', 'window', 'emails', 'recipients'])
+        self.assertEqual(check_df['emails'].sum(), len(self.gx))
+        self.assertEqual(check_df['recipients'].sum(), len(self.gx.sends()))
+        streamed = tm.MboxExtractor(os.path.join('.', 'mbox_data'), activity_window=7 * 24 * 3600)
+        self.assertEqual(streamed.activity().equals(check_df), True)
+        self.assertEqual(tm.MboxExtractor.activity_from(os.path.join('.', 'mbox_data')).equals(check_df), True)
+        deduped_df = tm.MboxExtractor.activity_from(os.path.join('.', 'mbox_data'), dedupe=True)
+        self.assertEqual(deduped_df['emails'].sum() * 4, len(self.gx))
+
+    def test_dedupe(self):
+        # The four test archives hold the same messages
+        check = tm.MboxExtractor(os.path.join('.', 'mbox_data'), dedupe=True)
+        plain = tm.MboxExtractor(os.path.join('.', 'mbox_data', 'mail_1.mbox'))
+        self.assertEqual(len(check), len(plain))
+        self.assertEqual(check.duplicates, len(self.gx) - len(plain))
+        self.assertEqual(list(check.emails()['Subject']), list(plain.emails()['Subject']))
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            # Messages without a Message-ID are matched by their headers
+            for name in ['a.eml', 'b.eml']:
+                with open(os.path.join(temp_dir, name), 'wb') as f:
+                    f.write(b'From: x@example.com\nTo: y@example.com\nSubject: Hi\n\nHello\n')
+            shutil.copyfile(os.path.join('.', 'mbox_data', 'mail_1.mbox'), os.path.join(temp_dir, 'monthly.mbox'))
+            shutil.copyfile(os.path.join('.', 'mbox_data', 'mail_2.mbox'), os.path.join(temp_dir, 'yearly.mbox'))
+            seen_db = os.path.join(temp_dir, 'seen.sqlite')
+            on_disk = tm.MboxExtractor(temp_dir, dedupe=seen_db, workers=1)
+            self.assertEqual(len(on_disk), len(plain) + 1)
+            self.assertEqual(on_disk.duplicates, len(plain) + 1)
+
+            # Cached rows are not duplicated by later files
+            cache_dir = os.path.join(temp_dir, 'cache')
+            tm.MboxExtractor(temp_dir, dedupe=True, cache_dir=cache_dir, workers=1)
+            cached = tm.MboxExtractor(temp_dir, dedupe=True, cache_dir=cache_dir, workers=1)
+            self.assertEqual(len(cached), len(plain) + 1)
+        finally:
+            shutil.rmtree(temp_dir)
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            # Copies of cached messages are skipped in archives that sort before the cached one
+            cache_dir = os.path.join(temp_dir, 'cache')
+            source_dir = os.path.join(temp_dir, 'archives')
+            os.makedirs(source_dir)
+            shutil.copyfile(os.path.join('.', 'mbox_data', 'mail_1.mbox'), os.path.join(source_dir, 'yearly.mbox'))
+            tm.MboxExtractor(source_dir, dedupe=True, cache_dir=cache_dir)
+            shutil.copyfile(os.path.join('.', 'mbox_data', 'mail_2.mbox'), os.path.join(source_dir, 'a_monthly.mbox'))
+            cached = tm.MboxExtractor(source_dir, dedupe=True, cache_dir=cache_dir)
+            self.assertEqual(len(cached), len(plain))
+            self.assertEqual(cached.duplicates, len(plain))
+
+            # Messages without a Message-ID get the same key in an mbox and an .eml file, with or without bodies
+            message = b'From: x@example.com\nTo: y@example.com\nSubject: Hi\n\nHello\n'
+            mixed_dir = os.path.join(temp_dir, 'mixed')
+            os.makedirs(mixed_dir)
+            with open(os.path.join(mixed_dir, 'a.eml'), 'wb') as f:
+                f.write(message)
+            with open(os.path.join(mixed_dir, 'b.mbox'), 'wb') as f:
+                f.write(b'From x@example.com Mon Jan  1 00:00:00 2018\n' + message)
+            for headers_only in [False, True]:
+                check = tm.MboxExtractor(mixed_dir, dedupe=True, headers_only=headers_only, workers=1)
+                self.assertEqual((len(check), check.duplicates), (1, 1))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_header_decoding(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(temp_dir, 'encoded.mbox'), 'wb') as f:
+                f.write(b'From a@b Mon Jan  1 00:00:00 2018\n'
+                        b'From: =?utf-8?b?SsO2cmcgTcO8bGxlcg==?= <jm@example.org>\n'
+                        b'To: list@example.org\n'
+                        b'Subject: =?iso-8859-1?q?Caf=E9?= =?iso-8859-1?q?_menu?=\n\nBody\n\n'
+                        b'From a@b Mon Jan  1 00:00:00 2018\n'
+                        b'From: Z\xc3\xbcrich Team <zt@example.org>\n'
+                        b'Subject: Re: \xc3\xbcber\n\nBody\n')
+            check_df = tm.MboxExtractor(temp_dir, display_names=True).emails()
+            self.assertEqual(list(check_df['Subject']), ['Caf\u00e9 menu', 'Re: \u00fcber'])
+            self.assertEqual(list(check_df['FromName']), ['J\u00f6rg M\u00fcller', 'Z\u00fcrich Team'])
+            self.assertEqual(list(check_df['From']), ['jm@example.org', 'zt@example.org'])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_search(self):
+        bodies = self.gx.emails()['Body'].str.lower()
+        check_df = self.gx.search('Released')
+        self.assertEqual(list(check_df['MessageID']),
+                         list(self.gx.emails()['MessageID'][bodies.str.contains(r'\breleased\b')]))
+        phrase = bodies.str.contains(r'\bportable\W+thunderbird\b') & bodies.str.contains(r'\b1\b')
+        self.assertEqual(list(self.gx.search('"Portable Thunderbird" 1')['MessageID']),
+                         list(self.gx.emails()['MessageID'][phrase]))
+        self.assertEqual(len(self.gx.search('"thunderbird portable released"')), 0)
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'bodies.npz')
+            built = tm.MboxExtractor(os.path.join('.', 'mbox_data'), text_index=path, workers=2)
+            loaded = tx.TextIndex.load(path)
+            self.assertEqual(loaded.terms, self.gx.text_index().terms)
+            self.assertEqual(list(loaded.phrase('portable thunderbird')),
+                             list(built.text_index().phrase('portable thunderbird')))
+        finally:
+            shutil.rmtree(temp_dir)
+        with self.assertRaises(ValueError):
+            tm.MboxExtractor(os.path.join('.', 'mbox_data'), headers_only=True).search('released')
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -18,8 +18,12 @@
 # *********************************************************************************************
 
 import os
+import gzip
 import json
+import shutil
+import tempfile
 import unittest
+import importlib.util
 import pandas as pd
 import tidyextractors as tx
 import tidyextractors.tidytwitter as tm
@@ -62,5 +66,142 @@ class TestTwitterExtractor(unittest.TestCase):
         self.assertEqual(set(expect_df['id']).issubset(set(check_df['id'])), True)
 
 
+class TestTwitterArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.archive = os.path.join('.', 'twitter_data', 'twitter_archive_test.jsonl')
+        self.tx = tm.TwitterExtractor(self.archive)
+        self.tweets_df = pd.read_csv(os.path.join('.', 'twitter_data', 'twitter_tweets_test.csv'))
+        self.users_df = pd.read_csv(os.path.join('.', 'twitter_data', 'twitter_users_test.csv'))
+
+    def test_users(self):
+        check_df = self.tx.users(drop_collections=False)
+        self.assertEqual(set(check_df.columns), set(self.users_df.columns))
+        self.assertEqual(list(check_df['screen_name']), ['whatifnumbers', 'numbersfan'])
+        self.assertEqual(set(self.users_df['id']).issubset(set(check_df['id'])), True)
+
+    def test_tweets(self):
+        check_df = self.tx.tweets()
+        self.assertEqual(set(check_df.columns), set(self.tweets_df.columns))
+        self.assertEqual(set(self.tweets_df['tweet_id'].astype(str)).issubset(set(check_df['tweet_id'])), True)
+        self.assertEqual(len(check_df), len(self.tweets_df) + 1)
+        retweets = check_df[check_df['tweets/retweet']]
+        self.assertEqual(list(retweets['tweets/rt_author']), ['@whatifnumbers'])
+        self.assertEqual(check_df['tweets/created'].iloc[0].isoformat(), '2017-03-21T15:50:11+00:00')
+
+    def test_search(self):
+        records = []
+        check = tm.TwitterExtractor(self.archive, metrics=tx.Metrics([tx.Callback(records.append)]))
+        self.assertEqual(len(check.search('"world population"')), 2)
+        self.assertEqual(len(check.search('population')), len(check.search('POPULATION')))
+        self.assertEqual(check.search('"world population"').equals(check.tweets().iloc[check.text_index().search('"world population"')]), True)
+        # Users are expanded into the tweets table once, then reused
+        self.assertEqual([r['stage'] for r in records].count('expand_on'), 1)
+
+    @unittest.skipIf(importlib.util.find_spec('pyarrow') is None, 'pyarrow is not installed')
+    def test_arrow_tweets(self):
+        import pyarrow as pa
+        check = tm.TwitterExtractor(self.archive, backend='arrow')
+        table = check.tweets()
+        self.assertIsInstance(table, pa.Table)
+        expect_df = self.tx.tweets()
+        self.assertEqual(table.column_names, list(expect_df.columns))
+        self.assertEqual(table.column('tweet_id').to_pylist(), list(expect_df['tweet_id']))
+        self.assertEqual(table.column('tweets/rt_author').to_pylist(), list(expect_df['tweets/rt_author']))
+        found = check.search('"world population"')
+        self.assertEqual(found.column('tweet_id').to_pylist(), list(self.tx.search('"world population"')['tweet_id']))
+
+    def test_compressed_and_parallel(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            with open(self.archive, 'rb') as f_in, gzip.open(os.path.join(temp_dir, 'dump.jsonl.gz'), 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out)
+            check = tm.TwitterExtractor(temp_dir, workers=2)
+            self.assertEqual(check.tweets().equals(self.tx.tweets()), True)
+            self.assertEqual(len(check.search('"world population"')), 2)
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+class StubResponse(object):
+
+    def __init__(self, status_code, remaining, reset):
+        self.status_code = status_code
+        self.headers = {'x-rate-limit-remaining': str(remaining), 'x-rate-limit-reset': str(reset)}
+
+
+class RateLimited(Exception):
+
+    def __init__(self, response):
+        self.response = response
+
+
+class StubAPI(object):
+    """
+    Allows limit calls to user_timeline per 900 second window of a shared clock.
+    """
+
+    def __init__(self, clock, limit):
+        self.clock = clock
+        self.limit = limit
+        self.used = {}
+        self.last_response = None
+
+    def user_timeline(self, screen_name):
+        window = self.clock.now // 900
+        reset = (window + 1) * 900
+        self.used[window] = self.used.get(window, 0) + 1
+        if self.used[window] > self.limit:
+            raise RateLimited(StubResponse(429, 0, reset))
+        self.last_response = StubResponse(200, self.limit - self.used[window], reset)
+        return [screen_name]
+
+
+class StubClock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestCredentialPool(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = StubClock()
+        self.apis = [StubAPI(self.clock, 3), StubAPI(self.clock, 3)]
+        self.pool = tm.CredentialPool(self.apis, clock=self.clock.time, sleep=self.clock.sleep)
+
+    def test_spreads_requests(self):
+        for i in range(6):
+            self.assertEqual(self.pool.user_timeline(screen_name='u'), ['u'])
+        self.assertEqual(self.pool.calls, [3, 3])
+        self.assertEqual(self.pool.waited, 0)
+        self.assertEqual(self.pool.remaining('user_timeline'), [0, 0])
+
+        # Every credential is exhausted, so the pool sleeps until the window resets
+        self.pool.user_timeline(screen_name='u')
+        self.assertEqual(self.clock.now, 900 + self.pool.margin)
+        self.assertEqual(sum(self.pool.calls), 7)
+
+    def test_rate_limit_errors(self):
+        # Requests made outside the pool use up the first credential's quota
+        self.apis[0].used[0] = 3
+        for i in range(3):
+            self.pool.user_timeline(screen_name='u')
+        self.assertEqual(self.apis[1].used[0], 3)
+        self.assertEqual(self.pool.remaining('user_timeline'), [0, 0])
+        with self.assertRaises(AttributeError):
+            self.pool.get_users
+
+    def test_credentials_checked(self):
+        with self.assertRaises(ValueError):
+            tm.CredentialPool.from_credentials([{'access_token': 'a'}])
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -17,7 +17,36 @@
 # If not, see <http://www.gnu.org/licenses/>.
 # *********************************************************************************************
 
-from tidyextractors.base_extractor import BaseExtractor
-import tidyextractors.tidygit as tidygit
-import tidyextractors.tidymbox as tidymbox
-import tidyextractors.tidytwitter as tidytwitter
+import importlib
+
+# Subpackages and classes are imported on first access, so that importing tidyextractors
+#   is cheap, and e.g. extracting mbox files never loads GitPython, tweepy or nltk.
+
+# Lazily imported classes, and the modules they are defined in.
+lazy_attributes = {'BaseExtractor': 'tidyextractors.base_extractor',
+                   'Metrics': 'tidyextractors.metrics',
+                   'ProgressBars': 'tidyextractors.metrics',
+                   'Callback': 'tidyextractors.metrics',
+                   'PrometheusTextFile': 'tidyextractors.metrics',
+                   'write_parquet': 'tidyextractors.arrow_output',
+                   'IdentityResolver': 'tidyextractors.identity',
+                   'TextIndex': 'tidyextractors.text_index'}
+
+# Lazily imported subpackages.
+lazy_submodules = ['tidygit', 'tidymbox', 'tidytwitter']
+
+__all__ = sorted(lazy_attributes) + lazy_submodules
+
+
+def __getattr__(name):
+    if name in lazy_submodules:
+        return importlib.import_module('tidyextractors.' + name)
+    if name in lazy_attributes:
+        value = getattr(importlib.import_module(lazy_attributes[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module 'tidyextractors' has no attribute '{}'".format(name))
+
+
+def __dir__():
+    return sorted(set(globals()).union(__all__))
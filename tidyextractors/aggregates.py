@@ -0,0 +1,96 @@
+# *********************************************************************************************
+# Copyright (C) 2017 Joel Becker,  Jillian Anderson, Steve McColl and Dr. John McLevey
+#
+# This file is part of the tidyextractors package developed for Dr John McLevey's Networks Lab
+# at the University of Waterloo. For more information, see
+# http://tidyextractors.readthedocs.io/en/latest/
+#
+# tidyextractors is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# tidyextractors is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with tidyextractors.
+# If not, see <http://www.gnu.org/licenses/>.
+# *********************************************************************************************
+
+import pandas as pd
+
+# Windowed aggregates are counted one item at a time, as commits and messages are streamed
+#   from their source, and only one row of counters is kept per (key, window) group.
+
+# Common window widths, in seconds.
+day = 24 * 3600
+week = 7 * day
+
+# Windows start at multiples of their width after this time, in epoch seconds.
+#   5 January 1970 was a Monday, so weeks start on Mondays at 00:00 UTC.
+monday = 4 * day
+
+
+class WindowedAggregate(object):
+    """
+    Counts items, and sums their values, per key (e.g. a person) and time window.
+
+    :param int window: Window width in seconds. Defaults to a week.
+    :param list fields: Names of the values summed for each item, in the order they are passed to ``add``.
+    :param int origin: Windows start at origin plus multiples of window, in epoch seconds.
+     Defaults to a Monday, 00:00 UTC.
+    """
+
+    def __init__(self, window=week, fields=(), origin=monday):
+        self.window = window
+        self.fields = list(fields)
+        self.origin = origin
+        self._groups = {}
+
+    def window_start(self, time):
+        """
+        :param time: A datetime, epoch seconds, or None.
+        :return: The start of the window holding time, in epoch seconds, or None.
+        """
+        if time is None or time != time:
+            return None
+        if hasattr(time, 'timestamp'):
+            time = time.timestamp()
+        time = int(time)
+        return time - (time - self.origin) % self.window
+
+    def add(self, key, time, *values):
+        """
+        Counts one item.
+        :param key: The group key, e.g. an author's email address.
+        :param time: A datetime, epoch seconds, or None.
+        :param values: One number per field, added to the group's sums.
+        :return: None
+        """
+        group_key = (key, self.window_start(time))
+        sums = self._groups.get(group_key)
+        if sums is None:
+            sums = [0] * (len(self.fields) + 1)
+            self._groups[group_key] = sums
+        sums[0] += 1
+        for i, value in enumerate(values, 1):
+            sums[i] += value
+
+    def __len__(self):
+        """
+        :return: Number of (key, window) groups.
+        """
+        return len(self._groups)
+
+    def to_frame(self, key_name='key', count_name='count'):
+        """
+        :param str key_name: Name of the key column.
+        :param str count_name: Name of the item count column.
+        :return: pandas.DataFrame with key, window (a UTC datetime, the start of the window), count and
+         field columns, sorted by window and key. Items without a time have no window.
+        """
+        rows = sorted(((key, start) + tuple(sums) for (key, start), sums in self._groups.items()),
+                      key=lambda row: (row[1] is None, row[1] or 0, str(row[0])))
+        df = pd.DataFrame(rows, columns=[key_name, 'window', count_name] + self.fields)
+        df['window'] = pd.to_datetime(df['window'].astype('float64'), unit='s', utc=True)
+        return df
@@ -0,0 +1,223 @@
+# *********************************************************************************************
+# Copyright (C) 2017 Joel Becker,  Jillian Anderson, Steve McColl and Dr. John McLevey
+#
+# This file is part of the tidyextractors package developed for Dr John McLevey's Networks Lab
+# at the University of Waterloo. For more information, see
+# http://tidyextractors.readthedocs.io/en/latest/
+#
+# tidyextractors is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# tidyextractors is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with tidyextractors.
+# If not, see <http://www.gnu.org/licenses/>.
+# *********************************************************************************************
+
+import os
+
+# Arrow and Polars output. Extracted data is converted column by column into Arrow arrays,
+#   with lists (e.g. To/Cc) as native list columns and dictionaries of dictionaries (e.g. git
+#   changes, tweets) as lists of structs, so no Python objects remain in the output.
+#   Tables can then be reshaped with Arrow compute functions instead of expand_on.
+
+# Supported output backends.
+backends = ['pandas', 'arrow', 'polars']
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+    except ImportError:
+        raise ImportError('Arrow output requires pyarrow. Install it with "pip install pyarrow".')
+    return pyarrow
+
+
+def import_polars():
+    try:
+        import polars
+    except ImportError:
+        raise ImportError('Polars output requires polars. Install it with "pip install polars pyarrow".')
+    return polars
+
+
+def check_backend(backend):
+    """
+    Checks that a backend is supported and that its dependencies are installed.
+    :param backend: 'pandas', 'arrow' or 'polars'.
+    :return: None
+    """
+    if backend not in backends:
+        raise ValueError('Unknown backend "{}". Use one of: {}.'.format(backend, ', '.join(backends)))
+    if backend != 'pandas':
+        import_pyarrow()
+    if backend == 'polars':
+        import_polars()
+
+
+def column_to_arrow(series, key_name=None):
+    """
+    Converts a pandas column to an Arrow array.
+    :param series: pandas.Series
+    :param key_name: Optional. If given, dictionaries of dictionaries become lists of structs,
+     with the outer keys in a field of this name.
+    :return: pyarrow.Array
+    """
+    pa = import_pyarrow()
+    if series.dtype != object:
+        return pa.Array.from_pandas(series)
+
+    values = list(series)
+    if key_name is not None:
+        values = [None if not isinstance(v, dict) else [dict(inner, **{key_name: k}) for k, inner in v.items()]
+                  for v in values]
+    else:
+        values = [sorted(v) if isinstance(v, (set, frozenset)) else v for v in values]
+    try:
+        array = pa.array(values, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        # Mixed or unsupported objects are kept as their string representation
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+    if pa.types.is_timestamp(array.type) and array.type.tz is not None:
+        # Datetimes with per-value UTC offsets are stored in UTC, which every reader understands
+        array = array.cast(pa.timestamp(array.type.unit, tz='UTC'))
+    return array
+
+
+def to_arrow(df, key_names=None):
+    """
+    Converts a DataFrame to an Arrow table.
+    :param df: pandas.DataFrame
+    :param key_names: Optional dictionary mapping columns of dictionaries of dictionaries to the name
+     of the key field in their list of structs (e.g. {'changes': 'file'}).
+    :return: pyarrow.Table
+    """
+    pa = import_pyarrow()
+    key_names = key_names or {}
+    arrays = [column_to_arrow(df[col], key_names.get(col)) for col in df.columns]
+    return pa.Table.from_arrays(arrays, names=[str(col) for col in df.columns])
+
+
+def is_collection(data_type):
+    pa = import_pyarrow()
+    return pa.types.is_list(data_type) or pa.types.is_large_list(data_type) or \
+        pa.types.is_struct(data_type) or pa.types.is_map(data_type)
+
+
+def drop_collections(table):
+    """
+    Drops list, struct and map columns from an Arrow table.
+    :param table: pyarrow.Table
+    :return: pyarrow.Table
+    """
+    return table.select([f.name for f in table.schema if not is_collection(f.type)])
+
+
+def explode(table, column, rename):
+    """
+    Gives each element of a list column its own row, repeating the other columns.
+    Elements that are structs are split into columns named "column/field", except for
+    a field named rename, which keeps its name.
+    :param table: pyarrow.Table
+    :param column: Name of a list column.
+    :param rename: Name of the column holding the elements (or their key field).
+    :return: pyarrow.Table
+    """
+    pa = import_pyarrow()
+    pc = pa.compute
+    values = table.column(column).combine_chunks()
+    parents = pc.list_parent_indices(values)
+    flat = pc.list_flatten(values)
+    out = table.drop_columns([column]).take(parents)
+
+    if pa.types.is_struct(flat.type):
+        fields = [flat.type.field(i).name for i in range(flat.type.num_fields)]
+        for field in fields:
+            name = rename if field == rename else '{}/{}'.format(column, field)
+            out = out.append_column(name, pc.struct_field(flat, field))
+    else:
+        out = out.append_column(rename, flat)
+    return out
+
+
+def unify_schemas(schemas):
+    """
+    Merges schemas, e.g. those of blocks of one table. Null typed fields (from columns that are
+    all None in a block) take the type of the same field in other schemas, and struct fields are merged.
+    :param list schemas: pyarrow.Schema objects.
+    :return: pyarrow.Schema
+    """
+    pa = import_pyarrow()
+    try:
+        return pa.unify_schemas(schemas, promote_options='permissive')
+    except TypeError:
+        # pyarrow < 14 only promotes null typed fields
+        return pa.unify_schemas(schemas)
+
+
+def conform(table, schema):
+    """
+    Casts a table to a schema, adding the columns it lacks as nulls.
+    :param table: pyarrow.Table
+    :param schema: pyarrow.Schema, whose fields include those of the table.
+    :return: pyarrow.Table
+    """
+    pa = import_pyarrow()
+    columns = [table.column(f.name) if f.name in table.column_names else pa.nulls(table.num_rows, f.type)
+               for f in schema]
+    return pa.Table.from_arrays(columns, names=schema.names).cast(schema)
+
+
+def write_parquet(tables, directory, key_names=None):
+    """
+    Writes tables to a directory of Parquet files, one file per table, e.g. the blocks
+    yielded by ``changes(chunk_size=...)`` or ``iter_expand_on``. Every file is written with one
+    schema, merged from those of all tables, so the directory can be read back as a single
+    dataset by pyarrow, Polars, pandas or DuckDB. Requires pyarrow.
+
+    :param tables: An iterable of pandas.DataFrame, pyarrow.Table or polars.DataFrame.
+    :param str directory: Output directory. Created if it does not exist.
+    :param dict key_names: Optional. Passed to ``to_arrow`` for pandas tables.
+    :return: A list of the paths written.
+    """
+    pa = import_pyarrow()
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('Parquet output requires pyarrow with Parquet support. Install it with "pip install pyarrow".')
+
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    written = []
+    schema = None
+    for i, table in enumerate(tables):
+        if not isinstance(table, pa.Table):
+            table = table.to_arrow() if hasattr(table, 'to_arrow') else to_arrow(table, key_names=key_names)
+        # Each table is written with the schema merged so far, so only files written before
+        #   a type or column first appears need to be rewritten
+        schema = table.schema if schema is None else unify_schemas([schema, table.schema])
+        path = os.path.join(directory, 'part-{:05d}.parquet'.format(i))
+        pq.write_table(conform(table, schema), path)
+        paths.append(path)
+        written.append(schema)
+
+    # Tables are streamed, so files written with an earlier schema are read back one at a time
+    for path, file_schema in zip(paths, written):
+        if not file_schema.equals(schema):
+            pq.write_table(conform(pq.read_table(path), schema), path)
+    return paths
+
+
+def convert(table, backend):
+    """
+    :param table: pyarrow.Table
+    :param backend: 'arrow' or 'polars'.
+    :return: The table, or a polars.DataFrame.
+    """
+    if backend == 'polars':
+        return import_polars().from_arrow(table)
+    return table
@@ -17,11 +17,12 @@
 # If not, see <http://www.gnu.org/licenses/>.
 # *********************************************************************************************
 
-import tqdm
 import warnings
 import numpy as np
 import pandas as pd
 import itertools as it
+from tidyextractors.metrics import default_metrics
+from tidyextractors.arrow_output import check_backend, to_arrow, convert
 
 
 class BaseExtractor(object):
@@ -33,16 +34,40 @@ class BaseExtractor(object):
     # _data stores the main collection of extracted test_data
     _data = None
 
-    def __init__(self, source, auto_extract=True, *args, **kwargs):
+    # metrics receives stage timings and counts (see tidyextractors.metrics)
+    metrics = None
+
+    # backend determines the type of output tables: 'pandas', 'arrow' or 'polars'
+    backend = 'pandas'
+
+    # Columns holding dictionaries of dictionaries, and the key field name they get in Arrow output
+    _key_names = {}
+
+    # Columns identifying people, as (person id column, {role: column}) pairs, where roles are
+    #   'name', 'email' and 'handle'. Used by identify and IdentityResolver.add_extractor.
+    #   Alternatives for one id column are listed in order of preference.
+    _identity_columns = []
+
+    def __init__(self, source, auto_extract=True, *args, metrics=None, backend='pandas', **kwargs):
         """
         Extractor initialization. Should not be overridden by extractor subclasses.
 
         :param source: Specifies data source. Differs by subclass.
         :param args: Arbitrary arguments permitted for extensibility.
         :param bool auto_extract: Extract data from source upon initialization?
+        :param Metrics metrics: Optional, keyword only. Receives per-stage timings and counts during extraction
+         and reshaping. Defaults to a Metrics object that only shows progress bars.
+        :param str backend: Keyword only. Defaults to 'pandas'. The type of tables returned by output methods: 'pandas'
+         for pandas.DataFrame, 'arrow' for pyarrow.Table or 'polars' for polars.DataFrame. Arrow and Polars
+         output keep lists and nested dictionaries as native list and struct columns. Requires pyarrow
+         (and polars).
         :param kwargs: Arbitrary keyword arguments permitted for extensibility.
         """
 
+        self.metrics = metrics if metrics is not None else default_metrics()
+        check_backend(backend)
+        self.backend = backend
+
         # Extract test_data unless otherwise specified
         if auto_extract:
             self._extract(source, *args, **kwargs)
@@ -81,6 +106,26 @@ class BaseExtractor(object):
         """
         self._data = pd.DataFrame()
 
+    def _to_arrow(self, df=None):
+        """
+        Converts data to an Arrow table, with native list and struct columns.
+
+        :param pandas.DataFrame df: Defaults to ``self._data``.
+        :return: pyarrow.Table
+        """
+        return to_arrow(self._data if df is None else df, key_names=self._key_names)
+
+    def _output(self, df):
+        """
+        Converts a table for output, according to the extractor's backend.
+
+        :param pandas.DataFrame df: The output table.
+        :return: pandas.DataFrame, pyarrow.Table or polars.DataFrame
+        """
+        if self.backend == 'pandas':
+            return df
+        return convert(self._to_arrow(df), self.backend)
+
     def _col_type_set(self, col, df):
         """
         Determines the set of types present in a DataFrame column.
@@ -118,20 +163,48 @@ class BaseExtractor(object):
                 keep_cols.append(c)
         return df[keep_cols]
 
+    def _identity_data(self, df=None):
+        """
+        Returns a table with its identity columns as strings.
+
+        :param pandas.DataFrame df: Defaults to ``self._data``.
+        :return: pandas.DataFrame
+        """
+        return self._data if df is None else df
+
+    def identify(self, df, resolver):
+        """
+        Adds person id columns to a table produced by this extractor (e.g. ``person_id`` for the
+        author of a commit or the sender of an email), so that people can be joined across sources.
+
+        :param pandas.DataFrame df: A table from one of this extractor's output methods.
+        :param IdentityResolver resolver: A resolver to which this extractor was added.
+        :return: pandas.DataFrame
+        """
+        lookup_df = self._identity_data(df)
+        out_df = df.copy()
+        done = set()
+        for id_col, roles in self._identity_columns:
+            # The first listed set of columns present in the table is used for each id column
+            if id_col not in done and all(col in df.columns for col in roles.values()):
+                out_df[id_col] = resolver.person_ids(lookup_df, **{role + '_col': col for role, col in roles.items()})
+                done.add(id_col)
+        return out_df
+
     def raw(self, drop_collections = False):
         """
         Produces the extractor object's data as it is stored internally.
 
         :param bool drop_collections: Defaults to False. Indicates whether columns with lists/dicts/sets will be dropped.
 
-        :return: pandas.DataFrame
+        :return: pandas.DataFrame (or pyarrow.Table or polars.DataFrame, depending on the backend)
         """
         base_df = self._data
         if drop_collections is True:
             out_df = self._drop_collections(base_df)
         else:
             out_df = base_df
-        return out_df
+        return self._output(out_df)
 
     def expand_on(self, col1, col2, rename1 = None, rename2 = None, drop = [], drop_collections = False):
         """
@@ -178,6 +251,34 @@ class BaseExtractor(object):
         :param bool drop_collections: Should columns with compound values be dropped?
         :return: pandas.DataFrame
         """
+        # A single block, which is the whole expansion
+        frames = list(self.iter_expand_on(col1, col2, rename1=rename1, rename2=rename2, drop=drop,
+                                          drop_collections=drop_collections))
+        return frames[0]
+
+    def iter_expand_on(self, col1, col2, rename1 = None, rename2 = None, drop = [], drop_collections = False,
+                       chunk_size = None):
+        """
+        Like ``expand_on``, but expands the data in blocks of rows and yields one expanded DataFrame
+        per block, so that only one block's expansion is held in memory at a time. Use this when
+        the expanded table may not fit in memory, e.g. with ``write_parquet``:
+
+        .. code-block:: python
+
+            tidyextractors.write_parquet(extractor.iter_expand_on('hexsha', 'changes', chunk_size=10000), 'changes/')
+
+        Column names, renaming and dropping are the same as in ``expand_on``. Columns created from
+        dictionaries only appear in blocks where they have values.
+
+        :param str col1: The first column to expand on. May be an atomic value, or a dict of dict.
+        :param str col2: The second column to expand on. May be an atomic value, or a dict of dict.
+        :param str rename1: The name for col1 after expansion. Defaults to col1_extended.
+        :param str rename2: The name for col2 after expansion. Defaults to col2_extended.
+        :param list drop: Column names to be dropped from output.
+        :param bool drop_collections: Should columns with compound values be dropped?
+        :param int chunk_size: Number of input rows per block. Defaults to None, i.e. a single block.
+        :return: A generator of pandas.DataFrame
+        """
 
         # Assumption 1: Expanded columns are either atomic are built in collections
         # Assumption 2: New test_data columns added to rows from dicts in columns of collections.
@@ -185,8 +286,9 @@ class BaseExtractor(object):
         # How many rows expected in the output?
         count = len(self._data)
 
-        # How often should the progress bar be updated?
+        # How often should progress be reported?
         update_interval = max(min(count//100, 100), 5)
+        metrics = self.metrics if self.metrics is not None else default_metrics()
 
         # What are the column names?
         column_list = list(self._data.columns)
@@ -223,13 +325,6 @@ class BaseExtractor(object):
             raise Exception('Duplicate columns names found. Note that you cannot rename a column with a name '
                             'that is already taken by another column.')
 
-        # List of tuples. Rows in new test_data frame.
-        old_attr_df_tuples = []
-        new_attr_df_dicts = []
-
-        # MultiIndex tuples
-        index_tuples = []
-
         def iter_product(item1,item2):
             """
             Enumerates possible combinations of items from item1 and item 2. Allows atomic values.
@@ -247,71 +342,83 @@ class BaseExtractor(object):
                 iter2 = [item2]
             return it.product(iter1,iter2)
 
-        # Create test_data for output.
-        with tqdm.tqdm(total=count) as pbar:
-            for row in self._data.itertuples(index=False):
-                # Enumerate commit/file pairs
-                for index in iter_product(row[first_index],row[second_index]):
+        # Process the data in blocks of rows, so only one block's expansion is held in memory at a time.
+        block_size = count if chunk_size is None else chunk_size
+        block_starts = range(0, count, block_size) if count > 0 else [0]
 
-                    new_row = row[:first_index] + \
-                              (index[0],) + \
-                              row[first_index+1:second_index] + \
-                              (index[1],) + \
-                              row[second_index+1:]
+        with metrics.stage('expand_on', total=count, description='Expanding rows...') as stage:
+            for block_start in block_starts:
+                block = self._data.iloc[block_start:block_start + block_size]
 
-                    # Add new row to list of row tuples
-                    old_attr_df_tuples.append(new_row)
+                # List of tuples. Rows in new test_data frame.
+                old_attr_df_tuples = []
+                new_attr_df_dicts = []
 
-                    # Add key tuple to list of indices
-                    index_tuples.append((index[0],index[1]))
+                # MultiIndex tuples
+                index_tuples = []
 
-                    # If there's test_data in either of the columns add the test_data to the new attr test_data frame.
-                    temp_attrs = {}
+                for index_row, row in enumerate(block.itertuples(index=False), block_start):
+                    # Enumerate commit/file pairs
+                    for index in iter_product(row[first_index],row[second_index]):
 
-                    # Get a copy of the first cell value for this index.
-                    #  If it's a dict, get the appropriate entry.
+                        new_row = row[:first_index] + \
+                                  (index[0],) + \
+                                  row[first_index+1:second_index] + \
+                                  (index[1],) + \
+                                  row[second_index+1:]
 
-                    temp_first = row[first_index]
-                    if type(temp_first) == dict:
-                        temp_first = temp_first[index[0]]
-                    temp_second = row[second_index]
-                    if type(temp_second) == dict:
-                        temp_second = temp_second[index[1]]
+                        # Add new row to list of row tuples
+                        old_attr_df_tuples.append(new_row)
 
-                    # Get nested test_data for this index.
-                    if type(temp_first) == dict:
-                        for k in temp_first:
-                            temp_attrs[first_name + '/' + k] = temp_first[k]
-                    if type(temp_second) == dict:
-                        for k in temp_second:
-                            temp_attrs[second_name + '/' + k] = temp_second[k]
+                        # Add key tuple to list of indices
+                        index_tuples.append((index[0],index[1]))
 
-                    # Add to the "new test_data" records.
-                    new_attr_df_dicts.append(temp_attrs)
+                        # If there's test_data in either of the columns add the test_data to the new attr test_data frame.
+                        temp_attrs = {}
 
-                    # Update progress bar
-                    pbar.update(update_interval)
+                        # Get a copy of the first cell value for this index.
+                        #  If it's a dict, get the appropriate entry.
 
-        # An expanded test_data frame with only the columns of the original test_data frame
-        df_1 = pd.DataFrame.from_records(old_attr_df_tuples,
-                                        columns=new_column_list)
+                        temp_first = row[first_index]
+                        if type(temp_first) == dict:
+                            temp_first = temp_first[index[0]]
+                        temp_second = row[second_index]
+                        if type(temp_second) == dict:
+                            temp_second = temp_second[index[1]]
 
-        # An expanded test_data frame containing any test_data held in value:key collections in the expanded cols
-        df_2 = pd.DataFrame.from_records(new_attr_df_dicts)
+                        # Get nested test_data for this index.
+                        if type(temp_first) == dict:
+                            for k in temp_first:
+                                temp_attrs[first_name + '/' + k] = temp_first[k]
+                        if type(temp_second) == dict:
+                            for k in temp_second:
+                                temp_attrs[second_name + '/' + k] = temp_second[k]
 
-        # The final expanded test_data set
-        df_out = pd.concat([df_1, df_2], axis=1)
+                        # Add to the "new test_data" records.
+                        new_attr_df_dicts.append(temp_attrs)
 
-        # Set new index
-        # index_cols has been depracated
-        # df_out = df_out.set_index(index_cols)
+                    # Report progress
+                    if (index_row + 1) % update_interval == 0:
+                        stage.update(update_interval)
 
-        # Drop unwanted columns
-        for col in drop:
-            if col in df_out.columns:
-                df_out = df_out.drop(col,1)
+                # An expanded test_data frame with only the columns of the original test_data frame
+                df_1 = pd.DataFrame.from_records(old_attr_df_tuples,
+                                                columns=new_column_list)
 
-        if drop_collections is True:
-            df_out = self._drop_collections(df_out)
+                # An expanded test_data frame containing any test_data held in value:key collections in the expanded cols
+                df_2 = pd.DataFrame.from_records(new_attr_df_dicts)
+
+                # The final expanded test_data set
+                df_out = pd.concat([df_1, df_2], axis=1)
+
+                # Drop unwanted columns
+                for col in drop:
+                    if col in df_out.columns:
+                        df_out = df_out.drop(columns=col)
+
+                if drop_collections is True:
+                    df_out = self._drop_collections(df_out)
+
+                yield df_out
 
-        return df_out
+            stage.update(count % update_interval)
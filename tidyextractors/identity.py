@@ -0,0 +1,299 @@
+# *********************************************************************************************
+# Copyright (C) 2017 Joel Becker,  Jillian Anderson, Steve McColl and Dr. John McLevey
+#
+# This file is part of the tidyextractors package developed for Dr John McLevey's Networks Lab
+# at the University of Waterloo. For more information, see
+# http://tidyextractors.readthedocs.io/en/latest/
+#
+# tidyextractors is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# tidyextractors is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with tidyextractors.
+# If not, see <http://www.gnu.org/licenses/>.
+# *********************************************************************************************
+
+import re
+import hashlib
+import unicodedata
+import numpy as np
+
+# Identity resolution across extractors. Every identity seen (a git author, an email address,
+#   a Twitter user) is reduced to keys: a normalized email address, a Twitter handle and,
+#   optionally, a key made from the tokens of a name. Identities sharing a key are merged with
+#   union-find, so the work is linear in the number of identities rather than pairwise. Since
+#   different people share names, a name is never enough on its own: name keys also hold the
+#   domain of the email address seen with the name.
+#   Each cluster's person_id is derived from its smallest key, so it does not depend on the
+#   order in which extractors were added.
+
+# Keys are prefixed by kind. Emails sort first, so they determine person ids where present.
+email_prefix = 'e:'
+handle_prefix = 'h:'
+name_prefix = 'n:'
+
+name_token_regex = re.compile(r'\w+')
+
+
+def normalize_email(address):
+    """
+    Normalizes an email address for matching: lower case, without surrounding brackets
+    or a "+tag" in the local part.
+    :param str address: An email address.
+    :return: The normalized address, or None if it is not an address.
+    """
+    if not isinstance(address, str):
+        return None
+    address = address.strip().strip('<>').strip().lower()
+    local, at, domain = address.rpartition('@')
+    if not at or not local or not domain:
+        return None
+    return local.split('+', 1)[0] + '@' + domain
+
+
+def name_key(name):
+    """
+    Makes a blocking key from a person's name: its lower case, accent-free tokens, sorted,
+    so "Becker, Joel" and "Joel Becker" share a key. Names with a single token (e.g. "admin")
+    are too ambiguous to match on.
+    :param str name: A name.
+    :return: The key, or None.
+    """
+    if not isinstance(name, str):
+        return None
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(c for c in name if not unicodedata.combining(c)).lower()
+    tokens = name_token_regex.findall(name)
+    if len(tokens) < 2:
+        return None
+    return ' '.join(sorted(tokens))
+
+
+def read_mailmap(path):
+    """
+    Reads a git .mailmap file.
+    :param str path: Path to the file.
+    :return: A list of (proper name, proper email, commit name, commit email) tuples, with None for missing parts.
+    """
+    entries = []
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.split('#', 1)[0]
+            parts = re.findall(r'([^<>]*)<([^<>]*)>', line)
+            if not parts:
+                continue
+            names = [n.strip() or None for n, e in parts]
+            emails = [e.strip() or None for n, e in parts]
+            if len(parts) == 1:
+                # Proper Name <commit@email>
+                entries.append((names[0], None, None, emails[0]))
+            else:
+                entries.append((names[0], emails[0], names[1], emails[1]))
+    return entries
+
+
+def person_id(key):
+    """
+    :param str key: A cluster's smallest key.
+    :return: A non-negative int64 identifier.
+    """
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big') >> 1
+
+
+class UnionFind(object):
+    """
+    Disjoint sets of integers 0..n-1, with path halving and union by size.
+    """
+
+    def __init__(self):
+        self.parent = []
+        self.size = []
+
+    def add(self):
+        """
+        :return: The new element.
+        """
+        self.parent.append(len(self.parent))
+        self.size.append(1)
+        return len(self.parent) - 1
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        i, j = self.find(i), self.find(j)
+        if i == j:
+            return i
+        if self.size[i] < self.size[j]:
+            i, j = j, i
+        self.parent[j] = i
+        self.size[i] += self.size[j]
+        return i
+
+
+class IdentityResolver(object):
+    """
+    Clusters the people seen by one or more extractors, and labels their tables with a person_id.
+
+    .. code-block:: python
+
+        resolver = IdentityResolver(mailmap='path/to/repo/.mailmap')
+        resolver.add_extractor(gx)
+        resolver.add_extractor(mx)
+        commits = gx.identify(gx.commits(), resolver)
+        emails = mx.identify(mx.emails(), resolver)
+
+    Identities are merged if they share a normalized email address or a Twitter handle. If
+    match_names is True, they are also merged if they share a name of at least two tokens and the
+    domain of their email addresses (e.g. "Joel Becker <jb@uwaterloo.ca>" and "Becker, Joel
+    <joel.becker@uwaterloo.ca>"). Adding identities may merge clusters and so change their
+    person_id, so add every extractor before labelling tables.
+
+    :param str mailmap: Optional. Path to a git .mailmap file, whose entries link commit emails to proper identities.
+    :param bool match_names: Defaults to False. If True, identities with the same name and email domain are merged.
+    """
+
+    def __init__(self, mailmap=None, match_names=False):
+        self.match_names = match_names
+        self._nodes = {}
+        self._sets = UnionFind()
+        self._ids = None
+        if mailmap is not None:
+            for proper_name, proper_email, commit_name, commit_email in read_mailmap(mailmap):
+                self._link(self._keys(proper_name, proper_email) + self._keys(email=commit_email))
+
+    def _keys(self, name=None, email=None, handle=None):
+        keys = []
+        email = normalize_email(email)
+        if email is not None:
+            keys.append(email_prefix + email)
+        if isinstance(handle, str) and handle.strip():
+            keys.append(handle_prefix + handle.strip().lstrip('@').lower())
+        if self.match_names and email is not None:
+            key = name_key(name)
+            if key is not None:
+                # A shared name only links identities with the same email domain
+                keys.append(name_prefix + key + '@' + email.rpartition('@')[2])
+        return keys
+
+    def _node(self, key):
+        node = self._nodes.get(key)
+        if node is None:
+            node = self._sets.add()
+            self._nodes[key] = node
+        return node
+
+    def add(self, name=None, email=None, handle=None):
+        """
+        Adds one identity, merging its keys into one cluster.
+        :param str name: Optional. A person's name.
+        :param str email: Optional. An email address.
+        :param str handle: Optional. A Twitter screen name.
+        :return: None
+        """
+        self._link(self._keys(name, email, handle))
+
+    def _link(self, keys):
+        if keys:
+            self._ids = None
+            first = self._node(keys[0])
+            for key in keys[1:]:
+                self._sets.union(first, self._node(key))
+
+    def add_frame(self, df, name_col=None, email_col=None, handle_col=None):
+        """
+        Adds the identities in a table. In a column of lists (e.g. To or Cc), each element is an identity.
+        :param pandas.DataFrame df: A table.
+        :param str name_col: Optional. Column of names.
+        :param str email_col: Optional. Column of email addresses.
+        :param str handle_col: Optional. Column of Twitter screen names.
+        :return: None
+        """
+        roles, cols = self._roles(name_col, email_col, handle_col)
+        seen = set()
+        for row in zip(*[df[c] for c in cols]):
+            if isinstance(row[0], list):
+                for value in row[0]:
+                    self.add(**{roles[0]: value})
+            elif row not in seen:
+                # Identical rows are common (e.g. one author's commits), so each is added once
+                seen.add(row)
+                self.add(**dict(zip(roles, row)))
+
+    @staticmethod
+    def _roles(name_col, email_col, handle_col):
+        pairs = [(r, c) for r, c in zip(['name', 'email', 'handle'], [name_col, email_col, handle_col]) if c is not None]
+        if not pairs:
+            raise ValueError('At least one of name_col, email_col and handle_col is required.')
+        return [r for r, c in pairs], [c for r, c in pairs]
+
+    def add_extractor(self, extractor):
+        """
+        Adds every identity extracted by an extractor.
+        :param BaseExtractor extractor: An extractor with identity columns (e.g. GitExtractor, MboxExtractor).
+        :return: None
+        """
+        data = extractor._identity_data()
+        for id_col, roles in extractor._identity_columns:
+            if all(col in data.columns for col in roles.values()):
+                self.add_frame(data, **{role + '_col': col for role, col in roles.items()})
+
+    def _resolve(self):
+        """
+        Assigns a person id to every cluster, from its smallest key.
+        :return: dict mapping nodes to person ids.
+        """
+        if self._ids is None:
+            smallest = {}
+            for key, node in self._nodes.items():
+                root = self._sets.find(node)
+                if root not in smallest or key < smallest[root]:
+                    smallest[root] = key
+            self._ids = {node: person_id(smallest[self._sets.find(node)]) for node in self._nodes.values()}
+        return self._ids
+
+    def person_id(self, name=None, email=None, handle=None):
+        """
+        :param str name: Optional. A person's name.
+        :param str email: Optional. An email address.
+        :param str handle: Optional. A Twitter screen name.
+        :return: The person id of the identity's cluster, or -1 if none of its keys have been added.
+        """
+        ids = self._resolve()
+        for key in self._keys(name, email, handle):
+            node = self._nodes.get(key)
+            if node is not None:
+                return ids[node]
+        return -1
+
+    def person_ids(self, df, name_col=None, email_col=None, handle_col=None):
+        """
+        Looks up the person id of each row of a table. Each distinct identity is looked up once.
+        :param pandas.DataFrame df: A table.
+        :param str name_col: Optional. Column of names.
+        :param str email_col: Optional. Column of email addresses.
+        :param str handle_col: Optional. Column of Twitter screen names.
+        :return: numpy.ndarray of int64, or a list of lists of ids for a column of lists.
+        """
+        roles, cols = self._roles(name_col, email_col, handle_col)
+        rows = list(zip(*[df[c] for c in cols]))
+        if any(isinstance(row[0], list) for row in rows):
+            return [[self.person_id(**{roles[0]: v}) for v in row[0]] for row in rows]
+        distinct = {}
+        codes = np.array([distinct.setdefault(row, len(distinct)) for row in rows], dtype=np.int64)
+        ids = np.array([self.person_id(**dict(zip(roles, row))) for row in distinct], dtype=np.int64)
+        return ids[codes] if len(ids) else codes
+
+    def __len__(self):
+        """
+        :return: Number of distinct people.
+        """
+        return len(set(self._resolve().values()))
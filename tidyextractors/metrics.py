@@ -0,0 +1,266 @@
+# *********************************************************************************************
+# Copyright (C) 2017 Joel Becker,  Jillian Anderson, Steve McColl and Dr. John McLevey
+#
+# This file is part of the tidyextractors package developed for Dr John McLevey's Networks Lab
+# at the University of Waterloo. For more information, see
+# http://tidyextractors.readthedocs.io/en/latest/
+#
+# tidyextractors is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# tidyextractors is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with tidyextractors.
+# If not, see <http://www.gnu.org/licenses/>.
+# *********************************************************************************************
+
+import os
+import sys
+import time
+import threading
+
+# Instrumentation for extractions. Extraction code reports its work in named stages
+#   (e.g. walking commits, parsing an mbox file), and a Metrics object passes each stage's
+#   progress and totals on to its consumers: progress bars, a callback, or a Prometheus
+#   text file. Consumers implement any of stage_start, stage_update and stage_end.
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of the current process.
+    :return: Bytes, or None where the resource module is unavailable (e.g. on Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class Stage(object):
+    """
+    A running extraction stage. Counts items, bytes read and calls to external processes or APIs.
+    Created by ``Metrics.stage``. Counting is thread safe.
+
+    :param Metrics metrics: The Metrics object the stage reports to.
+    :param str name: Stage name.
+    :param int total: Optional. Expected number of items.
+    :param str description: Optional. A human-readable description, used by progress bars.
+    """
+
+    def __init__(self, metrics, name, total=None, description=None):
+        self.metrics = metrics
+        self.name = name
+        self.total = total
+        self.description = description or name
+        self.items = 0
+        self.bytes = 0
+        self.calls = 0
+        self.start = None
+        self.seconds = None
+        self._lock = threading.Lock()
+
+    def update(self, items=1):
+        """
+        Counts processed items.
+        :param int items: Number of items.
+        :return: None
+        """
+        with self._lock:
+            self.items += items
+        self.metrics._dispatch('stage_update', self, items)
+
+    def add(self, bytes=0, calls=0):
+        """
+        Counts bytes read and calls made to external processes or APIs.
+        :param int bytes: Number of bytes.
+        :param int calls: Number of calls.
+        :return: None
+        """
+        with self._lock:
+            self.bytes += bytes
+            self.calls += calls
+
+    def record(self):
+        """
+        :return: A dictionary of the stage's name, seconds, items, bytes, calls and the process's peak RSS.
+        """
+        return {'stage': self.name,
+                'seconds': self.seconds,
+                'items': self.items,
+                'bytes': self.bytes,
+                'calls': self.calls,
+                'peak_rss_bytes': peak_rss()}
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.metrics._dispatch('stage_start', self)
+        return self
+
+    def __exit__(self, *args):
+        self.seconds = time.perf_counter() - self.start
+        self.metrics._finish(self)
+
+
+class Metrics(object):
+    """
+    Collects per-stage timings and counts during extraction and passes them to consumers.
+
+    Pass an instance to an extractor with the ``metrics`` keyword argument. By default,
+    extractors use ``Metrics([ProgressBars()])``, i.e. progress bars only. For example, to
+    collect stage records without progress bars:
+
+    .. code-block:: python
+
+        metrics = Metrics([Callback(print), PrometheusTextFile('extract.prom')])
+        gx = GitExtractor('path/to/repo', metrics=metrics)
+        metrics.totals()
+
+    :param list consumers: Optional. Objects with any of the ``stage_start(stage)``,
+     ``stage_update(stage, items)`` and ``stage_end(stage, record)`` methods.
+    """
+
+    def __init__(self, consumers=None):
+        self.consumers = list(consumers or [])
+        self.records = []
+
+    def stage(self, name, total=None, description=None):
+        """
+        Starts a stage. Use as a context manager.
+        :param str name: Stage name.
+        :param int total: Optional. Expected number of items.
+        :param str description: Optional. A human-readable description.
+        :return: Stage
+        """
+        return Stage(self, name, total=total, description=description)
+
+    def _dispatch(self, event, *args):
+        for consumer in self.consumers:
+            handler = getattr(consumer, event, None)
+            if handler is not None:
+                handler(*args)
+
+    def _finish(self, stage):
+        record = stage.record()
+        self.records.append(record)
+        self._dispatch('stage_end', stage, record)
+
+    def totals(self):
+        """
+        Sums the records of stages with the same name (e.g. one stage per mbox file).
+        :return: A dictionary mapping stage names to dictionaries of seconds, items, bytes, calls and peak RSS.
+        """
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record['stage'], {'seconds': 0.0, 'items': 0, 'bytes': 0, 'calls': 0,
+                                                        'peak_rss_bytes': None})
+            for key in ['seconds', 'items', 'bytes', 'calls']:
+                total[key] += record[key]
+            if record['peak_rss_bytes'] is not None:
+                total['peak_rss_bytes'] = max(total['peak_rss_bytes'] or 0, record['peak_rss_bytes'])
+        return totals
+
+
+class ProgressBars(object):
+    """
+    A Metrics consumer that shows a tqdm progress bar for each stage.
+    """
+
+    def __init__(self):
+        self._bars = {}
+
+    def stage_start(self, stage):
+        import tqdm
+        bar = tqdm.tqdm(total=stage.total)
+        bar.set_description(stage.description)
+        self._bars[id(stage)] = bar
+
+    def stage_update(self, stage, items):
+        bar = self._bars.get(id(stage))
+        if bar is not None:
+            bar.update(items)
+
+    def stage_end(self, stage, record):
+        bar = self._bars.pop(id(stage), None)
+        if bar is not None:
+            bar.close()
+
+
+class Callback(object):
+    """
+    A Metrics consumer that calls a function with each finished stage's record.
+
+    :param func: A function taking one argument, a record dictionary (see ``Stage.record``).
+    """
+
+    def __init__(self, func):
+        self.func = func
+
+    def stage_end(self, stage, record):
+        self.func(record)
+
+
+class PrometheusTextFile(object):
+    """
+    A Metrics consumer that writes stage totals in the Prometheus text format, e.g. for the
+    node_exporter textfile collector. The file is rewritten (atomically) whenever a stage ends.
+
+    :param str path: Output file path.
+    :param dict labels: Optional. Labels added to every sample, e.g. ``{'job': 'mailing-lists'}``.
+    :param str prefix: Metric name prefix.
+    """
+
+    # Metric names, help strings and the record keys they report.
+    metrics = [('stage_seconds', 'Time spent in each extraction stage.', 'seconds'),
+               ('stage_items', 'Items processed in each extraction stage.', 'items'),
+               ('stage_bytes', 'Bytes read in each extraction stage.', 'bytes'),
+               ('stage_calls', 'Subprocess or API calls made in each extraction stage.', 'calls')]
+
+    def __init__(self, path, labels=None, prefix='tidyextractors'):
+        self.path = path
+        self.labels = labels or {}
+        self.prefix = prefix
+
+    def _labels(self, **extra):
+        labels = dict(self.labels, **extra)
+        return ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                        for k, v in sorted(labels.items()))
+
+    def render(self, totals):
+        """
+        :param dict totals: Stage totals, as returned by ``Metrics.totals``.
+        :return: The text file contents.
+        """
+        lines = []
+        for name, help_text, key in self.metrics:
+            lines.append('# HELP {}_{} {}'.format(self.prefix, name, help_text))
+            lines.append('# TYPE {}_{} gauge'.format(self.prefix, name))
+            for stage in sorted(totals):
+                lines.append('{}_{}{{{}}} {}'.format(self.prefix, name, self._labels(stage=stage),
+                                                     totals[stage][key]))
+        rss = [t['peak_rss_bytes'] for t in totals.values() if t['peak_rss_bytes'] is not None]
+        if rss:
+            lines.append('# HELP {}_peak_rss_bytes Peak resident set size of the process.'.format(self.prefix))
+            lines.append('# TYPE {}_peak_rss_bytes gauge'.format(self.prefix))
+            labels = self._labels()
+            lines.append('{}_peak_rss_bytes{} {}'.format(self.prefix, '{' + labels + '}' if labels else '',
+                                                         max(rss)))
+        return '\n'.join(lines) + '\n'
+
+    def stage_end(self, stage, record):
+        temp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(temp_path, 'w') as f:
+            f.write(self.render(stage.metrics.totals()))
+        os.replace(temp_path, self.path)
+
+
+def default_metrics():
+    """
+    :return: A Metrics object with progress bars only, as used when no Metrics object is given.
+    """
+    return Metrics([ProgressBars()])
@@ -0,0 +1,44 @@
+# *********************************************************************************************
+# Copyright (C) 2017 Joel Becker,  Jillian Anderson, Steve McColl and Dr. John McLevey
+#
+# This file is part of the tidyextractors package developed for Dr John McLevey's Networks Lab
+# at the University of Waterloo. For more information, see
+# http://tidyextractors.readthedocs.io/en/latest/
+#
+# tidyextractors is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# tidyextractors is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with tidyextractors.
+# If not, see <http://www.gnu.org/licenses/>.
+# *********************************************************************************************
+
+import numpy as np
+
+# Lists of strings are stored in NumPy archives (.npz) as one byte array, since
+#   arrays of Python objects can only be saved with pickle.
+
+
+def pack_strings(strings):
+    """
+    Packs strings into a byte array, separated by NUL characters.
+    :param strings: A list of strings.
+    :return: numpy.ndarray of uint8
+    """
+    return np.frombuffer('\0'.join(strings).encode('utf-8'), dtype=np.uint8)
+
+
+def unpack_strings(packed, count):
+    """
+    Reverses pack_strings.
+    :param packed: numpy.ndarray of uint8
+    :param count: Number of strings.
+    :return: A list of strings.
+    """
+    if count == 0:
+        return []
+    return packed.tobytes().decode('utf-8').split('\0')
@@ -0,0 +1,201 @@
+# *********************************************************************************************
+# Copyright (C) 2017 Joel Becker,  Jillian Anderson, Steve McColl and Dr. John McLevey
+#
+# This file is part of the tidyextractors package developed for Dr John McLevey's Networks Lab
+# at the University of Waterloo. For more information, see
+# http://tidyextractors.readthedocs.io/en/latest/
+#
+# tidyextractors is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# tidyextractors is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with tidyextractors.
+# If not, see <http://www.gnu.org/licenses/>.
+# *********************************************************************************************
+
+import os
+import re
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from tidyextractors.metrics import default_metrics
+from tidyextractors.string_packing import pack_strings, unpack_strings
+
+# A positional inverted index over a column of text. For each term, the (row, position) pairs
+#   of its occurrences are stored sorted, in compressed sparse row layout: the postings of
+#   term i are postings[ptr[i]:ptr[i+1]]. Terms are looked up with array slices, and phrases
+#   by intersecting the postings of their terms, shifted by their offset in the phrase.
+#   Blocks of rows are tokenized in parallel by worker processes, then merged.
+
+token_regex = re.compile(r'\w+')
+phrase_regex = re.compile(r'"([^"]*)"')
+
+# Default number of rows tokenized by a worker process at a time.
+default_block_size = 10000
+
+
+def tokenize(text):
+    """
+    :param str text: Text, or None.
+    :return: A list of lower case word tokens.
+    """
+    if not isinstance(text, str):
+        return []
+    return token_regex.findall(text.lower())
+
+
+def index_block(start, texts):
+    """
+    Tokenizes a block of rows. Runs in worker processes.
+    :param int start: Row id of the first text.
+    :param list texts: Texts.
+    :return: A tuple of (list of terms, and arrays of term ids, row ids and positions of each token).
+    """
+    vocabulary = {}
+    term_ids, rows, positions = [], [], []
+    for row, text in enumerate(texts, start):
+        for position, token in enumerate(tokenize(text)):
+            term_ids.append(vocabulary.setdefault(token, len(vocabulary)))
+            rows.append(row)
+            positions.append(position)
+    return (list(vocabulary), np.array(term_ids, dtype=np.int64), np.array(rows, dtype=np.int64),
+            np.array(positions, dtype=np.int32))
+
+
+class TextIndex(object):
+    """
+    A positional inverted index over a column of text, identifying matches by row id.
+
+    :param list terms: Sorted terms, indexed by term id.
+    :param numpy.ndarray term_ptr: CSR offsets into rows and positions, one more than the number of terms.
+    :param numpy.ndarray rows: Row ids of each occurrence, sorted by term, row and position.
+    :param numpy.ndarray positions: Token positions of each occurrence within its row.
+    :param int count: Number of rows indexed.
+    """
+
+    def __init__(self, terms, term_ptr, rows, positions, count):
+        self.terms = terms
+        self.term_ptr = term_ptr
+        self.rows = rows
+        self.positions = positions
+        self.count = count
+        self._term_ids = None
+
+    @classmethod
+    def build(cls, texts, workers=None, block_size=default_block_size, metrics=None):
+        """
+        Indexes texts, tokenizing blocks of rows in parallel.
+        :param texts: An iterable of strings (or None), one per row.
+        :param int workers: Number of worker processes. Defaults to the number of cores.
+         With 1, or a single block, texts are tokenized in this process.
+        :param int block_size: Number of rows tokenized by a worker at a time.
+        :param metrics: Optional Metrics object, which receives a 'text_index' stage.
+        :return: TextIndex
+        """
+        if metrics is None:
+            metrics = default_metrics()
+
+        texts = list(texts)
+        starts = list(range(0, len(texts), block_size))
+        blocks = [texts[start:start + block_size] for start in starts]
+
+        vocabulary = {}
+        parts = []
+        parallel = workers != 1 and len(blocks) > 1
+        with metrics.stage('text_index', total=len(texts), description='Indexing text...') as stage, \
+                ProcessPoolExecutor(max_workers=(workers or os.cpu_count() or 1) if parallel else 1) as pool:
+            results = pool.map(index_block, starts, blocks) if parallel else map(index_block, starts, blocks)
+            for block, (terms, term_ids, rows, positions) in zip(blocks, results):
+                # Map the block's term ids to global ones
+                to_global = np.array([vocabulary.setdefault(t, len(vocabulary)) for t in terms], dtype=np.int64)
+                parts.append((to_global[term_ids] if len(term_ids) else term_ids, rows, positions))
+                stage.update(len(block))
+                stage.add(calls=int(parallel))
+
+        terms = sorted(vocabulary)
+        rank = np.empty(len(terms), dtype=np.int64)
+        rank[[vocabulary[t] for t in terms]] = np.arange(len(terms))
+        term_ids = rank[np.concatenate([p[0] for p in parts])] if parts else np.array([], dtype=np.int64)
+        rows = np.concatenate([p[1] for p in parts]) if parts else np.array([], dtype=np.int64)
+        positions = np.concatenate([p[2] for p in parts]) if parts else np.array([], dtype=np.int32)
+
+        order = np.lexsort((positions, rows, term_ids))
+        term_ptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(terms)), out=term_ptr[1:])
+        index = cls(terms, term_ptr, rows[order], positions[order], len(texts))
+        index._term_ids = {t: i for i, t in enumerate(terms)}
+        return index
+
+    def _postings(self, term):
+        if self._term_ids is None:
+            self._term_ids = {t: i for i, t in enumerate(self.terms)}
+        i = self._term_ids.get(term)
+        if i is None:
+            return self.rows[:0], self.positions[:0]
+        return self.rows[self.term_ptr[i]:self.term_ptr[i + 1]], self.positions[self.term_ptr[i]:self.term_ptr[i + 1]]
+
+    def term(self, term):
+        """
+        :param str term: A word. Matching ignores case.
+        :return: numpy.ndarray of the sorted ids of rows containing the word.
+        """
+        tokens = tokenize(term)
+        if len(tokens) != 1:
+            return self.phrase(term)
+        return np.unique(self._postings(tokens[0])[0])
+
+    def phrase(self, text):
+        """
+        :param str text: Words that must appear consecutively. Matching ignores case and punctuation.
+        :return: numpy.ndarray of the sorted ids of rows containing the phrase.
+        """
+        tokens = tokenize(text)
+        if not tokens:
+            return self.rows[:0]
+        matches = None
+        for offset, token in enumerate(tokens):
+            rows, positions = self._postings(token)
+            keep = positions >= offset
+            # Occurrences are keyed by the row and the position the phrase would start at
+            keys = (rows[keep] << 32) | (positions[keep] - offset).astype(np.int64)
+            matches = keys if matches is None else np.intersect1d(matches, keys, assume_unique=True)
+            if len(matches) == 0:
+                break
+        return np.unique(matches >> 32)
+
+    def search(self, query):
+        """
+        Finds rows containing every word and "quoted phrase" of a query.
+        :param str query: E.g. 'release "pull request"'.
+        :return: numpy.ndarray of sorted row ids.
+        """
+        phrases = phrase_regex.findall(query)
+        words = tokenize(phrase_regex.sub(' ', query))
+        result = None
+        for rows in [self.phrase(p) for p in phrases] + [self.term(w) for w in words]:
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+        return self.rows[:0] if result is None else result
+
+    def save(self, file):
+        """
+        Saves the index in NumPy's .npz format.
+        :param file: File path or file object.
+        :return: None
+        """
+        np.savez(file, term_ptr=self.term_ptr, rows=self.rows, positions=self.positions,
+                 terms=pack_strings(self.terms), counts=np.array([len(self.terms), self.count]))
+
+    @classmethod
+    def load(cls, file):
+        """
+        Loads an index saved with ``save``.
+        :param file: File path or file object.
+        :return: TextIndex
+        """
+        with np.load(file) as data:
+            term_count, count = (int(c) for c in data['counts'])
+            return cls(unpack_strings(data['terms'], term_count), data['term_ptr'], data['rows'],
+                       data['positions'], count)
@@ -17,4 +17,6 @@
 # If not, see <http://www.gnu.org/licenses/>.
 # *********************************************************************************************
 
-from tidyextractors.tidygit.git_extractor import GitExtractor
\ No newline at end of file
+from tidyextractors.tidygit.git_extractor import GitExtractor
+from tidyextractors.tidygit.path_index import PathIndex
+from tidyextractors.tidygit.sha_index import ShaIndex
\ No newline at end of file
@@ -0,0 +1,93 @@
+# *********************************************************************************************
+# Copyright (C) 2017 Joel Becker,  Jillian Anderson, Steve McColl and Dr. John McLevey
+#
+# This file is part of the tidyextractors package developed for Dr John McLevey's Networks Lab
+# at the University of Waterloo. For more information, see
+# http://tidyextractors.readthedocs.io/en/latest/
+#
+# tidyextractors is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# tidyextractors is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with tidyextractors.
+# If not, see <http://www.gnu.org/licenses/>.
+# *********************************************************************************************
+
+import os
+import json
+import hashlib
+import threading
+
+# The id of git's empty tree. Root commits are diffed against it.
+empty_tree_sha = '4b825dc642cb6eb9a060e54bf8d69288fbee4904'
+
+
+class DiffCache(object):
+    """
+    A content-addressed, on-disk cache of per-commit diff records.
+
+    Entries are keyed by (parent sha, commit sha). Since both are content hashes, an entry
+    never goes stale and can be shared between repeated extractions, branches and clones of
+    the same repository. Entries are stored as small JSON files, fanned out into
+    subdirectories in the same way git stores loose objects.
+
+    :param str directory: The cache directory. Created if it does not exist.
+    :param str namespace: Separates entries computed with different diff options.
+    """
+
+    def __init__(self, directory, namespace=''):
+        self.directory = directory
+        self.namespace = namespace
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, parent, sha):
+        """
+        Computes the cache key for a commit/parent pair.
+
+        :param str parent: Parent commit sha, or None for root commits.
+        :param str sha: Commit sha.
+        :return: A hex digest string.
+        """
+        parent = empty_tree_sha if parent is None else parent
+        raw = '{}:{}:{}'.format(self.namespace, parent, sha)
+        return hashlib.sha1(raw.encode('ascii')).hexdigest()
+
+    def _path(self, parent, sha):
+        key = self.key(parent, sha)
+        return os.path.join(self.directory, key[:2], key[2:] + '.json')
+
+    def get(self, parent, sha):
+        """
+        Looks up the diff records for a commit/parent pair.
+
+        :param str parent: Parent commit sha, or None for root commits.
+        :param str sha: Commit sha.
+        :return: A list of diff records, or None if the pair is not cached.
+        """
+        try:
+            with open(self._path(parent, sha)) as f:
+                return [tuple(record) for record in json.load(f)]
+        except (IOError, ValueError):
+            return None
+
+    def put(self, parent, sha, records):
+        """
+        Stores the diff records for a commit/parent pair.
+
+        :param str parent: Parent commit sha, or None for root commits.
+        :param str sha: Commit sha.
+        :param list records: Diff records, as produced by ``numstat_pool.parse_diff_tree``.
+        :return: None
+        """
+        path = self._path(parent, sha)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write then rename, so concurrent readers never see a partial entry.
+        temp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        with open(temp_path, 'w') as f:
+            json.dump(records, f)
+        os.replace(temp_path, path)
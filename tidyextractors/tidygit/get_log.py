@@ -18,9 +18,10 @@
 # *********************************************************************************************
 
 import git
-import tqdm
 import pandas as pd
+from tidyextractors.metrics import default_metrics
 from tidyextractors.tidygit.git_object_handlers import git_object_handlers_lookup
+from tidyextractors.tidygit.numstat_pool import numstat_pool, iter_numstat_batches, default_batch_size
 
 # TODO: Increase get_log efficiency i.e. using gitnet implementation
 
@@ -36,6 +37,11 @@ simple_attributes = ['author',
                      'type'
                      ]
 
+# Commit statistics summed by windowed activity aggregates, and the columns they come from.
+activity_fields = ['lines', 'insertions', 'deletions', 'files']
+activity_columns = ['total_' + field for field in activity_fields]
+
+
 def handle_object(name, obj):
     """
     This helper function handles incoming test_data for make_object_dict.
@@ -72,28 +78,90 @@ def make_object_dict(obj, keep=[]):
     return data
 
 
-def extract_log(rpath,extract=simple_attributes):
+def list_refs(rpath):
+    """
+    Lists the branches, remote branches and tags of a local repository.
+    Symbolic refs (e.g. origin/HEAD) are skipped, since they duplicate other refs.
+    :param rpath: The path to a local Git repo.
+    :return: A list of (ref name, commit sha) tuples, sorted by ref name.
+    """
+    m_repo = git.Repo(rpath)
+    refs = []
+    for ref in m_repo.refs:
+        if ref.path.endswith('/HEAD'):
+            continue
+        try:
+            refs.append((ref.name, ref.commit.hexsha))
+        except ValueError:
+            # Tags that point to something other than a commit.
+            continue
+    return sorted(refs)
+
+
+def extract_log(rpath,extract=simple_attributes,workers=None,batch_size=default_batch_size,
+                detailed_changes=False,cache_dir=None,refs=None,metrics=None,activity=None,activity_by='author_email'):
     """
     Extracts Git commit test_data from a local repository.
+    Per-file statistics ('stats') are computed in parallel by numstat_pool
+    rather than serially through GitPython.
+
+    Each commit gets a 'parents' list of parent shas. If refs are given, the union of the
+    commit graphs reachable from them is walked once, in topological order, and each commit
+    also gets a 'refs' bitset, where bit i is set if the commit is reachable from refs[i].
+
+    'authored_datetime' is a UTC datetime64 column built from 'authored_date' (epoch seconds).
+    The author's UTC offset is in 'author_tz_offset', in seconds west of UTC.
     :param rpath: The path to a local Git repo.
     :param extract: A list of attribute name strings.
+    :param workers: Number of concurrent git processes for file statistics. Defaults to the number of cores.
+    :param batch_size: Number of commits handled by each git process.
+    :param detailed_changes: If True, changes are rename-aware and include paths, change type and blob ids.
+    :param cache_dir: Optional directory for a persistent cache of per-commit diffs.
+    :param refs: Optional list of (ref name, commit sha) tuples, as produced by list_refs.
+     Defaults to walking from HEAD only.
+    :param metrics: Optional Metrics object, which receives the 'git_walk' and 'git_numstat' stages.
+    :param activity: Optional WindowedAggregate with the fields of activity_fields, to which each
+     commit is added as its statistics arrive.
+    :param activity_by: The column that activity is grouped by.
     :return: A Pandas dataframe containing Git commit test_data.
     """
+    if metrics is None:
+        metrics = default_metrics()
+
     # Get repo
     m_repo = git.Repo(rpath)
 
+    # Stats are filled in after the commit walk
+    get_stats = 'stats' in extract
+
+    # Datetimes are built from epoch seconds in one step after the walk, rather than one object per commit
+    get_datetimes = 'authored_datetime' in extract
+    extract = [attr for attr in extract if attr not in ('stats', 'authored_datetime')]
+    if get_datetimes and 'authored_date' not in extract:
+        extract.append('authored_date')
+    pairs = []
+
+    # Walk from HEAD, or from every ref children-first so that membership can be propagated to parents
+    if refs is None:
+        rev, walk_args = None, {}
+    else:
+        rev, walk_args = sorted(set(sha for name, sha in refs)), {'topo_order': True}
+        membership = {}
+        for i, (name, sha) in enumerate(refs):
+            membership[sha] = membership.get(sha, 0) | (1 << i)
+
     # Count commits
     count = 0
-    m_commits = m_repo.iter_commits()
+    m_commits = m_repo.iter_commits(rev, **walk_args)
     for commit in m_commits:
         count += 1
 
-    # Initialize progress bar and index
+    # Initialize progress reporting and index
 
-    with tqdm.tqdm(total=count) as pbar:
+    with metrics.stage('git_walk', total=count, description='Extracting commits...') as stage:
 
         # Get commits again
-        m_commits = m_repo.iter_commits()
+        m_commits = m_repo.iter_commits(rev, **walk_args)
 
         # Setup test_data extraction
         update_interval = max(min(count//100,100),5)
@@ -106,15 +174,85 @@ def extract_log(rpath,extract=simple_attributes):
             # Add the next commit to the buffer
             try:
                 next_commit = next(m_commits)
-                buffer.append(make_object_dict(next_commit,extract))
+                row = make_object_dict(next_commit,extract)
+                parents = [p.hexsha for p in next_commit.parents]
+                row['parents'] = parents
+                if refs is not None:
+                    row['refs'] = membership.pop(next_commit.hexsha, 0)
+                    for p in parents:
+                        membership[p] = membership.get(p, 0) | row['refs']
+                buffer.append(row)
+                if get_stats:
+                    pairs.append((next_commit.hexsha, parents[0] if parents else None))
                 index += 1
                 if index%update_interval == 0:
-                    pbar.update(update_interval)
+                    stage.update(update_interval)
 
             # If no more commits, clear the buffer
             except StopIteration:
                 break
 
+        stage.update(index % update_interval)
+
+    # Add per-file statistics
+    if get_stats:
+        all_stats = numstat_pool(m_repo.git_dir, pairs, workers=workers, batch_size=batch_size,
+                                 detailed=detailed_changes, cache_dir=cache_dir, metrics=metrics)
+        for row, (sha, parent) in zip(buffer, pairs):
+            row.update(handle_object('stats', all_stats[sha]))
+            if activity is not None:
+                activity.add(row[activity_by], row['authored_date'], *[row[col] for col in activity_columns])
+
     # final_df = pd.concat(sub_df_list)
-    return pd.DataFrame(buffer)
+    df = pd.DataFrame(buffer)
+    if 'authored_date' in df.columns:
+        df['authored_date'] = df['authored_date'].astype('int64')
+        if get_datetimes:
+            df['authored_datetime'] = pd.to_datetime(df['authored_date'], unit='s', utc=True)
+    if 'author_tz_offset' in df.columns:
+        df['author_tz_offset'] = df['author_tz_offset'].astype('int32')
+    return df
+
+
+
+def stream_activity(rpath, activity, by='author_email', workers=None, batch_size=default_batch_size,
+                    cache_dir=None, metrics=None):
+    """
+    Aggregates commit activity without building a table of commits. Commits are walked from HEAD
+    and diffed in batches as they are walked, and only the authors of the batches in flight and
+    the aggregate's (author, window) groups are kept.
+    :param rpath: The path to a local Git repo.
+    :param activity: A WindowedAggregate with the fields of activity_fields.
+    :param by: 'author_email' or 'author_name'. The column that activity is grouped by.
+    :param workers: Number of concurrent git processes for file statistics. Defaults to the number of cores.
+    :param batch_size: Number of commits handled by each git process.
+    :param cache_dir: Optional directory for a persistent cache of per-commit diffs.
+    :param metrics: Optional Metrics object, which receives the 'git_numstat' stage.
+    :return: None
+    """
+    if by not in ('author_email', 'author_name'):
+        raise ValueError("Activity can only be grouped by 'author_email' or 'author_name'.")
+
+    m_repo = git.Repo(rpath)
+
+    # Author and time of each commit in flight, by sha
+    authors = {}
+
+    def iter_batches():
+        batch = []
+        for commit in m_repo.iter_commits():
+            authors[commit.hexsha] = (make_object_dict(commit, ['author'])[by], commit.authored_date)
+            batch.append((commit.hexsha, commit.parents[0].hexsha if commit.parents else None))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
 
+    for batch, records in iter_numstat_batches(m_repo.git_dir, iter_batches(), workers=workers,
+                                               cache_dir=cache_dir, metrics=metrics):
+        for sha, parent in batch:
+            key, date = authors.pop(sha)
+            insertions = sum(record[5] for record in records[sha])
+            deletions = sum(record[6] for record in records[sha])
+            activity.add(key, date, insertions + deletions, insertions, deletions, len(records[sha]))
@@ -17,8 +17,30 @@
 # If not, see <http://www.gnu.org/licenses/>.
 # *********************************************************************************************
 
+import numpy as np
+import pandas as pd
 from tidyextractors import BaseExtractor
-from tidyextractors.tidygit.get_log import extract_log
+from tidyextractors.arrow_output import explode, convert
+from tidyextractors.aggregates import WindowedAggregate, week
+from tidyextractors.tidygit.get_log import extract_log, list_refs, stream_activity, activity_fields, activity_columns
+from tidyextractors.tidygit.numstat_pool import default_batch_size
+from tidyextractors.tidygit.git_graph import author_file_matrix, commit_dag_matrix, intern
+from tidyextractors.tidygit.path_index import PathIndex
+from tidyextractors.tidygit.sha_index import ShaIndex
+
+
+def epoch_seconds(value):
+    """
+    Converts a time to epoch seconds.
+    :param value: A datetime, string or number of epoch seconds. Times without a time zone are taken as UTC.
+    :return: int
+    """
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return int(value)
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize('UTC')
+    return int(ts.timestamp())
 
 
 class GitExtractor(BaseExtractor):
@@ -30,38 +52,186 @@ class GitExtractor(BaseExtractor):
     :param str source: The path to a local git repository
     :param bool auto_extract: Defaults to True. If True, data is extracted automatically.
      Otherwise, extraction must be initiated through the internal interface.
+    :param int workers: Optional. Number of concurrent git processes used to compute
+     per-file change statistics. Defaults to the number of available cores.
+    :param int batch_size: Optional. Number of commits handled by each git process.
+    :param bool detailed_changes: Defaults to False. If True, renames are detected and each change
+     also records its old path, new path, change type and old/new blob ids.
+    :param str cache_dir: Optional. A directory in which per-commit diffs are cached between runs.
+    :param bool all_refs: Defaults to False. If True, commits reachable from any branch, remote branch
+     or tag are extracted (each only once), instead of only those reachable from HEAD. Commits then have
+     a ``refs`` bitset column; see ``ref_names``. In either case, commits have a ``parents`` column.
+    :param bool path_index: Defaults to False. If True, the file/commit index used by ``file_history``,
+     ``co_changes`` and ``file_owners`` is built during extraction. Otherwise it is built on first use.
+    :param bool encode: Defaults to False. If True, file paths (the keys of ``changes`` and the ``file`` column)
+     and the ``author_name`` and ``author_email`` columns hold integer codes rather than strings, which saves
+     memory on large repositories. Codes index into ``labels(column)``, and output methods decode them on request.
+    :param int activity_window: Optional. If given, the per-author activity counted by ``activity`` is
+     aggregated into windows of this many seconds as commits are extracted. The commit data is still
+     extracted and held as usual. To aggregate activity without extracting it, use ``activity_from``.
     """
-    def _extract(self, source, *args, **kwargs):
+
+    # Names of the refs walked in all_refs mode. Bit i of the refs column corresponds to ref_names[i].
+    ref_names = None
+
+    # Changes become lists of structs in Arrow output, keyed by file
+    _key_names = {'changes': 'file'}
+
+    # Commit authors
+    _identity_columns = [('person_id', {'name': 'author_name', 'email': 'author_email'})]
+
+    # Inverted index between files and commits. Built during extraction, or on first use.
+    _path_index = None
+
+    # Labels of integer-coded columns, by column name. Set if extracted with encode=True.
+    _labels = None
+
+    # Commits, lines and files changed per author and time window. Built during extraction, or on first use.
+    _activity = None
+
+    # Full shas of the extracted commits. Built during extraction.
+    _sha_index = None
+
+    # Length of the abbreviated shas in the hexsha and parents columns.
+    sha_length = 7
+
+    def _extract(self, source, workers=None, batch_size=default_batch_size, detailed_changes=False,
+                 cache_dir=None, all_refs=False, path_index=False, encode=False, activity_window=None,
+                 *args, **kwargs):
         """
         Extracts data from a local git repository. Mutates _data.
         :param str source: The path to a local git repository.
+        :param int workers: Number of concurrent git processes. Defaults to the number of cores.
+        :param int batch_size: Number of commits handled by each git process.
+        :param bool detailed_changes: If True, changes are rename-aware and include blob ids.
+        :param str cache_dir: Optional directory for a persistent diff cache.
+        :param bool all_refs: If True, walk every ref instead of HEAD only.
+        :param bool path_index: If True, build the file/commit index.
+        :param bool encode: If True, store paths and author names/emails as integer codes.
+        :param int activity_window: Optional window width in seconds for activity aggregated during extraction.
         :param args: Arbitrary arguments for extensibility.
         :param kwargs: Arbitrary keyword arguments for extensibility.
 
         :return: None
         """
+        # Get refs
+        refs = None
+        if all_refs:
+            refs = list_refs(source)
+            self.ref_names = [name for name, sha in refs]
+
+        if activity_window is not None:
+            self._activity = WindowedAggregate(activity_window, fields=activity_fields)
+
         # Extract git test_data
-        self._data = extract_log(source)
+        self._data = extract_log(source, workers=workers, batch_size=batch_size,
+                                 detailed_changes=detailed_changes, cache_dir=cache_dir, refs=refs,
+                                 metrics=self.metrics, activity=self._activity)
+
+        # Keep full hashes in binary, then shorten them to the shortest unique length (at least 7)
+        self._sha_index = ShaIndex.from_hex(self._data['hexsha'])
+        self.sha_length = n = self._sha_index.unique_length()
+        self._data['hexsha'] = self._data['hexsha'].str[:n]
+        self._data['parents'] = [[s[:n] for s in l] for l in self._data['parents']]
+
+        if encode:
+            self._encode()
+
+        if path_index:
+            self._get_path_index()
+
+    def _encode(self):
+        """
+        Replaces file paths and author names/emails with integer codes. Mutates _data.
+
+        :return: None
+        """
+        self._labels = {}
+        for col in ['author_name', 'author_email']:
+            codes, uniques = pd.factorize(self._data[col])
+            self._data[col] = codes.astype(np.int32)
+            self._labels[col] = list(uniques)
+
+        path_index, paths = {}, []
+        self._data['changes'] = [{intern(path, path_index, paths): attrs for path, attrs in changes.items()}
+                                 for changes in self._data['changes']]
+        self._labels['file'] = paths
+
+    def _identity_data(self, df=None):
+        """
+        Returns a table with decoded author columns.
 
-        # Shorten hashes
-        self._data['hexsha'] = self._data['hexsha'].apply(lambda s: s[:7])
+        :param pandas.DataFrame df: Defaults to ``self._data``.
+        :return: pandas.DataFrame
+        """
+        df = self._data if df is None else df
+        return self.decode(df[[col for col in ['author_name', 'author_email'] if col in df.columns]])
+
+    def labels(self, column):
+        """
+        Returns the strings that an integer-coded column's codes stand for. Requires extraction with ``encode=True``.
 
-    def commits(self, drop_collections=True):
+        :param str column: 'file', 'author_name' or 'author_email'.
+        :return: list, where the label of code i is at position i.
+        """
+        if self._labels is None:
+            raise ValueError('Labels require extraction with encode=True.')
+        return self._labels[column]
+
+    def decode(self, df):
+        """
+        Replaces integer codes with strings in a table produced by this extractor. Tables from extractors
+        created without ``encode=True`` are returned unchanged.
+
+        :param pandas.DataFrame df: A table with coded columns (e.g. from ``commits`` or ``changes``).
+        :return: pandas.DataFrame
+        """
+        if self._labels is None:
+            return df
+        out_df = df.copy()
+        for col in ['author_name', 'author_email', 'file']:
+            if col in out_df.columns:
+                labels = np.array(self._labels[col] + [None], dtype=object)
+                # Code -1 (missing) selects the trailing None
+                out_df[col] = labels[out_df[col].to_numpy()]
+        if 'changes' in out_df.columns:
+            paths = self._labels['file']
+            out_df['changes'] = [{paths[code]: attrs for code, attrs in changes.items()} for changes in out_df['changes']]
+        return out_df
+
+    def commits(self, drop_collections=True, ref=None, decode=False, since=None, until=None):
         """
         Returns a table of git log data, with "commits" as rows/observations.
 
         :param bool drop_collections: Defaults to True. Indicates whether columns with lists/dicts/sets will be dropped.
+        :param str ref: Optional. Only return commits reachable from this ref. Requires ``all_refs=True``.
+        :param since: Optional. Only return commits authored at or after this time. A datetime, a string
+         (e.g. '2017-06-01') or epoch seconds. Times without a time zone are taken as UTC.
+        :param until: Optional. Only return commits authored before this time. As for since.
+        :param bool decode: Defaults to False. If True, integer-coded columns are decoded to strings.
+         Only applies to extraction with ``encode=True``.
 
-        :return: pandas.DataFrame
+        :return: pandas.DataFrame (or pyarrow.Table or polars.DataFrame, depending on the backend)
         """
         base_df = self._data
+        if ref is not None:
+            if self.ref_names is None:
+                raise ValueError('Filtering by ref requires extraction with all_refs=True.')
+            bit = 1 << self.ref_names.index(ref)
+            base_df = base_df[base_df['refs'].map(lambda r: r & bit != 0)]
+        if since is not None:
+            base_df = base_df[base_df['authored_date'].to_numpy() >= epoch_seconds(since)]
+        if until is not None:
+            base_df = base_df[base_df['authored_date'].to_numpy() < epoch_seconds(until)]
         if drop_collections is True:
             out_df = self._drop_collections(base_df)
         else:
             out_df = base_df
-        return out_df
+        if decode is True:
+            out_df = self.decode(out_df)
+        return self._output(out_df)
 
-    def changes(self):
+    def changes(self, chunk_size=None, decode=False):
         """
         Returns a table of git log data, with "changes" as rows/observations.
 
@@ -69,6 +239,213 @@ class GitExtractor(BaseExtractor):
 
             drop_collections is not available for this method, since there are no meaningful collections to keep.
 
-        :return: pandas.DataFrame
+        .. note::
+
+            If the extractor was created with ``detailed_changes=True``, rows also have the ``changes/old_path``,
+            ``changes/new_path``, ``changes/change_type``, ``changes/old_blob`` and ``changes/new_blob`` columns.
+
+        :param int chunk_size: Optional. If given, commits are expanded in blocks of this many, and a generator
+         of tables (one per block) is returned instead, so the full table is never held in memory. See ``write_parquet``.
+        :param bool decode: Defaults to False. If True, integer-coded columns are decoded to strings.
+         Only applies to extraction with ``encode=True``.
+        :return: pandas.DataFrame (or pyarrow.Table or polars.DataFrame, depending on the backend)
+        """
+        if chunk_size is not None:
+            return self._iter_changes(chunk_size, decode)
+        if self.backend != 'pandas':
+            return convert(explode(self._to_arrow(self.decode(self._data) if decode else None), 'changes', 'file'),
+                           self.backend)
+        out_df = self.expand_on('hexsha', 'changes', rename1='hexsha', rename2='file')
+        return self.decode(out_df) if decode else out_df
+
+    def _iter_changes(self, chunk_size, decode=False):
+        """
+        Yields the changes table in blocks, each built from chunk_size commits.
+
+        :param int chunk_size: Number of commits per block.
+        :param bool decode: If True, integer-coded columns are decoded to strings.
+        :return: A generator of pandas.DataFrame (or pyarrow.Table or polars.DataFrame)
+        """
+        if self.backend != 'pandas':
+            table = self._to_arrow(self.decode(self._data) if decode else None)
+            for start in range(0, table.num_rows, chunk_size):
+                yield convert(explode(table.slice(start, chunk_size), 'changes', 'file'), self.backend)
+            return
+        for block in self.iter_expand_on('hexsha', 'changes', rename1='hexsha', rename2='file', chunk_size=chunk_size):
+            yield self.decode(block) if decode else block
+
+    def _get_path_index(self):
+        """
+        Returns the file/commit index, building it if it was not built during extraction.
+
+        :return: PathIndex
+        """
+        if self._path_index is None:
+            changes = self._data['changes']
+            if self._labels is not None:
+                paths = self._labels['file']
+                changes = ([paths[code] for code in c] for c in changes)
+            self._path_index = PathIndex.from_changes(changes, shas=self._data['hexsha'])
+        return self._path_index
+
+    def _get_activity(self, window, by):
+        """
+        Returns the activity aggregate for a window and author column, reusing the one built
+        during extraction if it matches. Otherwise, commits are aggregated one at a time.
+
+        :param int window: Window width in seconds.
+        :param str by: The column identifying authors.
+        :return: WindowedAggregate
+        """
+        if self._activity is not None and self._activity.window == window and by == 'author_email':
+            return self._activity
+        activity = WindowedAggregate(window, fields=activity_fields)
+        for row in zip(*[self._data[col] for col in [by, 'authored_date'] + activity_columns]):
+            activity.add(*row)
+        return activity
+
+    def activity(self, window=week, by='author_email'):
+        """
+        Returns the number of commits, and the lines, insertions, deletions and files they changed,
+        per author and time window. Counts are summed over the extracted commits without building the
+        ``commits`` or ``changes`` tables, but the extracted data is held in memory as usual. For large
+        repositories, ``activity_from`` aggregates without extracting.
+
+        :param int window: Defaults to a week. Window width in seconds. Weeks start on Mondays, 00:00 UTC.
+        :param str by: Defaults to 'author_email'. The column identifying authors.
+        :return: pandas.DataFrame with by, window, commits, lines, insertions, deletions and files columns
+         (or pyarrow.Table or polars.DataFrame, depending on the backend)
+        """
+        activity = self._get_activity(window, by)
+        out_df = activity.to_frame(key_name=by, count_name='commits')
+        if activity is not self._activity:
+            # Aggregated from _data, so authors may be integer codes
+            out_df = self.decode(out_df)
+        return self._output(out_df)
+
+    @staticmethod
+    def activity_from(source, window=week, by='author_email', workers=None, batch_size=default_batch_size,
+                      cache_dir=None, metrics=None):
+        """
+        Returns the same table as ``activity``, without extracting a repository. Commits are diffed as
+        they are walked and added to the aggregate, and no commit or change data is kept, so memory grows
+        with the number of (author, window) groups rather than with the number of commits and changes.
+
+        .. code-block:: python
+
+            weekly = GitExtractor.activity_from('path/to/repo')
+
+        :param str source: The path to a local Git repository.
+        :param int window: Defaults to a week. Window width in seconds. Weeks start on Mondays, 00:00 UTC.
+        :param str by: Defaults to 'author_email'. The column identifying authors, 'author_email' or 'author_name'.
+        :param int workers: Optional. Number of concurrent git processes. Defaults to the number of cores.
+        :param int batch_size: Optional. Number of commits handled by each git process.
+        :param str cache_dir: Optional. A directory for a persistent cache of per-commit diffs.
+        :param metrics: Optional. A Metrics object.
+        :return: pandas.DataFrame with by, window, commits, lines, insertions, deletions and files columns
+        """
+        activity = WindowedAggregate(window, fields=activity_fields)
+        stream_activity(source, activity, by=by, workers=workers, batch_size=batch_size,
+                        cache_dir=cache_dir, metrics=metrics)
+        return activity.to_frame(key_name=by, count_name='commits')
+
+    def sha_index(self):
+        """
+        Returns the full shas of the extracted commits, stored in binary, with vectorized lookup
+        of rows by full or abbreviated sha. Rows are positions in ``raw()``.
+
+        :return: ShaIndex
+        """
+        return self._sha_index
+
+    def full_shas(self, shas):
+        """
+        Expands abbreviated shas (e.g. from the ``hexsha`` or ``parents`` columns) to full 40 digit shas.
+
+        :param shas: An iterable of abbreviated or full hex shas.
+        :return: A list of full shas, with None for shas that match no extracted commit.
+        """
+        rows = self._sha_index.rows(shas)
+        full = self._sha_index.hex(np.maximum(rows, 0))
+        return [sha if row >= 0 else None for sha, row in zip(full, rows)]
+
+    def path_index(self):
+        """
+        Returns the inverted index between files and the commits that changed them, stored as
+        compressed sparse row arrays. Commits are identified by row position in ``raw()``. The index
+        can be saved with ``PathIndex.save`` and loaded without the repository with ``PathIndex.load``.
+
+        :return: PathIndex
+        """
+        return self._get_path_index()
+
+    def file_history(self, path, drop_collections=True, decode=False):
+        """
+        Returns the commits that changed a file, without building the ``changes`` table.
+
+        :param str path: The file path, relative to the repository root.
+        :param bool drop_collections: Defaults to True. Indicates whether columns with lists/dicts/sets will be dropped.
+        :param bool decode: Defaults to False. If True, integer-coded columns are decoded to strings.
+         Only applies to extraction with ``encode=True``.
+        :return: pandas.DataFrame (or pyarrow.Table or polars.DataFrame, depending on the backend)
+        """
+        out_df = self._data.iloc[self._get_path_index().commits_of(path)]
+        if drop_collections is True:
+            out_df = self._drop_collections(out_df)
+        if decode is True:
+            out_df = self.decode(out_df)
+        return self._output(out_df)
+
+    def co_changes(self, path):
+        """
+        Returns the files changed in the same commits as a file, with the number of shared commits.
+
+        :param str path: The file path, relative to the repository root.
+        :return: pandas.DataFrame with file and commits columns, by decreasing number of commits.
+        """
+        index = self._get_path_index()
+        ids, counts = index.co_changes(path)
+        return pd.DataFrame({'file': [index.paths[i] for i in ids], 'commits': counts})
+
+    def file_owners(self, path, author_col='author_email'):
+        """
+        Returns the authors of commits that changed a file, with their number of commits.
+
+        :param str path: The file path, relative to the repository root.
+        :param str author_col: Defaults to 'author_email'. The column identifying authors.
+        :return: pandas.DataFrame with author and commits columns, by decreasing number of commits.
+        """
+        authors = self._data[author_col].iloc[self._get_path_index().commits_of(path)]
+        counts = authors.value_counts()
+        out_df = pd.DataFrame({author_col: counts.index, 'commits': counts.values})
+        return self.decode(out_df).rename(columns={author_col: 'author'})
+
+    def author_file_graph(self, weight=None, author_col='author_email'):
+        """
+        Returns the author/file bipartite graph as a SciPy sparse matrix, built directly from the
+        extracted commits without creating the ``changes`` table. Requires SciPy.
+
+        .. note::
+
+            The author/author co-editing network is ``matrix.dot(matrix.T)``.
+
+        :param str weight: Defaults to None, which counts commits. Otherwise, the change attribute to sum
+         for each author/file pair (i.e. 'lines', 'insertions' or 'deletions').
+        :param str author_col: Defaults to 'author_email'. The column identifying authors.
+        :return: A tuple of (scipy.sparse.csr_matrix, author labels, file labels). Authors are rows
+         and files are columns, in the order of the label lists.
+        """
+        matrix, authors, files = author_file_matrix(self._data, author_col=author_col, weight=weight)
+        if self._labels is not None:
+            authors = [self._labels[author_col][a] for a in authors]
+            files = [self._labels['file'][f] for f in files]
+        return matrix, authors, files
+
+    def commit_graph(self):
+        """
+        Returns the commit DAG as a SciPy sparse adjacency matrix, where entry (i, j) is 1 if
+        commit j is a parent of commit i. Requires SciPy.
+
+        :return: A tuple of (scipy.sparse.csr_matrix, commit hexsha labels in row/column order).
         """
-        return self.expand_on('hexsha', 'changes', rename1='hexsha', rename2='file')
\ No newline at end of file
+        return commit_dag_matrix(self._data)
@@ -0,0 +1,109 @@
+# *********************************************************************************************
+# Copyright (C) 2017 Joel Becker,  Jillian Anderson, Steve McColl and Dr. John McLevey
+#
+# This file is part of the tidyextractors package developed for Dr John McLevey's Networks Lab
+# at the University of Waterloo. For more information, see
+# http://tidyextractors.readthedocs.io/en/latest/
+#
+# tidyextractors is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# tidyextractors is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with tidyextractors.
+# If not, see <http://www.gnu.org/licenses/>.
+# *********************************************************************************************
+
+import numpy as np
+
+# Graphs are built straight from the extracted commit table as SciPy sparse
+#   matrices, without expanding it into a commit/file long table first.
+#   SciPy is an optional dependency, and is only imported when a graph is built.
+
+
+def import_sparse():
+    """
+    Imports scipy.sparse, with a helpful error if SciPy is not installed.
+    :return: The scipy.sparse module.
+    """
+    try:
+        import scipy.sparse as sparse
+    except ImportError:
+        raise ImportError('Sparse graph export requires SciPy. Install it with "pip install scipy".')
+    return sparse
+
+
+def intern(value, index, labels):
+    """
+    Returns the integer code for value, adding it to the index if it is new.
+    :param value: A hashable node label.
+    :param index: A dictionary mapping labels to codes.
+    :param labels: A list of labels, where labels[code] == label.
+    :return: Integer
+    """
+    code = index.get(value)
+    if code is None:
+        code = len(labels)
+        index[value] = code
+        labels.append(value)
+    return code
+
+
+def author_file_matrix(df, author_col='author_email', weight=None):
+    """
+    Builds the author/file bipartite graph of a commit table.
+    :param df: A commit table with an author column and a 'changes' column of dicts.
+    :param author_col: The column identifying authors.
+    :param weight: None to count commits, or a change attribute to sum (e.g. 'lines').
+    :return: A tuple of (scipy.sparse.csr_matrix with authors as rows and files as columns,
+     list of author labels, list of file labels).
+    """
+    sparse = import_sparse()
+
+    author_index, authors = {}, []
+    file_index, files = {}, []
+    rows, cols, data = [], [], []
+
+    for author, changes in zip(df[author_col], df['changes']):
+        a = intern(author, author_index, authors)
+        for path, attrs in changes.items():
+            rows.append(a)
+            cols.append(intern(path, file_index, files))
+            data.append(1 if weight is None else attrs[weight])
+
+    # Duplicate (author, file) entries are summed when converting to CSR.
+    matrix = sparse.coo_matrix((np.array(data, dtype=np.int64),
+                                (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64))),
+                               shape=(len(authors), len(files))).tocsr()
+    return matrix, authors, files
+
+
+def commit_dag_matrix(df, sha_col='hexsha'):
+    """
+    Builds the commit DAG of a commit table as an adjacency matrix.
+    Entry (i, j) is 1 if commit j is a parent of commit i.
+    Parents that are not rows of the table (e.g. in a shallow history) are left out.
+    :param df: A commit table with a 'parents' column of sha lists.
+    :param sha_col: The column of commit shas that parents refer to.
+    :return: A tuple of (scipy.sparse.csr_matrix, list of commit shas in row/column order).
+    """
+    sparse = import_sparse()
+
+    shas = list(df[sha_col])
+    sha_index = {sha: i for i, sha in enumerate(shas)}
+    rows, cols = [], []
+
+    for i, parents in enumerate(df['parents']):
+        for p in parents:
+            j = sha_index.get(p)
+            if j is not None:
+                rows.append(i)
+                cols.append(j)
+
+    matrix = sparse.coo_matrix((np.ones(len(rows), dtype=np.int8),
+                                (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64))),
+                               shape=(len(shas), len(shas))).tocsr()
+    return matrix, shas
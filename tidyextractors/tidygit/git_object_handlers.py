@@ -18,6 +18,7 @@
 # *********************************************************************************************
 
 import git
+from sys import intern
 
 
 # All handlers have the following pattern:
@@ -47,8 +48,9 @@ def handle_actor(name, obj):
     :param obj: GitPython Actor
     :return: Dictionary of attributes.
     """
-    return {'author_name': obj.name,
-            'author_email': obj.email}
+    # Names and emails repeat on every commit by the same author, so one copy of each is kept
+    return {'author_name': None if obj.name is None else intern(obj.name),
+            'author_email': None if obj.email is None else intern(obj.email)}
 
 
 # Handler functions to turn objects into usable attributes.
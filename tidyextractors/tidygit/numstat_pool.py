@@ -0,0 +1,266 @@
+# *********************************************************************************************
+# Copyright (C) 2017 Joel Becker,  Jillian Anderson, Steve McColl and Dr. John McLevey
+#
+# This file is part of the tidyextractors package developed for Dr John McLevey's Networks Lab
+# at the University of Waterloo. For more information, see
+# http://tidyextractors.readthedocs.io/en/latest/
+#
+# tidyextractors is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# tidyextractors is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with tidyextractors.
+# If not, see <http://www.gnu.org/licenses/>.
+# *********************************************************************************************
+
+import os
+import git
+import subprocess
+import collections
+from sys import intern
+from concurrent.futures import ThreadPoolExecutor
+from tidyextractors.metrics import default_metrics
+from tidyextractors.tidygit.diff_cache import DiffCache
+
+# Per-file diff statistics are computed by feeding batches of commits to
+#   "git diff-tree --stdin". Each batch is a single git process, so a pool
+#   of threads is enough to keep one git process busy per core.
+
+# Default number of commits handed to each git invocation.
+default_batch_size = 250
+
+
+def default_workers():
+    """
+    Number of workers used when none is specified: one per available core.
+    :return: Integer
+    """
+    return os.cpu_count() or 1
+
+
+def diff_tree_input(pairs):
+    """
+    Builds the stdin payload for "git diff-tree --stdin".
+    :param pairs: A list of (commit sha, parent sha or None) tuples.
+    :return: Bytes
+    """
+    lines = []
+    for sha, parent in pairs:
+        if parent is None:
+            lines.append(sha)
+        else:
+            # A commit followed by one parent is compared against that parent only.
+            lines.append('{} {}'.format(sha, parent))
+    return ('\n'.join(lines) + '\n').encode('ascii')
+
+
+def parse_diff_tree(output):
+    """
+    Parses the NUL separated output of "git diff-tree -z --raw --numstat".
+    Each file change becomes a record tuple of
+    (old_path, new_path, change_type, old_blob, new_blob, insertions, deletions).
+    Paths and blobs are None when the file does not exist on that side of the change.
+    :param output: Bytes output of git diff-tree.
+    :return: A dictionary mapping commit shas to lists of records.
+    """
+    results = {}
+    raw_entries = None
+    numstat_entries = None
+    tokens = iter(output.decode('utf-8', 'replace').split('\0'))
+    for token in tokens:
+        if token == '':
+            continue
+        if token.startswith(':'):
+            # Raw entry: ":old_mode new_mode old_blob new_blob status", then one or two paths.
+            old_mode, new_mode, old_blob, new_blob, status = token[1:].split(' ')
+            change_type = status[0]
+            old_path = next(tokens)
+            new_path = next(tokens) if change_type in 'RC' else old_path
+            if change_type == 'A':
+                old_path, old_blob = None, None
+            elif change_type == 'D':
+                new_path, new_blob = None, None
+            raw_entries.append([old_path, new_path, change_type, old_blob, new_blob])
+        elif '\t' in token:
+            # Numstat entry: "insertions\tdeletions\tpath", or an empty path followed by two paths for renames.
+            raw_insertions, raw_deletions, path = token.split('\t', 2)
+            if path == '':
+                next(tokens)
+                path = next(tokens)
+            insertions = raw_insertions != '-' and int(raw_insertions) or 0
+            deletions = raw_deletions != '-' and int(raw_deletions) or 0
+            numstat_entries[path] = (insertions, deletions)
+        else:
+            # Commit header; starts a new commit.
+            raw_entries = []
+            numstat_entries = {}
+            results[token.strip()] = (raw_entries, numstat_entries)
+
+    records = {}
+    for sha, (raw_entries, numstat_entries) in results.items():
+        records[sha] = [tuple(entry) + numstat_entries.get(entry[1] or entry[0], (0, 0)) for entry in raw_entries]
+    return records
+
+
+def make_stats(records, detailed=False):
+    """
+    Builds a GitPython Stats object from a list of diff records.
+    :param records: A list of records, as produced by parse_diff_tree.
+    :param detailed: If True, per-file statistics also include paths, change type and blob ids.
+    :return: GitPython Stats
+    """
+    total = {'insertions': 0, 'deletions': 0, 'lines': 0, 'files': 0}
+    files = {}
+    for old_path, new_path, change_type, old_blob, new_blob, insertions, deletions in records:
+        # Paths repeat across commits, so one copy of each is kept
+        old_path = old_path and intern(old_path)
+        new_path = new_path and intern(new_path)
+        f = {'insertions': insertions,
+             'deletions': deletions,
+             'lines': insertions + deletions}
+        if detailed:
+            f.update({'old_path': old_path,
+                      'new_path': new_path,
+                      'change_type': change_type,
+                      'old_blob': old_blob,
+                      'new_blob': new_blob})
+        files[new_path or old_path] = f
+        total['insertions'] += insertions
+        total['deletions'] += deletions
+        total['lines'] += insertions + deletions
+        total['files'] += 1
+    return git.Stats(total, files)
+
+
+def run_numstat_batch(git_dir, pairs, renames=False, cache=None, stage=None):
+    """
+    Computes diff records for a batch of commits with a single git process.
+    :param git_dir: Path to the repository's .git directory.
+    :param pairs: A list of (commit sha, parent sha or None) tuples.
+    :param renames: If True, git's rename and copy detection is enabled.
+    :param cache: Optional DiffCache where new records are stored.
+    :param stage: Optional metrics Stage, which counts the git process and its output bytes.
+    :return: A dictionary mapping commit shas to lists of records.
+    """
+    command = [git.Git.GIT_PYTHON_GIT_EXECUTABLE or 'git', '--git-dir', git_dir,
+               'diff-tree', '--stdin', '-r', '-z', '--raw', '--numstat', '--root', '--always',
+               '-M' if renames else '--no-renames']
+    process = subprocess.run(command,
+                             input=diff_tree_input(pairs),
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE,
+                             check=True)
+    if stage is not None:
+        stage.add(bytes=len(process.stdout), calls=1)
+    records = parse_diff_tree(process.stdout)
+    if cache is not None:
+        for sha, parent in pairs:
+            cache.put(parent, sha, records[sha])
+    return records
+
+
+def numstat_pool(git_dir, pairs, workers=None, batch_size=default_batch_size,
+                 detailed=False, cache_dir=None, metrics=None):
+    """
+    Computes per-file statistics for many commits in parallel.
+    :param git_dir: Path to the repository's .git directory.
+    :param pairs: A list of (commit sha, parent sha or None) tuples. Root commits have no parent.
+    :param workers: Number of concurrent git processes. Defaults to the number of cores.
+    :param batch_size: Number of commits handled by each git process.
+    :param detailed: If True, renames are detected and per-file statistics include
+     old/new paths, change type and blob ids.
+    :param cache_dir: Optional directory for a persistent DiffCache.
+    :param metrics: Optional Metrics object, which receives the 'git_numstat' stage.
+    :return: A dictionary mapping commit shas to GitPython Stats objects.
+    """
+    if metrics is None:
+        metrics = default_metrics()
+    if workers is None:
+        workers = default_workers()
+
+    # Reuse cached diffs where possible
+    cache = None
+    records = {}
+    if cache_dir is not None:
+        cache = DiffCache(cache_dir, namespace='renames' if detailed else 'no-renames')
+        misses = []
+        for sha, parent in pairs:
+            cached = cache.get(parent, sha)
+            if cached is None:
+                misses.append((sha, parent))
+            else:
+                records[sha] = cached
+        pairs = misses
+
+    batches = [pairs[i:i+batch_size] for i in range(0, len(pairs), batch_size)]
+
+    with metrics.stage('git_numstat', total=len(pairs), description='Extracting file changes...') as stage:
+
+        def run(batch):
+            return run_numstat_batch(git_dir, batch, renames=detailed, cache=cache, stage=stage)
+
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+            for batch, batch_records in zip(batches, pool.map(run, batches)):
+                records.update(batch_records)
+                stage.update(len(batch))
+
+    return {sha: make_stats(r, detailed=detailed) for sha, r in records.items()}
+
+
+def iter_numstat_batches(git_dir, batches, workers=None, detailed=False, cache_dir=None, metrics=None):
+    """
+    Computes diff records for a stream of commit batches, keeping only a few batches in flight,
+    so that commits can be diffed as they are walked rather than collected first.
+    :param git_dir: Path to the repository's .git directory.
+    :param batches: An iterable of lists of (commit sha, parent sha or None) tuples.
+    :param workers: Number of concurrent git processes. Defaults to the number of cores.
+    :param detailed: If True, renames are detected.
+    :param cache_dir: Optional directory for a persistent DiffCache.
+    :param metrics: Optional Metrics object, which receives the 'git_numstat' stage.
+    :return: A generator of (batch, dictionary mapping commit shas to lists of records) tuples, in batch order.
+    """
+    if metrics is None:
+        metrics = default_metrics()
+    if workers is None:
+        workers = default_workers()
+    workers = max(workers, 1)
+
+    cache = None
+    if cache_dir is not None:
+        cache = DiffCache(cache_dir, namespace='renames' if detailed else 'no-renames')
+
+    with metrics.stage('git_numstat', description='Extracting file changes...') as stage:
+
+        def run(batch):
+            records = {}
+            misses = batch
+            if cache is not None:
+                misses = []
+                for sha, parent in batch:
+                    cached = cache.get(parent, sha)
+                    if cached is None:
+                        misses.append((sha, parent))
+                    else:
+                        records[sha] = cached
+            if misses:
+                records.update(run_numstat_batch(git_dir, misses, renames=detailed, cache=cache, stage=stage))
+            return records
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = collections.deque()
+            for batch in batches:
+                pending.append((batch, pool.submit(run, batch)))
+                if len(pending) >= 2 * workers:
+                    batch, future = pending.popleft()
+                    records = future.result()
+                    stage.update(len(batch))
+                    yield batch, records
+            while pending:
+                batch, future = pending.popleft()
+                records = future.result()
+                stage.update(len(batch))
+                yield batch, records
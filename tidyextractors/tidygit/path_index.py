@@ -0,0 +1,144 @@
+# *********************************************************************************************
+# Copyright (C) 2017 Joel Becker,  Jillian Anderson, Steve McColl and Dr. John McLevey
+#
+# This file is part of the tidyextractors package developed for Dr John McLevey's Networks Lab
+# at the University of Waterloo. For more information, see
+# http://tidyextractors.readthedocs.io/en/latest/
+#
+# tidyextractors is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# tidyextractors is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with tidyextractors.
+# If not, see <http://www.gnu.org/licenses/>.
+# *********************************************************************************************
+
+import numpy as np
+from tidyextractors.string_packing import pack_strings, unpack_strings
+from tidyextractors.tidygit.git_graph import intern
+
+# The path index stores which files each commit changed, and which commits changed each file,
+#   as two arrays in compressed sparse row (CSR) layout: the ids for row i are
+#   ids[ptr[i]:ptr[i+1]]. Both directions are sorted, so lookups are array slices.
+
+
+class PathIndex(object):
+    """
+    An inverted index between files and the commits that changed them.
+
+    Commits are identified by their row position in the extracted commit table, and files by
+    an integer path id (their position in ``paths``).
+
+    :param list paths: File paths, indexed by path id.
+    :param numpy.ndarray commit_ptr: CSR offsets into commit_paths, one more than the number of commits.
+    :param numpy.ndarray commit_paths: Sorted path ids changed by each commit.
+    :param list shas: Optional. Commit shas, indexed by row position.
+    """
+
+    def __init__(self, paths, commit_ptr, commit_paths, shas=None):
+        self.paths = paths
+        self.shas = shas
+        self.commit_ptr = commit_ptr
+        self.commit_paths = commit_paths
+        self._path_ids = None
+
+        # Transpose to path -> commits. A stable sort keeps each path's commits in row order.
+        rows = np.repeat(np.arange(len(commit_ptr) - 1, dtype=commit_paths.dtype), np.diff(commit_ptr))
+        order = np.argsort(commit_paths, kind='stable')
+        self.path_commits = rows[order]
+        self.path_ptr = np.zeros(len(paths) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(commit_paths, minlength=len(paths)), out=self.path_ptr[1:])
+
+    @classmethod
+    def from_changes(cls, changes, shas=None):
+        """
+        Builds the index from a column of per-commit changes.
+        :param changes: An iterable of dicts keyed by file path (e.g. the 'changes' column).
+        :param shas: Optional. Commit shas in the same order.
+        :return: PathIndex
+        """
+        path_index, paths = {}, []
+        ids = []
+        ptr = [0]
+        for commit_changes in changes:
+            ids.extend(sorted(intern(path, path_index, paths) for path in commit_changes))
+            ptr.append(len(ids))
+        dtype = np.int32 if len(paths) < 2 ** 31 and len(ptr) < 2 ** 31 else np.int64
+        index = cls(paths, np.array(ptr, dtype=np.int64), np.array(ids, dtype=dtype),
+                    shas=None if shas is None else list(shas))
+        index._path_ids = path_index
+        return index
+
+    def path_id(self, path):
+        """
+        :param str path: A file path.
+        :return: The path's integer id, or None if no commit changed it.
+        """
+        if self._path_ids is None:
+            self._path_ids = {p: i for i, p in enumerate(self.paths)}
+        return self._path_ids.get(path)
+
+    def commits_of(self, path):
+        """
+        :param path: A file path, or a path id.
+        :return: numpy.ndarray of the sorted row positions of commits that changed the file.
+        """
+        i = path if isinstance(path, (int, np.integer)) else self.path_id(path)
+        if i is None:
+            return self.path_commits[:0]
+        return self.path_commits[self.path_ptr[i]:self.path_ptr[i + 1]]
+
+    def paths_of(self, row):
+        """
+        :param int row: A commit's row position.
+        :return: numpy.ndarray of the sorted path ids the commit changed.
+        """
+        return self.commit_paths[self.commit_ptr[row]:self.commit_ptr[row + 1]]
+
+    def co_changes(self, path):
+        """
+        Counts how often other files were changed in the same commits as a file.
+        :param path: A file path, or a path id.
+        :return: A tuple of (path ids, commit counts), by decreasing count.
+        """
+        i = path if isinstance(path, (int, np.integer)) else self.path_id(path)
+        rows = self.commits_of(path)
+        if len(rows) == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        ids = np.concatenate([self.paths_of(r) for r in rows])
+        counts = np.bincount(ids, minlength=len(self.paths))
+        counts[i] = 0
+        others = np.nonzero(counts)[0]
+        order = np.argsort(-counts[others], kind='stable')
+        return others[order], counts[others][order]
+
+    def save(self, file):
+        """
+        Saves the index in NumPy's .npz format.
+        :param file: File path or file object.
+        :return: None
+        """
+        arrays = {'commit_ptr': self.commit_ptr,
+                  'commit_paths': self.commit_paths,
+                  'paths': pack_strings(self.paths),
+                  'path_count': np.array([len(self.paths)])}
+        if self.shas is not None:
+            arrays['shas'] = pack_strings(self.shas)
+        np.savez(file, **arrays)
+
+    @classmethod
+    def load(cls, file):
+        """
+        Loads an index saved with ``save``.
+        :param file: File path or file object.
+        :return: PathIndex
+        """
+        with np.load(file) as data:
+            commit_ptr = data['commit_ptr']
+            shas = unpack_strings(data['shas'], len(commit_ptr) - 1) if 'shas' in data else None
+            return cls(unpack_strings(data['paths'], int(data['path_count'][0])), commit_ptr,
+                       data['commit_paths'], shas=shas)
@@ -0,0 +1,139 @@
+# *********************************************************************************************
+# Copyright (C) 2017 Joel Becker,  Jillian Anderson, Steve McColl and Dr. John McLevey
+#
+# This file is part of the tidyextractors package developed for Dr John McLevey's Networks Lab
+# at the University of Waterloo. For more information, see
+# http://tidyextractors.readthedocs.io/en/latest/
+#
+# tidyextractors is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# tidyextractors is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with tidyextractors.
+# If not, see <http://www.gnu.org/licenses/>.
+# *********************************************************************************************
+
+import numpy as np
+
+# Full commit shas are stored as 20-byte binary values. Their first 8 bytes, read as a
+#   big-endian uint64, are kept sorted, so sha prefixes of any length are looked up
+#   with one binary search per query rather than string comparisons.
+
+
+def sha_prefixes(binary):
+    """
+    Returns the first 16 hex digits of binary shas as integers.
+    :param binary: numpy.ndarray of dtype S20.
+    :return: numpy.ndarray of uint64
+    """
+    raw = np.frombuffer(binary.tobytes(), dtype=np.uint8).reshape(-1, 20)[:, :8]
+    return np.ascontiguousarray(raw).view('>u8').ravel().astype(np.uint64)
+
+
+def common_digits(a, b):
+    """
+    Counts the leading hex digits shared by pairs of uint64 prefixes.
+    :param a: numpy.ndarray of uint64
+    :param b: numpy.ndarray of uint64
+    :return: numpy.ndarray of int64, from 0 to 16.
+    """
+    diff = a ^ b
+    common = np.zeros(len(diff), dtype=np.int64)
+    same = np.ones(len(diff), dtype=bool)
+    for d in range(16):
+        same &= (diff >> np.uint64(60 - 4 * d)) & np.uint64(0xF) == 0
+        common += same
+    return common
+
+
+def to_hex(value):
+    """
+    :param bytes value: A binary sha. NumPy strips trailing NUL bytes from S20 items, so they are restored.
+    :return: A 40 digit hex sha.
+    """
+    return value.ljust(20, b'\0').hex()
+
+
+class ShaIndex(object):
+    """
+    Full commit shas, with vectorized lookup by sha or sha prefix.
+
+    Commits are identified by their row position in the extracted commit table.
+
+    :param numpy.ndarray binary: Binary shas (dtype S20), indexed by row position.
+    """
+
+    def __init__(self, binary):
+        self.binary = binary
+        prefixes = sha_prefixes(binary)
+        self._order = np.argsort(prefixes, kind='stable')
+        self._sorted = prefixes[self._order]
+
+    @classmethod
+    def from_hex(cls, hexshas):
+        """
+        :param hexshas: An iterable of 40 digit hex shas.
+        :return: ShaIndex
+        """
+        return cls(np.array([bytes.fromhex(s) for s in hexshas], dtype='S20'))
+
+    def __len__(self):
+        return len(self.binary)
+
+    def unique_length(self, minimum=7):
+        """
+        Returns the shortest abbreviation length, of at least minimum digits, at which every sha is unique.
+        :param int minimum: Defaults to 7, as git does.
+        :return: int
+        """
+        if len(self) < 2:
+            return minimum
+        common = common_digits(self._sorted[:-1], self._sorted[1:])
+        # Neighbours sharing all 16 digits are compared in full
+        for i in np.nonzero(common == 16)[0]:
+            a, b = to_hex(self.binary[self._order[i]]), to_hex(self.binary[self._order[i + 1]])
+            common[i] = next((j for j in range(40) if a[j] != b[j]), 39)
+        return int(min(40, max(minimum, common.max() + 1)))
+
+    def rows(self, shas):
+        """
+        Finds the rows of commits by full or abbreviated sha.
+        :param shas: An iterable of hex sha strings, each at least 1 digit long.
+        :return: numpy.ndarray of int64 row positions, with -1 for shas that match no commit.
+        """
+        shas = list(shas)
+        out = np.full(len(shas), -1, dtype=np.int64)
+        if len(self) == 0:
+            return out
+        lengths = np.array([len(s) for s in shas], dtype=np.int64)
+        for length in np.unique(lengths):
+            selected = np.nonzero(lengths == length)[0]
+            digits = int(min(length, 16))
+            values = np.array([int(shas[i][:digits].ljust(16, '0'), 16) for i in selected], dtype=np.uint64)
+            # Rows whose prefixes fall between the query padded with 0s and with Fs match its first 16 digits
+            mask = np.uint64((1 << (4 * (16 - digits))) - 1)
+            lo = np.searchsorted(self._sorted, values, side='left')
+            hi = np.searchsorted(self._sorted, values | mask, side='right')
+            if length <= 16:
+                ambiguous = hi - lo > 1
+                if ambiguous.any():
+                    raise ValueError('Ambiguous sha prefix "{}".'.format(shas[selected[np.nonzero(ambiguous)[0][0]]]))
+                out[selected] = np.where(hi > lo, self._order[np.minimum(lo, len(self) - 1)], -1)
+            else:
+                # Longer queries are checked in full against each candidate
+                for i, a, b in zip(selected, lo, hi):
+                    query = shas[i].lower()
+                    out[i] = next((r for r in self._order[a:b] if to_hex(self.binary[r]).startswith(query)), -1)
+        return out
+
+    def hex(self, rows=None):
+        """
+        :param rows: Optional. Row positions. Defaults to all rows.
+        :return: A list of 40 digit hex shas.
+        """
+        binary = self.binary if rows is None else self.binary[np.asarray(rows)]
+        return [to_hex(b) for b in binary]
@@ -0,0 +1,172 @@
+# *********************************************************************************************
+# Copyright (C) 2017 Joel Becker,  Jillian Anderson, Steve McColl and Dr. John McLevey
+#
+# This file is part of the tidyextractors package developed for Dr John McLevey's Networks Lab
+# at the University of Waterloo. For more information, see
+# http://tidyextractors.readthedocs.io/en/latest/
+#
+# tidyextractors is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# tidyextractors is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with tidyextractors.
+# If not, see <http://www.gnu.org/licenses/>.
+# *********************************************************************************************
+
+import re
+import sqlite3
+import hashlib
+from tidyextractors.tidymbox.mbox_reader import blank_lines
+
+# Duplicate detection. Archives often hold the same message more than once (e.g. monthly and
+#   yearly dumps of one list). Each message gets a key from the raw lines of its headers, before
+#   it is parsed: its Message-ID, or a hash of its headers if it has none. Only headers are
+#   hashed, so a message gets the same key whether or not its body is read (headers_only),
+#   and whether it is stored in an mbox or a file of its own. Keys are hashed to a fixed
+#   size and kept in a set, either in memory or in an SQLite file.
+
+message_id_regex = re.compile(rb'<([^<>\s]+)>')
+
+# Size of key digests, in bytes.
+digest_size = 16
+
+
+def find_message_id(lines):
+    """
+    Finds the Message-ID header in a message's raw lines, without parsing the message.
+    :param lines: A list of the message's lines (bytes), starting with its headers.
+    :return: The Message-ID without angle brackets (bytes), or None.
+    """
+    value = None
+    for line in lines:
+        if line in blank_lines:
+            break
+        if value is not None:
+            if line[:1] in (b' ', b'\t'):
+                # Folded header
+                value += line
+                continue
+            break
+        if line[:11].lower() == b'message-id:':
+            value = line[11:]
+    if value is None:
+        return None
+    match = message_id_regex.search(value)
+    if match is not None:
+        return match.group(1)
+    return value.strip() or None
+
+
+def message_key(lines):
+    """
+    Makes a message's deduplication key: its Message-ID, or a hash of its header lines if it has none.
+    :param lines: A list of the message's lines (bytes), starting with its headers. The mbox "From "
+     line, which differs between archives, should not be included.
+    :return: A bytes digest of digest_size bytes.
+    """
+    message_id = find_message_id(lines)
+    digest = hashlib.blake2b(digest_size=digest_size)
+    if message_id is not None:
+        digest.update(b'id:' + message_id)
+    else:
+        digest.update(b'headers:')
+        for line in lines:
+            if line in blank_lines:
+                break
+            digest.update(line.rstrip(b'\r\n'))
+            digest.update(b'\n')
+    return digest.digest()
+
+
+class SeenSet(object):
+    """
+    An in-memory set of message keys.
+    """
+
+    def __init__(self):
+        self._keys = set()
+        self.duplicates = 0
+
+    def add(self, key):
+        """
+        :param bytes key: A message key.
+        :return: True if the key is new, False if it was added before.
+        """
+        if key in self._keys:
+            self.duplicates += 1
+            return False
+        self._keys.add(key)
+        return True
+
+    def load(self, keys):
+        """
+        Adds keys of messages that were already extracted (e.g. cached rows), without counting duplicates.
+        :param keys: An iterable of message keys.
+        :return: None
+        """
+        self._keys.update(keys)
+
+    def close(self):
+        pass
+
+
+class SqliteSeenSet(object):
+    """
+    A set of message keys kept in an SQLite file, for corpora whose keys do not fit in memory.
+    The file is emptied when the set is created, so it only holds the keys of one extraction.
+
+    :param str path: Path to the SQLite file.
+    """
+
+    # Number of inserts between commits.
+    commit_interval = 10000
+
+    def __init__(self, path):
+        self.path = path
+        self.duplicates = 0
+        self._pending = 0
+        self._connection = sqlite3.connect(path)
+        self._connection.execute('DROP TABLE IF EXISTS seen')
+        self._connection.execute('CREATE TABLE seen (key BLOB PRIMARY KEY) WITHOUT ROWID')
+
+    def add(self, key):
+        """
+        :param bytes key: A message key.
+        :return: True if the key is new, False if it was added before.
+        """
+        cursor = self._connection.execute('INSERT OR IGNORE INTO seen VALUES (?)', (key,))
+        if cursor.rowcount == 0:
+            self.duplicates += 1
+            return False
+        self._pending += 1
+        if self._pending >= self.commit_interval:
+            self._connection.commit()
+            self._pending = 0
+        return True
+
+    def load(self, keys):
+        """
+        Adds keys of messages that were already extracted (e.g. cached rows), without counting duplicates.
+        :param keys: An iterable of message keys.
+        :return: None
+        """
+        self._connection.executemany('INSERT OR IGNORE INTO seen VALUES (?)', ((key,) for key in keys))
+        self._connection.commit()
+
+    def close(self):
+        self._connection.commit()
+        self._connection.close()
+
+
+def make_seen_set(dedupe):
+    """
+    :param dedupe: True for an in-memory set, or a file path for an SQLite set.
+    :return: SeenSet or SqliteSeenSet
+    """
+    if dedupe is True:
+        return SeenSet()
+    return SqliteSeenSet(dedupe)
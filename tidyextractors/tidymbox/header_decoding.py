@@ -0,0 +1,115 @@
+# *********************************************************************************************
+# Copyright (C) 2017 Joel Becker,  Jillian Anderson, Steve McColl and Dr. John McLevey
+#
+# This file is part of the tidyextractors package developed for Dr John McLevey's Networks Lab
+# at the University of Waterloo. For more information, see
+# http://tidyextractors.readthedocs.io/en/latest/
+#
+# tidyextractors is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# tidyextractors is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with tidyextractors.
+# If not, see <http://www.gnu.org/licenses/>.
+# *********************************************************************************************
+
+import codecs
+import functools
+import email.utils
+import email.errors
+import email.header
+
+# Header decoding. Header values may hold RFC 2047 encoded words (e.g. "=?utf-8?b?...?="), or
+#   undeclared 8-bit text, which the email package returns as Header objects. Both are decoded
+#   to plain strings with unfolded whitespace. Subjects and senders repeat heavily across
+#   replies on mailing lists, so decoded string values are memoized.
+
+# Number of distinct header values whose decoding is remembered.
+cache_size = 1 << 16
+
+# Charsets tried, in order, for 8-bit text that does not declare one.
+fallback_charsets = ['utf-8', 'cp1252']
+
+
+def decode_bytes(text, charset):
+    """
+    Decodes one part of a header value.
+    :param bytes text: The encoded text.
+    :param str charset: The declared charset, 'unknown-8bit', or None.
+    :return: str
+    """
+    if charset is not None and charset != 'unknown-8bit':
+        try:
+            codecs.lookup(charset)
+            return text.decode(charset, 'replace')
+        except LookupError:
+            pass
+    for fallback in fallback_charsets:
+        try:
+            return text.decode(fallback)
+        except UnicodeDecodeError:
+            continue
+    return text.decode('latin-1')
+
+
+def decode_parts(value):
+    """
+    :param value: A header value (str or email.header.Header).
+    :return: The decoded value, with whitespace unfolded.
+    """
+    try:
+        parts = email.header.decode_header(value)
+    except (email.errors.HeaderParseError, ValueError):
+        parts = [(str(value), None)]
+    decoded = ''.join(text if isinstance(text, str) else decode_bytes(text, charset) for text, charset in parts)
+    return ' '.join(decoded.split())
+
+
+@functools.lru_cache(maxsize=cache_size)
+def decode_string(value):
+    """
+    Memoized decoding of string header values.
+    :param str value: A header value.
+    :return: str
+    """
+    return decode_parts(value)
+
+
+def decode_header_value(value):
+    """
+    Decodes a header value to a plain string.
+    :param value: A header value (str or email.header.Header), or None.
+    :return: str, or None
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return decode_string(value)
+    return decode_parts(value)
+
+
+@functools.lru_cache(maxsize=cache_size)
+def decode_display_name(value):
+    """
+    Decodes the display name of an address header value (e.g. From).
+    :param str value: A header value, e.g. '=?utf-8?b?SsO2cmc=?= <j@example.org>'.
+    :return: The decoded display name, or None if there is none.
+    """
+    name, address = email.utils.parseaddr(value)
+    return decode_string(name) or None
+
+
+def display_name(value):
+    """
+    :param value: An address header value (str or email.header.Header), or None.
+    :return: The decoded display name, or None.
+    """
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        value = decode_parts(value)
+    return decode_display_name(value)
@@ -0,0 +1,103 @@
+# *********************************************************************************************
+# Copyright (C) 2017 Joel Becker,  Jillian Anderson, Steve McColl and Dr. John McLevey
+#
+# This file is part of the tidyextractors package developed for Dr John McLevey's Networks Lab
+# at the University of Waterloo. For more information, see
+# http://tidyextractors.readthedocs.io/en/latest/
+#
+# tidyextractors is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# tidyextractors is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with tidyextractors.
+# If not, see <http://www.gnu.org/licenses/>.
+# *********************************************************************************************
+
+import os
+import json
+import pickle
+import hashlib
+import pandas as pd
+from tidyextractors.tidymbox.mbox_reader import MboxStream
+
+# Number of bytes before the last processed offset that are checksummed.
+tail_size = 4096
+
+
+def tail_checksum(path, offset):
+    """
+    Checksums the bytes of a (possibly compressed) mbox file that precede an offset.
+    :param path: File path.
+    :param offset: Uncompressed byte offset.
+    :return: A hex digest string.
+    """
+    start = max(0, offset - tail_size)
+    with MboxStream(path, start) as f:
+        return hashlib.sha1(f.read(offset - start)).hexdigest()
+
+
+class MboxCache(object):
+    """
+    Remembers how far each mbox file has been parsed, along with the rows parsed so far.
+
+    Mbox files are append-only, so a file can be resumed at the recorded byte offset as long
+    as the bytes just before the offset are unchanged. Otherwise the file has been rewritten,
+    truncated or rotated, and is parsed again from the start.
+
+    :param str directory: The cache directory. Created if it does not exist.
+    :param dict options: Extraction options. Cached rows are only reused with the same options.
+    """
+
+    def __init__(self, directory, options=None):
+        self.directory = directory
+        self.options = options or {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, mbox_file):
+        key = hashlib.sha1(os.path.abspath(mbox_file).encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, key)
+        return base + '.json', base + '.pkl'
+
+    def resume(self, mbox_file):
+        """
+        Looks up the cached rows and resume offset of an mbox file.
+
+        :param str mbox_file: Path to an mbox file.
+        :return: A tuple of (pandas.DataFrame of cached rows, byte offset), or (None, 0)
+         if the file must be parsed from the start.
+        """
+        state_path, rows_path = self._paths(mbox_file)
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+            if state['options'] != self.options:
+                return None, 0
+            offset = state['offset']
+            if tail_checksum(mbox_file, offset) != state['tail']:
+                return None, 0
+            return pd.read_pickle(rows_path), offset
+        except (IOError, ValueError, KeyError, EOFError, pickle.UnpicklingError):
+            return None, 0
+
+    def save(self, mbox_file, df, offset):
+        """
+        Stores the rows parsed from an mbox file and the offset to resume parsing at.
+
+        :param str mbox_file: Path to an mbox file.
+        :param pandas.DataFrame df: The rows parsed from the file before the offset.
+        :param int offset: The byte offset to resume parsing at. This is the start of the last message
+         rather than the end of the file, since the last message may not have been completely appended.
+        :return: None
+        """
+        state_path, rows_path = self._paths(mbox_file)
+        df.to_pickle(rows_path)
+        state = {'file': os.path.abspath(mbox_file),
+                 'offset': offset,
+                 'tail': tail_checksum(mbox_file, offset),
+                 'options': self.options}
+        with open(state_path, 'w') as f:
+            json.dump(state, f)
@@ -19,49 +19,144 @@
 
 import pandas as pd
 from tidyextractors import BaseExtractor
-from tidyextractors.tidymbox.mbox_to_pandas import mbox_to_pandas
+from tidyextractors.arrow_output import explode, convert, drop_collections, import_pyarrow
+from tidyextractors.aggregates import WindowedAggregate, week
+from tidyextractors.text_index import TextIndex
+from tidyextractors.tidymbox.mbox_to_pandas import mbox_to_pandas, mbox_activity, add_activity
+from tidyextractors.tidymbox.dedupe import make_seen_set
+from tidyextractors.tidymbox.send_graph import SendGraph
+from tidyextractors.tidymbox.mbox_threads import thread_messages
 
 
 class MboxExtractor(BaseExtractor):
     """
     The ``MboxExtractor`` class is for extracting data from local Mbox files. This class
     has methods for outputting data into the ``emails`` and ``sends`` tidy formats, and a
-    raw untidy format.
+    raw untidy format. Messages stored in Maildir folders and ``.eml`` files are also supported.
 
-    :param str source: The path to either a single mbox file or a directory containing multiple mbox files.
+    :param str source: The path to either a single mbox file or a directory containing multiple mbox files,
+     Maildir folders or ``.eml`` files.
     :param bool auto_extract: Defaults to True. If True, data is extracted automatically.
      Otherwise, extraction must be initiated through the internal interface.
+    :param bool send_graph: Defaults to False. If True, the weighted sender/recipient graph used by
+     ``send_edges`` and ``send_matrix`` is built while messages are parsed.
+    :param int time_bucket: Optional. Splits the sender/recipient graph into time buckets of this many seconds.
+    :param bool threads: Defaults to False. If True, the Message-ID, In-Reply-To and References headers
+     are extracted, and messages are threaded into ThreadID, ParentID and ThreadDepth columns. ThreadID
+     and ParentID refer to MessageID values.
+    :param str cache_dir: Optional. A directory in which parsed messages and the byte offset reached in
+     each mbox file are kept. Later extractions with the same cache_dir only parse messages appended
+     to the files since, and files that were otherwise modified are parsed again in full.
+    :param int workers: Optional. Number of processes used to parse Maildir and ``.eml`` messages.
+     Defaults to the number of available cores.
+    :param bool headers_only: Defaults to False. If True, only message headers are parsed and message
+     bodies are skipped, which is much faster for lists with large messages. There is no ``Body`` column.
+    :param int activity_window: Optional. If given, the per-sender activity counted by ``activity`` is
+     aggregated into windows of this many seconds as messages are parsed. The messages are still
+     extracted and held as usual. To aggregate activity without extracting it, use ``activity_from``.
+    :param dedupe: Defaults to False. If True, messages found more than once (e.g. in overlapping monthly and
+     yearly archives) are extracted once. Messages are matched by Message-ID, or by their headers if they have none,
+     and copies in mbox files are skipped before they are parsed. Keys are kept in memory, or, if dedupe is a file path,
+     in an SQLite file at that path. The number of skipped copies is kept in ``duplicates``.
+    :param bool display_names: Defaults to False. If True, the sender's display name (e.g. "Jane Doe" in
+     "Jane Doe <jane@example.com>") is extracted into a FromName column. Like Subject, it is decoded from
+     RFC 2047 encoded words and 8-bit charsets.
+    :param text_index: Defaults to False. If True, a full-text index of message bodies, used by ``search``,
+     is built during extraction, by ``workers`` processes. If a file path, the index is also saved there, and
+     can be loaded later with ``TextIndex.load``.
     """
 
-    def _extract(self, source, *args, **kwargs):
+    # Weighted sender/recipient graph. Built during extraction, or on first use.
+    _send_graph = None
+
+    # Number of duplicate messages skipped in dedupe mode.
+    duplicates = 0
+
+    # Messages and recipients per sender and time window. Built during extraction, or on first use.
+    _activity = None
+
+    # Full-text index over message bodies. Built during extraction, or on first use.
+    _text_index = None
+
+    # Senders (with their names, if extracted) and recipients.
+    #   The To and Cc columns of emails(drop_collections=False) get lists of ids.
+    _identity_columns = [('person_id', {'email': 'From', 'name': 'FromName'}),
+                         ('person_id', {'email': 'From'}),
+                         ('recipient_person_id', {'email': 'Recipient'}),
+                         ('to_person_ids', {'email': 'To'}),
+                         ('cc_person_ids', {'email': 'Cc'})]
+
+    def _extract(self, source, send_graph=False, time_bucket=None, threads=False, cache_dir=None,
+                 workers=None, headers_only=False, activity_window=None, dedupe=False, display_names=False,
+                 text_index=False, *args, **kwargs):
         """
         Extracts data from mbox files. Mutates _data.
 
         :param str source: The path to one or more mbox files.
+        :param bool send_graph: If True, build the sender/recipient graph during extraction.
+        :param int time_bucket: Optional time bucket width for the sender/recipient graph, in seconds.
+        :param bool threads: If True, extract threading headers and reconstruct threads.
+        :param str cache_dir: Optional directory for incremental extraction.
+        :param int workers: Number of processes used to parse Maildir and .eml messages.
+        :param bool headers_only: If True, skip message bodies.
+        :param int activity_window: Optional window width in seconds for activity aggregated during extraction.
+        :param dedupe: If True (or an SQLite file path), skip duplicate messages.
+        :param bool display_names: If True, extract the sender's display name.
+        :param text_index: If True (or a file path to save it to), build the full-text index of message bodies.
         :param args: Arbitrary arguments for extensibility.
         :param kwargs: Arbitrary keyword arguments for extensibility.
         :return: None
         """
+        if send_graph or time_bucket is not None:
+            self._send_graph = SendGraph(time_bucket=time_bucket)
+        if activity_window is not None:
+            self._activity = WindowedAggregate(activity_window, fields=['recipients'])
+
+        seen = make_seen_set(dedupe) if dedupe else None
+
         # Extract data
-        self._data = mbox_to_pandas(source)
+        try:
+            self._data = mbox_to_pandas(source, send_graph=self._send_graph, thread_headers=threads,
+                                        cache_dir=cache_dir, workers=workers, headers_only=headers_only,
+                                        metrics=self.metrics, activity=self._activity, seen=seen,
+                                        display_names=display_names)
+        finally:
+            if seen is not None:
+                seen.close()
+                self.duplicates = seen.duplicates
         self._data['MessageID'] = pd.Series(range(0,len(self._data)))
 
+        # Thread messages
+        if threads:
+            thread_ids, parent_ids, depths = thread_messages(self._data['Message-ID'],
+                                                             self._data['In-Reply-To'],
+                                                             self._data['References'])
+            self._data['ThreadID'] = pd.Series(thread_ids, dtype='int64')
+            self._data['ParentID'] = pd.Series(parent_ids, dtype='Int64')
+            self._data['ThreadDepth'] = pd.Series(depths, dtype='int64')
+
+        # Index message bodies
+        if text_index:
+            self._get_text_index(workers=workers)
+            if text_index is not True:
+                self._text_index.save(text_index)
+
     def emails(self, drop_collections = True):
         """
         Returns a table of mbox message data, with "messages" as rows/observations.
 
         :param bool drop_collections: Defaults to True. Indicates whether columns with lists/dicts/sets will be dropped.
 
-        :return: pandas.DataFrame
+        :return: pandas.DataFrame (or pyarrow.Table or polars.DataFrame, depending on the backend)
         """
         base_df = self._data
         if drop_collections is True:
             out_df = self._drop_collections(base_df)
         else:
             out_df = base_df
-        return out_df
+        return self._output(out_df)
 
-    def sends(self):
+    def sends(self, chunk_size=None):
         """
         Returns a table of mbox message data, with "sender/recipient" pairs as rows/observations.
 
@@ -73,12 +168,29 @@ class MboxExtractor(BaseExtractor):
 
             drop_collections is not available for this method, since there are no meaningful collections to keep.
 
-        :return: pandas.DataFrame
+        :param int chunk_size: Optional. If given, messages are expanded in blocks of this many, and a generator
+         of tables (one per block) is returned instead, so the full table is never held in memory. See ``write_parquet``.
+        :return: pandas.DataFrame (or pyarrow.Table or polars.DataFrame, depending on the backend)
         """
+        if chunk_size is not None:
+            return self._iter_sends(chunk_size)
+
+        if self.backend != 'pandas':
+            return convert(self._arrow_sends(), self.backend)
+
         # Expand on each "to" field
         on_to_df = self.expand_on('From', 'To', rename1='From', rename2='Recipient')
         on_cc_df = self.expand_on('From', 'Cc', rename1='From', rename2='Recipient')
+        return self._combine_sends(on_to_df, on_cc_df)
 
+    def _combine_sends(self, on_to_df, on_cc_df):
+        """
+        Combines the data expanded on "To" and "Cc" into the sends table.
+
+        :param pandas.DataFrame on_to_df: Data expanded on "To".
+        :param pandas.DataFrame on_cc_df: Data expanded on "Cc".
+        :return: pandas.DataFrame
+        """
         # Specify how it was sent
         on_to_df['SendType'] = 'To'
         on_cc_df['SendType'] = 'Cc'
@@ -87,3 +199,180 @@ class MboxExtractor(BaseExtractor):
         output_df = pd.concat([on_to_df, on_cc_df])
 
         return self._drop_collections(output_df)
+
+    def _iter_sends(self, chunk_size):
+        """
+        Yields the sends table in blocks, each built from chunk_size messages.
+
+        :param int chunk_size: Number of messages per block.
+        :return: A generator of pandas.DataFrame (or pyarrow.Table or polars.DataFrame)
+        """
+        if self.backend != 'pandas':
+            table = self._to_arrow()
+            for start in range(0, table.num_rows, chunk_size):
+                yield convert(self._arrow_sends(table.slice(start, chunk_size)), self.backend)
+            return
+
+        blocks = zip(self.iter_expand_on('From', 'To', rename1='From', rename2='Recipient', chunk_size=chunk_size),
+                     self.iter_expand_on('From', 'Cc', rename1='From', rename2='Recipient', chunk_size=chunk_size))
+        for on_to_df, on_cc_df in blocks:
+            yield self._combine_sends(on_to_df, on_cc_df)
+
+    def _arrow_sends(self, table=None):
+        """
+        Builds the sends table with Arrow compute functions rather than expand_on.
+
+        :param pyarrow.Table table: Defaults to all extracted data, converted to Arrow.
+        :return: pyarrow.Table
+        """
+        pa = import_pyarrow()
+        if table is None:
+            table = self._to_arrow()
+        parts = []
+        for send_type in ['To', 'Cc']:
+            part = drop_collections(explode(table, send_type, 'Recipient'))
+            parts.append(part.append_column('SendType', pa.array([send_type] * part.num_rows, type=pa.string())))
+        return pa.concat_tables(parts)
+
+    def _get_send_graph(self):
+        """
+        Returns the sender/recipient graph, building it in one pass over the data if it
+        was not built during extraction.
+
+        :return: SendGraph
+        """
+        if self._send_graph is None:
+            graph = SendGraph()
+            for row in zip(self._data['From'], self._data['To'], self._data['Cc']):
+                graph.add(*row)
+            self._send_graph = graph
+        return self._send_graph
+
+    def _get_activity(self, window):
+        """
+        Returns the activity aggregate for a window, reusing the one built during extraction
+        if it matches. Otherwise, messages are aggregated one at a time.
+
+        :param int window: Window width in seconds.
+        :return: WindowedAggregate
+        """
+        if self._activity is not None and self._activity.window == window:
+            return self._activity
+        activity = WindowedAggregate(window, fields=['recipients'])
+        for row in zip(self._data['From'], self._data['To'], self._data['Cc'], self._data['Date']):
+            add_activity(activity, *row)
+        return activity
+
+    def activity(self, window=week):
+        """
+        Returns the number of emails sent, and the number of recipients (To and Cc) they were sent to,
+        per sender and time window. Unlike grouping ``emails`` or ``sends``, this does not build or
+        expand the sends table, but the extracted messages are held in memory as usual. For large
+        archives, ``activity_from`` aggregates without extracting.
+
+        :param int window: Defaults to a week. Window width in seconds. Weeks start on Mondays, 00:00 UTC.
+        :return: pandas.DataFrame with From, window, emails and recipients columns
+         (or pyarrow.Table or polars.DataFrame, depending on the backend)
+        """
+        out_df = self._get_activity(window).to_frame(key_name='From', count_name='emails')
+        return self._output(out_df)
+
+    def _get_text_index(self, workers=None):
+        """
+        Returns the full-text index of message bodies, building it if it was not built during extraction.
+
+        :param int workers: Number of processes used to build the index. Defaults to the number of available cores.
+        :return: TextIndex
+        """
+        if self._text_index is None:
+            if 'Body' not in self._data.columns:
+                raise ValueError('Message bodies were not extracted (headers_only=True), so they cannot be indexed.')
+            self._text_index = TextIndex.build(self._data['Body'], workers=workers, metrics=self.metrics)
+        return self._text_index
+
+    def text_index(self):
+        """
+        Returns the full-text index of message bodies. Its row ids are positions in ``emails``.
+
+        :return: TextIndex
+        """
+        return self._get_text_index()
+
+    def search(self, query, drop_collections=True):
+        """
+        Returns the emails whose bodies contain every word and "quoted phrase" of a query, ignoring case
+        and punctuation. For example, ``mx.search('release "pull request"')``.
+
+        :param str query: Words and double quoted phrases.
+        :param bool drop_collections: Defaults to True. Indicates whether columns with lists/dicts/sets will be dropped.
+        :return: pandas.DataFrame (or pyarrow.Table or polars.DataFrame, depending on the backend)
+        """
+        out_df = self._data.iloc[self._get_text_index().search(query)]
+        if drop_collections is True:
+            out_df = self._drop_collections(out_df)
+        return self._output(out_df)
+
+    @staticmethod
+    def activity_from(source, window=week, workers=None, dedupe=False, metrics=None):
+        """
+        Returns the same table as ``activity``, without extracting messages. Only headers are parsed,
+        and each message is counted and dropped, so memory grows with the number of (sender, window)
+        groups rather than with the number of messages.
+
+        .. code-block:: python
+
+            weekly = MboxExtractor.activity_from('path/to/mbox/dir')
+
+        :param str source: The path to either a single mbox file or a directory containing multiple mbox files,
+         Maildir folders or ``.eml`` files.
+        :param int window: Defaults to a week. Window width in seconds. Weeks start on Mondays, 00:00 UTC.
+        :param int workers: Optional. Number of processes used to parse Maildir and ``.eml`` messages.
+        :param dedupe: Defaults to False. If True (or an SQLite file path), duplicate messages are counted once.
+        :param metrics: Optional. A Metrics object.
+        :return: pandas.DataFrame with From, window, emails and recipients columns
+        """
+        activity = WindowedAggregate(window, fields=['recipients'])
+        seen = make_seen_set(dedupe) if dedupe else None
+        try:
+            mbox_activity(source, activity, workers=workers, metrics=metrics, seen=seen)
+        finally:
+            if seen is not None:
+                seen.close()
+        return activity.to_frame(key_name='From', count_name='emails')
+
+    def send_edges(self, decode=False):
+        """
+        Returns a weighted sender/recipient edge list, with one row per distinct
+        sender/recipient/SendType (and time bucket, if used) combination. Unlike ``sends``,
+        this does not expand the message table.
+
+        :param bool decode: Defaults to False. If False, From and Recipient are integer codes
+         indexing into ``addresses()``. If True, they are address strings.
+        :return: pandas.DataFrame
+        """
+        graph = self._get_send_graph()
+        out_df = graph.edges()
+        if decode is True:
+            labels = pd.Series(graph.addresses)
+            out_df['From'] = labels.values[out_df['From'].values]
+            out_df['Recipient'] = labels.values[out_df['Recipient'].values]
+        return out_df
+
+    def send_matrix(self, send_type=None):
+        """
+        Returns the sender/recipient graph as a SciPy sparse matrix. Requires SciPy.
+
+        :param str send_type: Optional. 'To' or 'Cc'. Defaults to None, which counts both.
+        :return: A tuple of (scipy.sparse.csr_matrix, addresses). Senders are rows and recipients
+         are columns, both in the order of ``addresses``.
+        """
+        graph = self._get_send_graph()
+        return graph.matrix(send_type=send_type), graph.addresses
+
+    def addresses(self):
+        """
+        Returns the list of addresses in the order of their integer codes in ``send_edges``.
+
+        :return: list
+        """
+        return self._get_send_graph().addresses
@@ -0,0 +1,215 @@
+# *********************************************************************************************
+# Copyright (C) 2017 Joel Becker,  Jillian Anderson, Steve McColl and Dr. John McLevey
+#
+# This file is part of the tidyextractors package developed for Dr John McLevey's Networks Lab
+# at the University of Waterloo. For more information, see
+# http://tidyextractors.readthedocs.io/en/latest/
+#
+# tidyextractors is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# tidyextractors is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with tidyextractors.
+# If not, see <http://www.gnu.org/licenses/>.
+# *********************************************************************************************
+
+import io
+import os
+import bz2
+import gzip
+import lzma
+import mailbox
+from email.parser import BytesHeaderParser
+
+# A streaming mbox parser. Messages are split exactly as mailbox.mbox splits them,
+#   but the file is read front to back only once, so reading can start at any
+#   byte offset and does not require a table of contents for the whole file.
+#   Compressed files are decompressed on the fly, and offsets then refer to
+#   positions in the decompressed stream.
+
+linesep = b'\n'
+blank_lines = (b'\n', b'\r\n')
+
+# Parses header blocks only, for the headers_only mode.
+header_parser = BytesHeaderParser()
+
+# Size of the chunks read when skipping ahead in streams that cannot seek.
+skip_chunk_size = 1 << 20
+
+
+def open_zstd(path, mode='rb'):
+    """
+    Opens a zstd compressed file for reading. Requires the zstandard package.
+    :param path: File path.
+    :param mode: Only 'rb' is supported.
+    :return: A binary file-like object.
+    """
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('Reading .zst files requires zstandard. Install it with "pip install zstandard".')
+    reader = zstandard.ZstdDecompressor().stream_reader(open(path, mode), closefd=True)
+    return io.BufferedReader(reader)
+
+
+# Openers for compressed files, by file extension.
+openers = {'.gz': gzip.open,
+           '.bz2': bz2.open,
+           '.xz': lzma.open,
+           '.zst': open_zstd}
+
+
+def is_mbox_file(name):
+    """
+    Checks whether a file name is that of an mbox file, compressed or not.
+    :param name: File name or path.
+    :return: Boolean
+    """
+    base, ext = os.path.splitext(name)
+    if ext in openers:
+        name = base
+    return name.endswith('mbox')
+
+
+class MboxStream(object):
+    """
+    A binary line stream over a (possibly compressed) mbox file, which keeps track of its
+    position in the uncompressed data.
+
+    :param str path: File path.
+    :param int offset: Uncompressed byte offset to start reading at.
+    """
+
+    def __init__(self, path, offset=0):
+        self.stream = openers.get(os.path.splitext(path)[1], open)(path, 'rb')
+        self.position = 0
+        self.skip(offset)
+
+    def skip(self, offset):
+        if self.stream.seekable():
+            self.position = self.stream.seek(offset)
+            return
+        while self.position < offset:
+            chunk = self.stream.read(min(skip_chunk_size, offset - self.position))
+            if not chunk:
+                break
+            self.position += len(chunk)
+
+    def read(self, size):
+        data = self.stream.read(size)
+        self.position += len(data)
+        return data
+
+    def __iter__(self):
+        for line in self.stream:
+            self.position += len(line)
+            yield line
+
+    def close(self):
+        self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def make_message(from_line, lines, last_was_empty):
+    """
+    Builds a message from the lines that follow its "From " line.
+    :param from_line: The message's "From " line (bytes).
+    :param lines: A list of the message's lines (bytes).
+    :param last_was_empty: True if the last line is the blank line separating messages.
+    :return: mailbox.mboxMessage
+    """
+    if last_was_empty:
+        lines = lines[:-1]
+    message = mailbox.mboxMessage(b''.join(lines))
+    message.set_from(from_line.rstrip(b'\r\n')[5:].decode('ascii', 'replace'))
+    return message
+
+
+def make_header_message(lines):
+    """
+    Builds a message from header lines only. The message has no body.
+    :param lines: A list of header lines (bytes).
+    :return: email.message.Message
+    """
+    return header_parser.parsebytes(b''.join(lines))
+
+
+def read_headers(stream):
+    """
+    Reads a message's header lines, stopping at the blank line that ends them.
+    :param stream: A binary file-like object, positioned at the start of a message.
+    :return: A list of header lines (bytes).
+    """
+    lines = []
+    for line in stream:
+        if line in blank_lines:
+            break
+        lines.append(line)
+    return lines
+
+
+def iter_raw_mbox(stream, headers_only=False, offsets=False):
+    """
+    Splits an mbox stream into messages, without parsing them.
+    Lines before the first "From " line are ignored.
+    :param stream: A binary file-like object, positioned at the start of a message (or blank lines).
+    :param headers_only: If True, body lines are skipped over without being kept.
+    :param offsets: If True, each tuple ends with the byte offset of the message's "From " line.
+     Requires a stream with a position attribute, such as an MboxStream.
+    :return: A generator of (from_line, lines, last_was_empty) tuples, as taken by make_message.
+    """
+    from_line = None
+    lines = []
+    last_was_empty = False
+    in_headers = False
+    start = None
+
+    for line in stream:
+        if line.startswith(b'From '):
+            if from_line is not None:
+                yield (from_line, lines, last_was_empty, start) if offsets else (from_line, lines, last_was_empty)
+            if offsets:
+                # The stream's position is already past the line
+                start = stream.position - len(line)
+            from_line = line
+            lines = []
+            last_was_empty = False
+            in_headers = True
+        elif from_line is not None:
+            if headers_only:
+                if in_headers:
+                    if line in blank_lines:
+                        in_headers = False
+                    else:
+                        lines.append(line)
+                continue
+            lines.append(line)
+            last_was_empty = line == linesep
+
+    if from_line is not None:
+        yield (from_line, lines, last_was_empty, start) if offsets else (from_line, lines, last_was_empty)
+
+
+def iter_mbox(stream, headers_only=False):
+    """
+    Parses mbox messages from a binary stream, one message at a time.
+    Lines before the first "From " line are ignored.
+    :param stream: A binary file-like object, positioned at the start of a message (or blank lines).
+    :param headers_only: If True, only headers are parsed. Body lines are skipped over
+     without being kept, and messages have no body.
+    :return: A generator of mailbox.mboxMessage (or email.message.Message if headers_only is True)
+    """
+    for from_line, lines, last_was_empty in iter_raw_mbox(stream, headers_only):
+        if headers_only:
+            yield make_header_message(lines)
+        else:
+            yield make_message(from_line, lines, last_was_empty)
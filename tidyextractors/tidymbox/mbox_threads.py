@@ -0,0 +1,142 @@
+# *********************************************************************************************
+# Copyright (C) 2017 Joel Becker,  Jillian Anderson, Steve McColl and Dr. John McLevey
+#
+# This file is part of the tidyextractors package developed for Dr John McLevey's Networks Lab
+# at the University of Waterloo. For more information, see
+# http://tidyextractors.readthedocs.io/en/latest/
+#
+# tidyextractors is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# tidyextractors is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with tidyextractors.
+# If not, see <http://www.gnu.org/licenses/>.
+# *********************************************************************************************
+
+import re
+
+# Message threading, following Jamie Zawinski's algorithm (https://www.jwz.org/doc/threading.html).
+#   Containers are looked up by Message-ID in a hash table, so threading is linear in the number
+#   of messages and references. The optional subject-grouping step of the algorithm is not used,
+#   since it merges unrelated threads on mailing lists with generic subjects.
+
+message_id_regex = re.compile('<[^<>]+>')
+
+
+def clean_message_ids(value):
+    """
+    Extracts message ids from a Message-ID, In-Reply-To or References header.
+    :param value: Header value (string, email.header.Header, or None)
+    :return: List of message id strings, including angle brackets.
+    """
+    if value is None:
+        return []
+    return message_id_regex.findall(str(value))
+
+
+class Container(object):
+    """
+    A node in the thread tree. Holds a message row, or None for messages
+    that are referenced but not present in the data.
+    """
+    __slots__ = ['row', 'parent', 'children']
+
+    def __init__(self):
+        self.row = None
+        self.parent = None
+        self.children = []
+
+    def is_ancestor_of(self, other):
+        node = other
+        while node is not None:
+            if node is self:
+                return True
+            node = node.parent
+        return False
+
+    def set_parent(self, parent):
+        if self.parent is not None:
+            self.parent.children.remove(self)
+        self.parent = parent
+        if parent is not None:
+            parent.children.append(self)
+
+
+def thread_messages(message_ids, in_reply_to, references):
+    """
+    Reconstructs reply threads.
+    :param message_ids: For each message, its Message-ID or None.
+    :param in_reply_to: For each message, its In-Reply-To id or None.
+    :param references: For each message, a list of referenced ids (oldest first).
+    :return: Three lists with one entry per message: the thread id (the lowest row number
+     among the thread's top-level messages), the parent's row number (None for top-level
+     messages) and the depth in the thread.
+    """
+    id_table = {}
+    containers = []
+
+    for row, (message_id, reply_id, refs) in enumerate(zip(message_ids, in_reply_to, references)):
+
+        # Find or create this message's container. Duplicate and missing ids get a container of their own.
+        container = id_table.get(message_id) if message_id is not None else None
+        if container is None or container.row is not None:
+            container = Container()
+            if message_id is not None and message_id not in id_table:
+                id_table[message_id] = container
+        container.row = row
+        containers.append(container)
+
+        # Link the references together, oldest first, without changing existing links.
+        refs = list(refs)
+        if reply_id is not None and (len(refs) == 0 or refs[-1] != reply_id):
+            refs.append(reply_id)
+        previous = None
+        for ref in refs:
+            ref_container = id_table.get(ref)
+            if ref_container is None:
+                ref_container = Container()
+                id_table[ref] = ref_container
+            if previous is not None and ref_container.parent is None \
+                    and ref_container is not previous and not ref_container.is_ancestor_of(previous):
+                ref_container.set_parent(previous)
+            previous = ref_container
+
+        # The last reference is this message's parent.
+        if previous is not None and (previous is container or container.is_ancestor_of(previous)):
+            previous = None
+        container.set_parent(previous)
+
+    # Walk each tree from its root. Empty containers are skipped, so parents
+    #   and depths refer to the nearest ancestor that is an actual message.
+    count = len(containers)
+    thread_ids = [None] * count
+    parent_ids = [None] * count
+    depths = [None] * count
+
+    roots = [c for c in containers if c.parent is None]
+    roots += [c for c in id_table.values() if c.row is None and c.parent is None]
+    for root in roots:
+        rows = []
+        stack = [(root, None, -1)]
+        while stack:
+            node, parent_row, depth = stack.pop()
+            if node.row is not None:
+                depth += 1
+                parent_ids[node.row] = parent_row
+                depths[node.row] = depth
+                rows.append(node.row)
+                parent_row = node.row
+            for child in node.children:
+                stack.append((child, parent_row, depth))
+
+        if len(rows) == 0:
+            continue
+        thread_id = min(row for row in rows if depths[row] == 0)
+        for row in rows:
+            thread_ids[row] = thread_id
+
+    return thread_ids, parent_ids, depths
@@ -19,12 +19,22 @@
 
 import os
 import re
-import tqdm
-import mailbox
 import warnings
 import pandas as pd
 import email.utils as email
 import email.header as header
+from email import message_from_binary_file
+from concurrent.futures import ProcessPoolExecutor
+from tidyextractors.metrics import default_metrics
+from tidyextractors.tidymbox.mbox_reader import iter_raw_mbox, is_mbox_file, MboxStream, \
+    make_message, make_header_message, read_headers
+from tidyextractors.tidymbox.dedupe import message_key
+from tidyextractors.tidymbox.mbox_cache import MboxCache
+from tidyextractors.tidymbox.mbox_threads import clean_message_ids
+from tidyextractors.tidymbox.header_decoding import decode_header_value, display_name
+
+# Default number of single-message files handed to a worker process at a time.
+default_batch_size = 500
 
 # Adapted from Phil Deutsch's "mbox-analysis" https://github.com/phildeutsch/mbox-analysis
 
@@ -52,7 +62,7 @@ def clean_address(address):
     :return: String (clean email address)
     """
     if isinstance(address, header.Header):
-        return clean_address(address.encode('ascii'))
+        return clean_address(decode_header_value(address))
 
     elif isinstance(address, str):
         address = address.replace("<", "")
@@ -125,67 +135,362 @@ def get_body(message):
     return body
 
 
-def write_table(mboxfile, mailTable):
+def message_row(message, thread_headers=False, headers_only=False, display_names=False):
+    """
+    Extracts a row of data from an email message.
+    :param message: An email.message.Message
+    :param thread_headers: If True, Message-ID, In-Reply-To and References are also extracted.
+    :param headers_only: If True, the body is left out.
+    :param display_names: If True, the sender's decoded display name is also extracted.
+    :return: A list. The first four values are the cleaned From, To, Cc and Date.
+    """
+    clean_from = clean_address(message['From'])
+    clean_to = clean_addresses(message['To'])
+    clean_cc = clean_addresses(message['Cc'])
+
+    try:
+        clean_date = email.parsedate_to_datetime(message['Date'])
+    except:
+        clean_date = None
+
+    row = [
+        clean_from,
+        clean_to,
+        clean_cc,
+        clean_date,
+        decode_header_value(message['Subject'])
+        ]
+
+    if not headers_only:
+        row.append(get_body(message))
+
+    if thread_headers:
+        row.extend([
+            (clean_message_ids(message['Message-ID']) or [None])[0],
+            (clean_message_ids(message['In-Reply-To']) or [None])[0],
+            clean_message_ids(message['References'])
+            ])
+
+    if display_names:
+        row.append(display_name(message['From']))
+
+    return row
+
+
+def add_activity(activity, sender, to, cc, date):
+    """
+    Counts a message in a windowed aggregate of messages per sender, summing its number of recipients.
+    :param activity: A WindowedAggregate with the field 'recipients'.
+    :param sender: Cleaned From address.
+    :param to: List of cleaned To addresses.
+    :param cc: List of cleaned Cc addresses.
+    :param date: The message's datetime, or None.
+    :return: None
+    """
+    activity.add(sender, date, len(to) + len(cc))
+
+
+def write_table(mboxfile, mailTable, send_graph=None, thread_headers=False, offset=0, headers_only=False,
+                metrics=None, activity=None, seen=None, display_names=False):
     """
     Takes a list and extends it with lists of data, which is
     extracted from mbox messages.
-    :param mboxfile: Mbox file name/path
-    :param mailTable: A list (of lists)
-    :return: An extended list of lists
+    :param mboxfile: Mbox file name/path. May be compressed (.gz, .bz2, .xz or .zst).
+    :param mailTable: A list (of lists), or None to only fill send_graph and activity.
+    :param send_graph: Optional SendGraph, to which each message's edges are added.
+    :param thread_headers: If True, Message-ID, In-Reply-To and References are also extracted.
+    :param offset: Byte offset to start parsing at. Must be the start of a message, or the end of the file.
+     For compressed files, this is an offset in the decompressed data.
+    :param headers_only: If True, only headers are parsed and the body is left out.
+    :param metrics: Optional Metrics object, which receives an 'mbox_messages' stage.
+    :param activity: Optional WindowedAggregate, to which each message is added (see add_activity).
+    :param seen: Optional set of message keys (see tidymbox.dedupe). If given, messages whose key was
+     seen before are skipped without being parsed, and each row ends with its message's key.
+    :param display_names: If True, the sender's display name is also extracted.
+    :return: A tuple of (the byte offset of the last message's start, or offset if there were no messages,
+     and the number of rows added for the messages before it). The last message may still be being
+     appended to, so this is where parsing should resume.
     """
-    mail_box_contents = mailbox.mbox(mboxfile)
-
-    m_pbar = tqdm.tqdm(range(0,len(mail_box_contents)))
-    m_pbar.set_description('Extracting mbox messages...')
+    if metrics is None:
+        metrics = default_metrics()
 
     count = 0
-    update_interval = min(50,len(mail_box_contents))
-
-    for message in mail_box_contents:
-        count += 1
-        if count % update_interval == 0:
-            m_pbar.update(update_interval)
-        clean_from = clean_address(message['From'])
-        clean_to = clean_addresses(message['To'])
-        clean_cc = clean_addresses(message['Cc'])
-
-        try:
-            clean_date = email.parsedate_to_datetime(message['Date'])
-        except:
-            clean_date = None
-
-        mailTable.append([
-            clean_from,
-            clean_to,
-            clean_cc,
-            clean_date,
-            message['Subject'],
-            get_body(message)
-            ])
+    update_interval = 50
+    last_start = offset
+    rows_before_last = 0
+    added = 0
+
+    with metrics.stage('mbox_messages', description='Extracting mbox messages...') as stage, \
+            MboxStream(mboxfile, offset) as mbox_stream:
+        for from_line, lines, last_was_empty, start in iter_raw_mbox(mbox_stream, headers_only=headers_only,
+                                                                     offsets=True):
+            count += 1
+            last_start = start
+            rows_before_last = added
+            if count % update_interval == 0:
+                stage.update(update_interval)
+            if seen is not None:
+                key = message_key(lines)
+                if not seen.add(key):
+                    continue
+            if headers_only:
+                message = make_header_message(lines)
+            else:
+                message = make_message(from_line, lines, last_was_empty)
+            row = message_row(message, thread_headers, headers_only, display_names)
+            if seen is not None:
+                row.append(key)
+            if send_graph is not None:
+                send_graph.add(*row[:4])
+            if activity is not None:
+                add_activity(activity, *row[:4])
+            if mailTable is not None:
+                mailTable.append(row)
+            added += 1
+
+        stage.update(count % update_interval)
+        stage.add(bytes=mbox_stream.position - offset)
+
+    return last_start, rows_before_last
+
+
+def parse_message_files(paths, thread_headers=False, headers_only=False, display_names=False, dedupe=False):
+    """
+    Extracts rows of data from files holding one message each (e.g. Maildir or .eml files).
+    Runs in worker processes.
+    :param paths: A list of file paths.
+    :param thread_headers: If True, Message-ID, In-Reply-To and References are also extracted.
+    :param headers_only: If True, files are only read up to the end of their headers.
+    :param display_names: If True, the sender's display name is also extracted.
+    :param dedupe: If True, each row ends with its message's key (see tidymbox.dedupe).
+    :return: A list (of lists)
+    """
+    rows = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            if headers_only or dedupe:
+                lines = read_headers(f)
+            if headers_only:
+                message = make_header_message(lines)
+            else:
+                f.seek(0)
+                message = message_from_binary_file(f)
+        row = message_row(message, thread_headers, headers_only, display_names)
+        if dedupe:
+            row.append(message_key(lines))
+        rows.append(row)
+    return rows
+
+
+def write_message_files(paths, mailTable, send_graph=None, thread_headers=False, workers=None,
+                        batch_size=default_batch_size, headers_only=False, metrics=None, activity=None,
+                        seen=None, display_names=False):
+    """
+    Extends a list with lists of data extracted from single-message files. Files are
+    parsed in batches by a pool of worker processes, since per-file overhead dominates
+    for large Maildir trees.
+    :param paths: A list of file paths.
+    :param mailTable: A list (of lists), or None to only fill send_graph and activity.
+    :param send_graph: Optional SendGraph, to which each message's edges are added.
+    :param thread_headers: If True, Message-ID, In-Reply-To and References are also extracted.
+    :param workers: Number of worker processes. Defaults to the number of cores.
+    :param batch_size: Number of files handed to a worker at a time.
+    :param headers_only: If True, only headers are parsed and the body is left out.
+    :param metrics: Optional Metrics object, which receives a 'message_files' stage.
+    :param activity: Optional WindowedAggregate, to which each message is added (see add_activity).
+    :param seen: Optional set of message keys (see tidymbox.dedupe). If given, workers also return each
+     message's key, files whose key was seen before are left out, and each row ends with its message's key.
+    :param display_names: If True, the sender's display name is also extracted.
+    :return: None
+    """
+    if metrics is None:
+        metrics = default_metrics()
+
+    dedupe = seen is not None
+    batches = [paths[i:i+batch_size] for i in range(0, len(paths), batch_size)]
+
+    with metrics.stage('message_files', total=len(paths), description='Extracting message files...') as stage, \
+            ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        for rows in pool.map(parse_message_files, batches,
+                             [thread_headers] * len(batches), [headers_only] * len(batches),
+                             [display_names] * len(batches), [dedupe] * len(batches)):
+            stage.update(len(rows))
+            for row in rows:
+                # Keys are made by the workers, and checked here in file order
+                if dedupe and not seen.add(row[-1]):
+                    continue
+                if send_graph is not None:
+                    send_graph.add(*row[:4])
+                if activity is not None:
+                    add_activity(activity, *row[:4])
+                if mailTable is not None:
+                    mailTable.append(row)
+        stage.add(calls=len(batches))
+
+
+def find_sources(path):
+    """
+    Finds the mbox files and single-message files under a path.
+    Single-message files are .eml files and messages in Maildir folders (the cur and new
+    subdirectories of a directory that has cur, new and tmp subdirectories).
+    :param path: Path to a file OR a directory.
+    :return: A tuple of (list of mbox file paths, list of message file paths).
+    """
+    if os.path.isfile(path):
+        if path.endswith('.eml'):
+            return [], [path]
+        return [path], []
+
+    mbox_files = []
+    message_files = []
+    for dirpath, dirnames, files in os.walk(path):
+        parent = os.path.dirname(dirpath)
+        in_maildir = os.path.basename(dirpath) in ('cur', 'new') and \
+            all(os.path.isdir(os.path.join(parent, d)) for d in ('cur', 'new', 'tmp'))
+        for f in sorted(files):
+            if in_maildir or f.endswith('.eml'):
+                message_files.append(os.path.join(dirpath, f))
+            elif is_mbox_file(f):
+                mbox_files.append(os.path.join(dirpath, f))
+    return mbox_files, message_files
+
+
+def make_frame(mail_table, thread_headers=False, headers_only=False, dedupe=False, display_names=False):
+    """
+    Builds a DataFrame from rows created by write_table.
+    :param mail_table: A list (of lists)
+    :param thread_headers: True if the rows include threading headers.
+    :param headers_only: True if the rows have no body.
+    :param dedupe: True if the rows end with message keys.
+    :param display_names: True if the rows include the sender's display name.
+    :return: A Pandas DataFrame
+    """
+    columns = ['From', 'To', 'Cc', 'Date', 'Subject']
+    if not headers_only:
+        columns += ['Body']
+    if thread_headers:
+        columns += ['Message-ID', 'In-Reply-To', 'References']
+    if display_names:
+        columns += ['FromName']
+    if dedupe:
+        columns += ['DedupeKey']
+    return pd.DataFrame(mail_table, columns=columns)
 
 
-def mbox_to_pandas(mbox_path):
+def mbox_to_pandas(mbox_path, send_graph=None, thread_headers=False, cache_dir=None, workers=None,
+                   headers_only=False, metrics=None, activity=None, seen=None, display_names=False):
     """
-    Extracts all mbox messages from mbox files in mbox_path.
-    :param mbox_path: Path to an mbox file OR a directory containing mbox files.
+    Extracts all mbox messages from mbox files in mbox_path, along with messages in
+    Maildir folders and .eml files.
+    :param mbox_path: Path to an mbox or .eml file OR a directory containing mbox files, .eml files or Maildirs.
+     Files compressed with gzip, bzip2, xz or zstd (e.g. ".mbox.gz") are decompressed while parsing.
+    :param send_graph: Optional SendGraph, which is filled during extraction.
+    :param thread_headers: If True, add Message-ID, In-Reply-To and References columns.
+    :param cache_dir: Optional directory in which parsed rows and file offsets are kept between runs,
+     so that only messages appended since the last run are parsed.
+    :param workers: Number of processes used to parse Maildir and .eml files. Defaults to the number of cores.
+    :param headers_only: If True, only message headers are parsed, and there is no Body column.
+    :param metrics: Optional Metrics object, which receives the 'mbox_files', 'mbox_messages'
+     and 'message_files' stages.
+    :param activity: Optional WindowedAggregate, which is filled during extraction (see add_activity).
+    :param seen: Optional set of message keys (see tidymbox.dedupe). If given, messages that were already
+     extracted (with the same Message-ID, or the same headers if they have none) are skipped. In mbox files, they are skipped before they are parsed.
+    :param display_names: If True, add a FromName column with the sender's decoded display name.
     :return: A Pandas DataFrame with messages as rows/observations.
     """
-    if os.path.isfile(mbox_path):
-        mbox_files = [mbox_path]
-    else:
-        mbox_files = [os.path.join(dirpath, f) for dirpath, dirnames, files in os.walk(mbox_path) for f in files if f.endswith('mbox')]
+    if metrics is None:
+        metrics = default_metrics()
+
+    mbox_files, message_files = find_sources(mbox_path)
+
+    cache = None
+    if cache_dir is not None:
+        cache = MboxCache(cache_dir, options={'thread_headers': thread_headers, 'headers_only': headers_only,
+                                              'dedupe': seen is not None, 'display_names': display_names})
+    dedupe = seen is not None
 
     mail_table = []
+    frames = []
+
+    # Cached rows and resume offsets of each mbox file
+    resumed = {}
+    if cache is not None:
+        for mbox_file in mbox_files:
+            resumed[mbox_file] = cache.resume(mbox_file)
+            cached_df = resumed[mbox_file][0]
+            if cached_df is not None and dedupe:
+                # Cached keys are all known before any file is parsed, so that copies of
+                #   cached messages are skipped in every file, whatever their order
+                seen.load(cached_df['DedupeKey'])
+
+    with metrics.stage('mbox_files', total=len(mbox_files), description='Extracting mbox files...') as stage:
+        for mbox_file in mbox_files:
+            if cache is None:
+                write_table(mbox_file, mail_table, send_graph=send_graph, thread_headers=thread_headers,
+                            headers_only=headers_only, metrics=metrics, activity=activity, seen=seen,
+                            display_names=display_names)
+            else:
+                # Parse only what was appended since the last run
+                cached_df, offset = resumed.pop(mbox_file)
+                file_table = []
+                resume, complete = write_table(mbox_file, file_table, send_graph=send_graph,
+                                               thread_headers=thread_headers, offset=offset, headers_only=headers_only,
+                                               metrics=metrics, activity=activity, seen=seen,
+                                               display_names=display_names)
+                file_df = make_frame(file_table, thread_headers, headers_only, dedupe, display_names)
+                if cached_df is not None:
+                    for row in zip(cached_df['From'], cached_df['To'], cached_df['Cc'], cached_df['Date']):
+                        if send_graph is not None:
+                            send_graph.add(*row)
+                        if activity is not None:
+                            add_activity(activity, *row)
+                    file_df = pd.concat([cached_df, file_df], ignore_index=True)
+                # The last message may have been only partly appended, so it is parsed again next time
+                cache.save(mbox_file, file_df.iloc[:len(file_df) - len(file_table) + complete], resume)
+                frames.append(file_df)
+            stage.update(1)
 
-    f_pbar = tqdm.tqdm(range(0,len(mbox_files)))
-    f_pbar.set_description('Extracting mbox files...')
+    if len(message_files) > 0:
+        file_table = mail_table if cache is None else []
+        write_message_files(message_files, file_table, send_graph=send_graph,
+                            thread_headers=thread_headers, workers=workers, headers_only=headers_only,
+                            metrics=metrics, activity=activity, seen=seen, display_names=display_names)
+        if cache is not None:
+            frames.append(make_frame(file_table, thread_headers, headers_only, dedupe, display_names))
 
-    for mbox_file in mbox_files:
-        write_table(mbox_file, mail_table)
-        f_pbar.update(1)
+    if cache is None:
+        df_out = make_frame(mail_table, thread_headers, headers_only, dedupe, display_names)
+    else:
+        df_out = pd.concat(frames, ignore_index=True) if frames else \
+            make_frame([], thread_headers, headers_only, dedupe, display_names)
+    if dedupe:
+        df_out = df_out.drop(columns='DedupeKey')
 
-    df_out = pd.DataFrame(mail_table)
-    df_out.columns = ['From', 'To', 'Cc', 'Date', 'Subject', 'Body']
     df_out['NumTo'] = df_out['To'].map(lambda i: len(i))
     df_out['NumCC'] = df_out['Cc'].map(lambda i: len(i))
-    return df_out
\ No newline at end of file
+    return df_out
+
+
+def mbox_activity(mbox_path, activity, workers=None, metrics=None, seen=None):
+    """
+    Aggregates messages per sender and time window without building a table of messages. Only
+    headers are parsed, and each message is added to the aggregate and then dropped.
+    :param mbox_path: Path to an mbox or .eml file OR a directory containing mbox files, .eml files or Maildirs.
+    :param activity: A WindowedAggregate with the field 'recipients' (see add_activity).
+    :param workers: Number of processes used to parse Maildir and .eml files. Defaults to the number of cores.
+    :param metrics: Optional Metrics object, which receives the 'mbox_files', 'mbox_messages'
+     and 'message_files' stages.
+    :param seen: Optional set of message keys (see tidymbox.dedupe). If given, duplicate messages are counted once.
+    :return: None
+    """
+    if metrics is None:
+        metrics = default_metrics()
+
+    mbox_files, message_files = find_sources(mbox_path)
+    with metrics.stage('mbox_files', total=len(mbox_files), description='Extracting mbox files...') as stage:
+        for mbox_file in mbox_files:
+            write_table(mbox_file, None, headers_only=True, metrics=metrics, activity=activity, seen=seen)
+            stage.update(1)
+    if len(message_files) > 0:
+        write_message_files(message_files, None, workers=workers, headers_only=True, metrics=metrics,
+                            activity=activity, seen=seen)
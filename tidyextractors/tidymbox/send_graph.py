@@ -0,0 +1,116 @@
+# *********************************************************************************************
+# Copyright (C) 2017 Joel Becker,  Jillian Anderson, Steve McColl and Dr. John McLevey
+#
+# This file is part of the tidyextractors package developed for Dr John McLevey's Networks Lab
+# at the University of Waterloo. For more information, see
+# http://tidyextractors.readthedocs.io/en/latest/
+#
+# tidyextractors is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# tidyextractors is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with tidyextractors.
+# If not, see <http://www.gnu.org/licenses/>.
+# *********************************************************************************************
+
+import numpy as np
+import pandas as pd
+
+
+class SendGraph(object):
+    """
+    Accumulates weighted sender/recipient edges one message at a time.
+
+    Addresses are interned to integer codes as they are seen, and only one counter is kept per
+    distinct (sender, recipient, send type, time bucket) edge, so memory grows with the number of
+    edges rather than the number of messages.
+
+    :param int time_bucket: Optional. Width of time buckets in seconds (e.g. 604800 for weeks).
+     If None, edges are not split by time.
+    """
+
+    send_types = ['To', 'Cc']
+
+    def __init__(self, time_bucket=None):
+        self.time_bucket = time_bucket
+        self.addresses = []
+        self._address_index = {}
+        self._weights = {}
+
+    def _code(self, address):
+        code = self._address_index.get(address)
+        if code is None:
+            code = len(self.addresses)
+            self._address_index[address] = code
+            self.addresses.append(address)
+        return code
+
+    def _bucket(self, date):
+        if self.time_bucket is None:
+            return None
+        if date is None:
+            return -1
+        timestamp = int(date.timestamp())
+        return timestamp - timestamp % self.time_bucket
+
+    def add(self, sender, to, cc, date=None):
+        """
+        Adds the edges of one message.
+
+        :param str sender: The cleaned sender address.
+        :param list to: Cleaned "To" addresses.
+        :param list cc: Cleaned "Cc" addresses.
+        :param datetime.datetime date: The message date. Only used with time buckets.
+        :return: None
+        """
+        sender_code = self._code(sender)
+        bucket = self._bucket(date)
+        for send_type, recipients in enumerate((to, cc)):
+            for recipient in recipients:
+                key = (sender_code, self._code(recipient), send_type, bucket)
+                self._weights[key] = self._weights.get(key, 0) + 1
+
+    def edges(self):
+        """
+        Returns the weighted edge list with integer-coded addresses.
+        Codes index into ``addresses``.
+
+        :return: pandas.DataFrame with From, Recipient, SendType and Weight columns, plus a
+         Bucket column (the bucket's start time) if time buckets are used.
+        """
+        keys = list(self._weights.keys())
+        n = len(keys)
+        out_df = pd.DataFrame({
+            'From': np.fromiter((k[0] for k in keys), dtype=np.int64, count=n),
+            'Recipient': np.fromiter((k[1] for k in keys), dtype=np.int64, count=n),
+            'SendType': pd.Categorical.from_codes(np.fromiter((k[2] for k in keys), dtype=np.int8, count=n),
+                                                  categories=self.send_types),
+            'Weight': np.fromiter(self._weights.values(), dtype=np.int64, count=n)
+        })
+        if self.time_bucket is not None:
+            buckets = pd.Series(np.fromiter((k[3] for k in keys), dtype=np.int64, count=n))
+            out_df['Bucket'] = pd.to_datetime(buckets.where(buckets >= 0), unit='s', utc=True)
+        return out_df
+
+    def matrix(self, send_type=None):
+        """
+        Returns the sender/recipient adjacency matrix, summed over time buckets. Requires SciPy.
+
+        :param str send_type: Optional. 'To' or 'Cc'. Defaults to None, which sums both.
+        :return: scipy.sparse.csr_matrix with senders as rows and recipients as columns.
+        """
+        try:
+            import scipy.sparse as sparse
+        except ImportError:
+            raise ImportError('Sparse matrix export requires SciPy. Install it with "pip install scipy".')
+
+        edges = self.edges()
+        if send_type is not None:
+            edges = edges[edges['SendType'] == send_type]
+        n = len(self.addresses)
+        return sparse.coo_matrix((edges['Weight'].values, (edges['From'].values, edges['Recipient'].values)),
+                                 shape=(n, n)).tocsr()
@@ -17,4 +17,5 @@
 # If not, see <http://www.gnu.org/licenses/>.
 # *********************************************************************************************
 
-from tidyextractors.tidytwitter.twitter_extractor import TwitterExtractor
\ No newline at end of file
+from tidyextractors.tidytwitter.twitter_extractor import TwitterExtractor
+from tidyextractors.tidytwitter.credential_pool import CredentialPool
@@ -0,0 +1,222 @@
+# *********************************************************************************************
+# Copyright (C) 2017 Joel Becker,  Jillian Anderson, Steve McColl and Dr. John McLevey
+#
+# This file is part of the tidyextractors package developed for Dr John McLevey's Networks Lab
+# at the University of Waterloo. For more information, see
+# http://tidyextractors.readthedocs.io/en/latest/
+#
+# tidyextractors is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# tidyextractors is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with tidyextractors.
+# If not, see <http://www.gnu.org/licenses/>.
+# *********************************************************************************************
+
+import time
+import functools
+import threading
+
+# Rate limit scheduling across several sets of API credentials. The Twitter API limits each
+#   credential to a number of requests per endpoint and 15 minute window, and reports the
+#   requests remaining, and when the window resets, in the headers of every response. Each
+#   request goes to the credential with the most requests remaining for its endpoint. A
+#   credential that hits its limit is skipped until its window resets, and the pool only
+#   sleeps once every credential is exhausted, until the earliest reset.
+
+credential_names = ['access_token', 'access_secret', 'consumer_key', 'consumer_secret']
+
+# Length of a rate limit window, in seconds, assumed when a response does not give its reset time.
+default_window = 15 * 60
+
+# HTTP status codes of rate limited responses.
+rate_limit_statuses = (420, 429)
+
+
+def check_credentials(credentials):
+    """
+    :param dict credentials: A set of API credentials.
+    :return: None. Raises ValueError if a credential is missing.
+    """
+    for cred in credential_names:
+        if cred not in credentials:
+            raise ValueError('API credentials missing from keyword arguments: {}'.format(cred))
+
+
+def response_status(response):
+    """
+    :param response: An HTTP response (from requests or httplib), or None.
+    :return: The status code, or None.
+    """
+    return getattr(response, 'status_code', getattr(response, 'status', None))
+
+
+def is_rate_limit_error(error):
+    """
+    :param Exception error: An exception raised by an API call.
+    :return: True if the call was rate limited (e.g. tweepy's TooManyRequests or RateLimitError).
+    """
+    return response_status(getattr(error, 'response', None)) in rate_limit_statuses
+
+
+class CredentialPool(object):
+    """
+    Stands in for ``tweepy.API``, spreading requests over several API objects, each with its own
+    credentials, so throughput grows with the number of credentials.
+
+    Pass one to ``TwitterExtractor`` with the ``api`` keyword argument, or pass a list of credential
+    dictionaries with the ``credentials`` keyword argument to have one made.
+
+    :param list apis: ``tweepy.API`` objects (or objects with the same methods and ``last_response``
+     attribute), created without ``wait_on_rate_limit``.
+    :param clock: Optional. Returns the current time in epoch seconds. Defaults to ``time.time``.
+    :param sleep: Optional. Sleeps for a number of seconds. Defaults to ``time.sleep``.
+    """
+
+    # Seconds added to reset times before a credential is used again.
+    margin = 1
+
+    def __init__(self, apis, clock=time.time, sleep=time.sleep):
+        if not apis:
+            raise ValueError('A CredentialPool needs at least one API object.')
+        self.apis = list(apis)
+        self.clock = clock
+        self.sleep = sleep
+        self.calls = [0] * len(self.apis)
+        self.waited = 0
+        # (api index, endpoint) -> [remaining requests, reset time]
+        self._limits = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_credentials(cls, credentials, **kwargs):
+        """
+        Makes a pool of ``tweepy.API`` objects. Requires tweepy.
+        :param list credentials: Dictionaries with the access_token, access_secret, consumer_key
+         and consumer_secret of each set of credentials.
+        :param kwargs: Keyword arguments for CredentialPool.
+        :return: CredentialPool
+        """
+        # tweepy is imported here, since it is slow to import
+        import tweepy
+
+        apis = []
+        for c in credentials:
+            check_credentials(c)
+            auth = tweepy.OAuthHandler(c['consumer_key'], c['consumer_secret'])
+            auth.set_access_token(c['access_token'], c['access_secret'])
+            apis.append(tweepy.API(auth))
+        return cls(apis, **kwargs)
+
+    def remaining(self, endpoint):
+        """
+        :param str endpoint: An API method name, e.g. 'user_timeline'.
+        :return: A list with the known requests remaining for each credential, or None where unknown.
+        """
+        now = self.clock()
+        with self._lock:
+            return [self._remaining(i, endpoint, now) for i in range(len(self.apis))]
+
+    def _remaining(self, i, endpoint, now):
+        limit = self._limits.get((i, endpoint))
+        if limit is None or limit[1] + self.margin <= now:
+            # Unknown, or the window has reset
+            return None
+        return limit[0]
+
+    def _choose(self, endpoint):
+        """
+        Picks the credential for a request, sleeping if every credential is exhausted.
+        :param str endpoint: An API method name.
+        :return: The index of an API object.
+        """
+        while True:
+            now = self.clock()
+            with self._lock:
+                best, best_remaining = None, 0
+                for i in range(len(self.apis)):
+                    remaining = self._remaining(i, endpoint, now)
+                    if remaining is None:
+                        # Untried credentials are used first, which also learns their limits
+                        remaining = float('inf')
+                    if remaining > best_remaining:
+                        best, best_remaining = i, remaining
+                if best is not None:
+                    limit = self._limits.get((best, endpoint))
+                    if limit is not None and best_remaining != float('inf'):
+                        limit[0] -= 1
+                    self.calls[best] += 1
+                    return best
+                wait = min(self._limits[(i, endpoint)][1] for i in range(len(self.apis))) + self.margin - now
+            if wait > 0:
+                self.waited += wait
+                self.sleep(wait)
+
+    def _update(self, i, endpoint, response, limited=False):
+        """
+        Records a credential's limit from the headers of its latest response.
+        :param int i: Index of the API object.
+        :param str endpoint: An API method name.
+        :param response: The response, or None.
+        :param bool limited: True if the request was rate limited.
+        :return: None
+        """
+        headers = getattr(response, 'headers', None) or {}
+        remaining = headers.get('x-rate-limit-remaining')
+        reset = headers.get('x-rate-limit-reset')
+        with self._lock:
+            limit = self._limits.get((i, endpoint))
+            if limited:
+                remaining = 0
+            elif remaining is not None:
+                remaining = int(remaining)
+            elif limit is not None:
+                # Counted down when the request was scheduled
+                remaining = limit[0]
+            if reset is not None:
+                reset = int(reset)
+            elif limited:
+                reset = self.clock() + default_window
+            elif limit is not None:
+                reset = limit[1]
+            if remaining is not None and reset is not None:
+                self._limits[(i, endpoint)] = [remaining, reset]
+
+    def call(self, endpoint, *args, **kwargs):
+        """
+        Makes a request with the credential that has the most requests remaining, moving on to
+        other credentials if it is rate limited.
+        :param str endpoint: An API method name, e.g. 'get_user'.
+        :param args: Arguments for the method.
+        :param kwargs: Keyword arguments for the method.
+        :return: The method's result.
+        """
+        while True:
+            i = self._choose(endpoint)
+            api = self.apis[i]
+            try:
+                result = getattr(api, endpoint)(*args, **kwargs)
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    raise
+                self._update(i, endpoint, e.response, limited=True)
+                continue
+            self._update(i, endpoint, getattr(api, 'last_response', None))
+            return result
+
+    def get_user(self, *args, **kwargs):
+        return self.call('get_user', *args, **kwargs)
+
+    def user_timeline(self, *args, **kwargs):
+        return self.call('user_timeline', *args, **kwargs)
+
+    def __getattr__(self, name):
+        # Other API methods are scheduled in the same way
+        apis = self.__dict__.get('apis')
+        if name.startswith('_') or not apis or not callable(getattr(apis[0], name, None)):
+            raise AttributeError("'CredentialPool' object has no attribute '{}'".format(name))
+        return functools.partial(self.call, name)
@@ -0,0 +1,218 @@
+# *********************************************************************************************
+# Copyright (C) 2017 Joel Becker,  Jillian Anderson, Steve McColl and Dr. John McLevey
+#
+# This file is part of the tidyextractors package developed for Dr John McLevey's Networks Lab
+# at the University of Waterloo. For more information, see
+# http://tidyextractors.readthedocs.io/en/latest/
+#
+# tidyextractors is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# tidyextractors is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with tidyextractors.
+# If not, see <http://www.gnu.org/licenses/>.
+# *********************************************************************************************
+
+import os
+import re
+import datetime
+import collections
+from concurrent.futures import ProcessPoolExecutor
+from tidyextractors.metrics import default_metrics
+from tidyextractors.tidymbox.mbox_reader import openers
+
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+# An offline source for TwitterExtractor. Tweets and users previously collected from the
+#   Twitter API are read from JSON Lines dumps (one v1.1 tweet or user object per line,
+#   optionally compressed) instead of being fetched. Blocks of lines are parsed by worker
+#   processes, with orjson if it is installed, and reduced to user rows and tweet
+#   dictionaries like those made from the API. Blocks are merged in file order.
+
+# Format of created_at values in Twitter API objects, e.g. 'Wed Oct 10 20:19:24 +0000 2018'.
+twitter_time_format = '%a %b %d %H:%M:%S %z %Y'
+
+# Retweets start with "RT @author".
+retweet_regex = re.compile(r'RT\b\s*(@\w+)?')
+
+# File extensions of JSON Lines dumps, before any compression extension.
+archive_extensions = ('.jsonl', '.ndjson', '.json')
+
+# Default number of lines parsed by a worker process at a time.
+default_block_size = 5000
+
+
+def is_archive_file(name):
+    """
+    Checks whether a file name is that of a JSON Lines dump, compressed or not.
+    :param name: File name or path.
+    :return: Boolean
+    """
+    base, ext = os.path.splitext(name)
+    if ext in openers:
+        name = base
+    return name.endswith(archive_extensions)
+
+
+def find_archive_files(path):
+    """
+    :param str path: A JSON Lines file, or a directory of them.
+    :return: A sorted list of file paths.
+    """
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, f) for f in os.listdir(path) if is_archive_file(f))
+    return [path]
+
+
+def parse_time(value):
+    """
+    :param str value: A Twitter created_at value, or None.
+    :return: A UTC datetime, or None.
+    """
+    if not isinstance(value, str):
+        return value
+    return datetime.datetime.strptime(value, twitter_time_format).astimezone(datetime.timezone.utc)
+
+
+def user_key(user):
+    """
+    :param dict user: A Twitter API user object.
+    :return: The user's id, as a string.
+    """
+    return user.get('id_str') or str(user.get('id'))
+
+
+def user_row(user):
+    """
+    Makes a user row from a user object, with the attributes tweepy gives a User.
+    :param dict user: A Twitter API user object.
+    :return: dict
+    """
+    row = {k: v for k, v in user.items() if k != 'status'}
+    row['created_at'] = parse_time(row.get('created_at'))
+    return row
+
+
+def tweet_dict(tweet):
+    """
+    Makes a tweet's entry in its user's tweets column, as made from the API.
+    :param dict tweet: A Twitter API tweet object.
+    :return: dict
+    """
+    text = tweet.get('text', tweet.get('full_text'))
+    match = retweet_regex.match(text or '')
+    return {'created': parse_time(tweet.get('created_at')),
+            'text': text,
+            'retweet': match is not None,
+            'rt_author': (match.group(1) or '') if match is not None else ''}
+
+
+def parse_block(lines):
+    """
+    Parses a block of lines. Runs in worker processes.
+    :param list lines: Lines (bytes) holding a tweet or user object each.
+    :return: A tuple of (dict mapping user keys to (user row, True if from a user object rather
+     than embedded in a tweet)), and a list of (user key, tweet id, tweet dict) tuples.
+    """
+    users = {}
+    tweets = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        obj = loads(line)
+        if 'user' in obj:
+            user = obj['user']
+            key = user_key(user)
+            if key not in users:
+                users[key] = (user_row(user), False)
+            tweets.append((key, obj.get('id_str') or str(obj['id']), tweet_dict(obj)))
+        elif 'screen_name' in obj:
+            users[user_key(obj)] = (user_row(obj), True)
+    return users, tweets
+
+
+def iter_blocks(paths, block_size):
+    """
+    :param list paths: JSON Lines files, optionally compressed.
+    :param int block_size: Lines per block.
+    :return: A generator of lists of lines.
+    """
+    for path in paths:
+        opener = openers.get(os.path.splitext(path)[1], open)
+        with opener(path, 'rb') as f:
+            block = []
+            for line in f:
+                block.append(line)
+                if len(block) == block_size:
+                    yield block
+                    block = []
+            if block:
+                yield block
+
+
+def iter_parsed_blocks(paths, workers=None, block_size=default_block_size):
+    """
+    Parses blocks of lines in worker processes, keeping a bounded number of blocks in flight.
+    :param list paths: JSON Lines files.
+    :param int workers: Number of processes. Defaults to the number of available cores. With 1,
+     blocks are parsed in this process.
+    :param int block_size: Lines per block.
+    :return: A generator of parse_block results, in file order.
+    """
+    if workers == 1:
+        for block in iter_blocks(paths, block_size):
+            yield parse_block(block)
+        return
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = collections.deque()
+        for block in iter_blocks(paths, block_size):
+            pending.append(pool.submit(parse_block, block))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def read_archive(path, extract_tweets=True, workers=None, block_size=default_block_size, metrics=None):
+    """
+    Reads users and their tweets from JSON Lines dumps.
+    :param str path: A JSON Lines file, or a directory of them. Files may be compressed (.gz, .bz2, .xz or .zst).
+    :param bool extract_tweets: If True, each row gets a tweets column, mapping tweet ids to tweet data.
+    :param int workers: Number of processes used to parse lines. Defaults to the number of available cores.
+    :param int block_size: Lines parsed by a process at a time.
+    :param metrics: Optional Metrics object, which receives a 'twitter_archive' stage.
+    :return: A list of user row dictionaries, in order of first appearance. A user's row is taken from its
+     user object if the dump has one, or else from a tweet.
+    """
+    if metrics is None:
+        metrics = default_metrics()
+
+    users = {}
+    tweets = collections.defaultdict(dict)
+    paths = find_archive_files(path)
+    with metrics.stage('twitter_archive', description='Reading tweet archives...') as stage:
+        for block_users, block_tweets in iter_parsed_blocks(paths, workers=workers, block_size=block_size):
+            for key, (row, from_user_object) in block_users.items():
+                # User objects take precedence over copies embedded in tweets
+                if key not in users or from_user_object:
+                    users[key] = (row, from_user_object)
+            for key, tweet_id, tweet in block_tweets:
+                tweets[key][tweet_id] = tweet
+            stage.update(len(block_tweets))
+        stage.add(bytes=sum(os.path.getsize(p) for p in paths))
+
+    rows = []
+    for key, (row, from_user_object) in users.items():
+        if extract_tweets is True:
+            row['tweets'] = tweets.get(key) or []
+        rows.append(row)
+    return rows
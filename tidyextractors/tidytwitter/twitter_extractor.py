@@ -17,14 +17,13 @@
 # If not, see <http://www.gnu.org/licenses/>.
 # *********************************************************************************************
 
-import tqdm
-import nltk
 import types
-import tweepy
 import pandas as pd
-from tweepy import OAuthHandler
 from tidyextractors import BaseExtractor
-from nltk.tokenize import TweetTokenizer
+from tidyextractors.arrow_output import explode, convert, drop_collections
+from tidyextractors.text_index import TextIndex
+from tidyextractors.tidytwitter.tweet_archive import read_archive
+from tidyextractors.tidytwitter.credential_pool import CredentialPool, check_credentials
 from tidyextractors.tidytwitter.twitter_object_handlers import twitter_object_handlers_lookup
 
 
@@ -34,7 +33,10 @@ class TwitterExtractor(BaseExtractor):
     has methods for outputting data into the ``users`` and ``tweets`` tidy formats, and a
     raw untidy format.
 
-    :param list source: A list of user screen name strings.
+    :param source: A list of user screen name strings, or the path to a JSON Lines dump of
+     previously collected tweets and users (or a directory of them). Dumps hold one Twitter API
+     tweet or user object per line, and may be compressed (.gz, .bz2, .xz or .zst). Dumps are
+     read offline, so credentials are not needed.
     :param bool auto_extract: Defaults to True. If True, data is extracted automatically.
      Otherwise, extraction must be initiated through the internal interface.
     :param str access_token: One of four required keyword arguments that make up a
@@ -45,53 +47,111 @@ class TwitterExtractor(BaseExtractor):
      complete set of Twitter API credentials.
     :param str consumer_secret: One of four required keyword arguments that make up a
      complete set of Twitter API credentials.
+    :param api: Optional. An object with the ``get_user`` and ``user_timeline`` methods of
+     ``tweepy.API``, used instead of connecting to Twitter. If given, credentials are not needed.
+    :param list credentials: Optional. A list of dictionaries, each a complete set of Twitter API
+     credentials, used instead of the four credential keyword arguments. Requests are spread over
+     the credentials by their remaining rate limits (see ``CredentialPool``), so extraction only
+     waits for a rate limit window to reset once every credential is exhausted.
+    :param int workers: Optional. Number of processes used to parse JSON Lines dumps.
+     Defaults to the number of available cores.
+    :param text_index: Defaults to False. If True, a full-text index of tweet texts, used by ``search``,
+     is built during extraction. If a file path, the index is also saved there, and can be loaded later
+     with ``TextIndex.load``.
 
     """
 
-    def _extract(self, source, extract_tweets=True, *args, **kwargs):
+    # Tweets become lists of structs in Arrow output, keyed by tweet id
+    _key_names = {'tweets': 'tweet_id'}
+
+    # Users
+    _identity_columns = [('person_id', {'name': 'name', 'handle': 'screen_name'})]
+
+    # Full-text index over tweet texts. Built during extraction, or on first use.
+    _text_index = None
+
+    # The tweets table, expanded from the users table on first use and shared by tweets and search.
+    #   A pyarrow.Table unless the backend is pandas.
+    _tweets_table = None
+
+    def _extract(self, source, extract_tweets=True, api=None, text_index=False, workers=None, *args, **kwargs):
         """
-        Extracts user data Using the twitter API. Mutates _data.
-        NOTE: TwitterExtractor requires a complete set of Twitter API credentials
+        Extracts user data Using the twitter API, or from JSON Lines dumps. Mutates _data.
+        NOTE: Unless source is a dump, TwitterExtractor requires a complete set of Twitter API credentials
         to initialize: 'access_token', 'access_secret', 'consumer_key', and 'consumer_secret'.
 
-        :param list source: A list of user screen name strings.
+        :param source: A list of user screen name strings, or the path to a JSON Lines dump (or a directory of them).
+        :param api: Optional. An object to use in place of ``tweepy.API`` (e.g. a stub for testing
+         or benchmarking). If given, credentials are not needed.
+        :param text_index: If True (or a file path to save it to), build the full-text index of tweet texts.
+        :param int workers: Number of processes used to parse JSON Lines dumps.
         :param args: Arbitrary arguments for extensibility.
         :param kwargs: Arbitrary keyword arguments for extensibility.
         :return: None
         """
-        # Check that the proper API keywords were provided.
-        for cred in ['access_token', 'access_secret', 'consumer_key', 'consumer_secret']:
-            if cred not in kwargs:
-                raise ValueError('API credentials missing from keyword arguments: {}'.format(cred))
+        if isinstance(source, str):
+            # Offline source
+            rows = read_archive(source, extract_tweets=extract_tweets, workers=workers, metrics=self.metrics)
+        else:
+            rows = self._fetch_rows(source, extract_tweets=extract_tweets, api=api, **kwargs)
+
+        self._data = pd.DataFrame.from_records(rows)
+
+        # Index tweet texts
+        if text_index:
+            self._get_text_index()
+            if text_index is not True:
+                self._text_index.save(text_index)
+
+    def _fetch_rows(self, source, extract_tweets=True, api=None, **kwargs):
+        """
+        Fetches user data and tweets from the Twitter API.
+
+        :param list source: A list of user screen name strings.
+        :param bool extract_tweets: If True, fetch each user's tweets.
+        :param api: Optional. An object to use in place of ``tweepy.API``.
+        :param kwargs: API credentials, or a list of them as credentials, unless api is given.
+        :return: A list of user row dictionaries.
+        """
+        if api is not None:
+            self._api = api
+        elif 'credentials' in kwargs:
+            # Several sets of credentials, scheduled by their rate limits
+            self._api = CredentialPool.from_credentials(kwargs['credentials'])
+        else:
+            # tweepy is imported here, since it is slow to import and not needed with a stand-in API
+            import tweepy
+
+            # Check that the proper API keywords were provided.
+            check_credentials(kwargs)
 
-        # Set up API access
-        self._auth = OAuthHandler(kwargs['consumer_key'], kwargs['consumer_secret'])
-        self._auth.set_access_token(kwargs['access_token'],kwargs['access_secret'])
-        self._api = tweepy.API(self._auth)
+            # Set up API access
+            self._auth = tweepy.OAuthHandler(kwargs['consumer_key'], kwargs['consumer_secret'])
+            self._auth.set_access_token(kwargs['access_token'],kwargs['access_secret'])
+            self._api = tweepy.API(self._auth)
 
         # Make row dictionaries and count tweets
         rows = []
         num_tweets = 0
-        pbar1 = tqdm.tqdm(range(0,len(source)))
-        pbar1.set_description('Extracting user data...')
-        for u in source:
-            r = self._make_user_dict(u)
-            num_tweets = num_tweets + min(r['statuses_count'], 3200)
-            rows.append(r)
-            pbar1.update(1)
+        with self.metrics.stage('twitter_users', total=len(source), description='Extracting user data...') as stage:
+            for u in source:
+                r = self._make_user_dict(u)
+                num_tweets = num_tweets + min(r['statuses_count'], 3200)
+                rows.append(r)
+                stage.add(calls=1)
+                stage.update(1)
 
         if extract_tweets is True:
             # Extract tweets
-            pbar2 = tqdm.tqdm(range(0,num_tweets))
-            for r in rows:
-                if r['statuses_count'] > 0:
-                    r['tweets'] = self._get_user_tweets(r['screen_name'])
-                else:
-                    r['tweets'] = []
-                pbar2.set_description('Extracted tweets by {}'.format(r['screen_name']))
-                pbar2.update(r['statuses_count'])
+            with self.metrics.stage('twitter_tweets', total=num_tweets, description='Extracting tweets...') as stage:
+                for r in rows:
+                    if r['statuses_count'] > 0:
+                        r['tweets'] = self._get_user_tweets(r['screen_name'], stage=stage)
+                    else:
+                        r['tweets'] = []
+                    stage.update(len(r['tweets']))
 
-        self._data = pd.DataFrame.from_records(rows)
+        return rows
 
     def users(self, drop_collections = True):
         """
@@ -99,14 +159,14 @@ class TwitterExtractor(BaseExtractor):
 
         :param bool drop_collections: Defaults to True. Indicates whether columns with lists/dicts/sets will be dropped.
 
-        :return: pandas.DataFrame
+        :return: pandas.DataFrame (or pyarrow.Table or polars.DataFrame, depending on the backend)
         """
         base_df = self._data
         if drop_collections is True:
             out_df = self._drop_collections(base_df)
         else:
             out_df = base_df
-        return out_df
+        return self._output(out_df)
 
     def tweets(self):
         """
@@ -116,7 +176,28 @@ class TwitterExtractor(BaseExtractor):
 
             drop_collections is not available for this method, since there are no meaningful collections to keep.
 
-        :return: pandas.DataFrame
+        :return: pandas.DataFrame (or pyarrow.Table or polars.DataFrame, depending on the backend)
+        """
+        if self.backend != 'pandas':
+            return convert(self._get_tweets_table(), self.backend)
+        # The cached table is shared with search, so callers get their own copy
+        return self._get_tweets_table().copy()
+
+    def _get_tweets_table(self):
+        """
+        Returns the tweets table, building it if it has not been built yet.
+
+        :return: pandas.DataFrame, or pyarrow.Table if the backend is not pandas
+        """
+        if self._tweets_table is None:
+            self._tweets_table = self._tweets_df() if self.backend == 'pandas' else self._arrow_tweets()
+        return self._tweets_table
+
+    def _tweets_drop_columns(self):
+        """
+        Returns the user columns left out of the tweets table.
+
+        :return: list
         """
 
         # I've hard coded these. Seemed like a good idea at the time...
@@ -142,12 +223,82 @@ class TwitterExtractor(BaseExtractor):
                         'utc_offset', 'tweets/created', 'tweets/retweet',
                         'tweets/rt author', 'tweets/text']
 
-        drop_columns = list(set(all_columns).difference(set(keep_columns)))
+        return list(set(all_columns).difference(set(keep_columns)))
 
-        base_df = self.expand_on('id', 'tweets', rename1='id', rename2='tweet_id', drop=drop_columns)
+    def _tweets_df(self):
+        """
+        Builds the tweets table.
+
+        :return: pandas.DataFrame
+        """
+        base_df = self.expand_on('id', 'tweets', rename1='id', rename2='tweet_id', drop=self._tweets_drop_columns())
 
         return self._drop_collections(base_df)
 
+    def _arrow_tweets(self):
+        """
+        Builds the tweets table from the Arrow conversion of the data, with the columns of ``_tweets_df``.
+
+        :return: pyarrow.Table
+        """
+        drop_columns = set(self._tweets_drop_columns())
+        table = drop_collections(explode(self._to_arrow(self._data[[c for c in self._data.columns if c not in drop_columns]]),
+                                         'tweets', 'tweet_id'))
+        # User columns come first, then the tweet id and tweet data, as in expand_on
+        tweet_columns = [c for c in table.column_names if c.startswith('tweets/')]
+        user_columns = [c for c in table.column_names if c != 'tweet_id' and c not in tweet_columns]
+        return table.select(user_columns + ['tweet_id'] + tweet_columns)
+
+    def _tweet_texts(self):
+        """
+        Returns the text of each tweet, in the row order of ``tweets``.
+
+        :return: list
+        """
+        if 'tweets' not in self._data.columns:
+            raise ValueError('Tweets were not extracted (extract_tweets=False), so they cannot be indexed.')
+        texts = []
+        # Rows are expanded as in expand_on: one per tweet, or one for a user without a collection of tweets
+        for tweets in self._data['tweets']:
+            if isinstance(tweets, dict):
+                texts.extend(t.get('text') if isinstance(t, dict) else None for t in tweets.values())
+            elif hasattr(tweets, '__iter__') and type(tweets) != str:
+                texts.extend(None for t in tweets)
+            else:
+                texts.append(None)
+        return texts
+
+    def _get_text_index(self):
+        """
+        Returns the full-text index of tweet texts, building it if it was not built during extraction.
+
+        :return: TextIndex
+        """
+        if self._text_index is None:
+            self._text_index = TextIndex.build(self._tweet_texts(), metrics=self.metrics)
+        return self._text_index
+
+    def text_index(self):
+        """
+        Returns the full-text index of tweet texts. Its row ids are positions in ``tweets``.
+
+        :return: TextIndex
+        """
+        return self._get_text_index()
+
+    def search(self, query):
+        """
+        Returns the tweets whose text contains every word and "quoted phrase" of a query, ignoring case
+        and punctuation. For example, ``tx.search('"open source" python')``.
+
+        :param str query: Words and double quoted phrases.
+        :return: pandas.DataFrame (or pyarrow.Table or polars.DataFrame, depending on the backend)
+        """
+        rows = self._get_text_index().search(query)
+        if self.backend != 'pandas':
+            return convert(self._get_tweets_table().take(rows), self.backend)
+        return self._get_tweets_table().iloc[rows]
+
     def _handle_object(self, name, obj):
         """
         Process an object using twitter_object_handlers_lookup.
@@ -190,7 +341,14 @@ class TwitterExtractor(BaseExtractor):
         user = self._api.get_user(username)
         return self._make_object_dict(user)
 
-    def _get_user_tweets(self, screen_name):
+    def _get_user_tweets(self, screen_name, stage=None):
+        """
+        Downloads a user's recent tweets, and marks retweets.
+
+        :param str screen_name: A Twitter username string.
+        :param stage: Optional metrics Stage, which counts API calls.
+        :return: A dictionary mapping tweet ids to dictionaries of tweet data.
+        """
 
         # TODO: Implement tweet limit
 
@@ -201,6 +359,8 @@ class TwitterExtractor(BaseExtractor):
 
         # make initial request for most recent tweets (200 is the maximum allowed count)
         new_tweets = self._api.user_timeline(screen_name = screen_name,count=200)
+        if stage is not None:
+            stage.add(calls=1)
 
         # save most recent tweets
         alltweets.extend(new_tweets)
@@ -213,6 +373,8 @@ class TwitterExtractor(BaseExtractor):
 
             # all subsequent requests use the max_id param to prevent duplicates
             new_tweets = self._api.user_timeline(screen_name = screen_name,count=200,max_id=oldest)
+            if stage is not None:
+                stage.add(calls=1)
 
             # save most recent tweets
             alltweets.extend(new_tweets)
@@ -223,6 +385,10 @@ class TwitterExtractor(BaseExtractor):
         # transform the tweepy tweets into a 2D array that will populate the csv
         outtweets = {tweet.id_str: {'created':tweet.created_at,'text':tweet.text} for tweet in alltweets}
 
+        # nltk is imported here, since it is slow to import
+        import nltk
+        from nltk.tokenize import TweetTokenizer
+
         # Twitter-aware tokenizer
         tknzr = TweetTokenizer()
 